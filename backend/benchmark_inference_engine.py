@@ -0,0 +1,95 @@
+"""
+Embedding throughput in-process vs on the inference engine's worker processes
+
+Crops the enrolment faces under uploads/ (using the boxes saved at upload) and
+embeds them repeatedly from several request threads at once, first in this process
+and then on engines with increasing worker counts.
+
+Usage (from backend/):
+    python benchmark_inference_engine.py [--workers 1 2 4 8 16 32] [--faces 512] [--clients 8]
+"""
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import model_registry
+from face_embedding import align_face, embed_faces, load_face_box
+from inference_engine import InferenceEngine
+
+UPLOAD_FOLDER = 'uploads'
+
+
+def load_crops():
+    crops = []
+    for folder in sorted(os.listdir(UPLOAD_FOLDER)):
+        folder_path = os.path.join(UPLOAD_FOLDER, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for file_name in sorted(os.listdir(folder_path)):
+            image_path = os.path.join(folder_path, file_name)
+            box = load_face_box(image_path)
+            img = cv2.imread(image_path) if file_name.endswith(".jpg") else None
+            if img is None:
+                continue
+            if box is None:
+                faces = model_registry.detect_faces(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), 1.3, 5)
+                if len(faces) != 1:
+                    continue
+                box = tuple(int(v) for v in faces[0])
+            crops.append(align_face(img, box))
+    return crops
+
+
+def run(embed, requests, clients):
+    """
+    Faces per second when `clients` threads each embed their share of the requests
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(embed, requests))
+    seconds = time.perf_counter() - start
+    return sum(len(r) for r in results) / seconds, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--faces", type=int, default=512, help="faces embedded per run")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent callers (request threads)")
+    parser.add_argument("--request-size", type=int, default=32, help="faces per call, like one group photo")
+    args = parser.parse_args()
+
+    crops = load_crops()
+    if not crops:
+        raise SystemExit(f"No enrolment faces found under {UPLOAD_FOLDER}/")
+    faces = [crops[i % len(crops)] for i in range(args.faces)]
+    requests = [faces[i:i + args.request_size] for i in range(0, len(faces), args.request_size)]
+    print(f"{len(faces)} faces from {len(crops)} crops, {len(requests)} calls, {args.clients} clients, "
+          f"{os.cpu_count()} cores")
+
+    model_registry.initialize()
+    run(embed_faces, requests[:1], 1)
+    baseline, expected = run(embed_faces, requests, args.clients)
+    print(f"{'engine':<14}{'faces/s':>10}{'speed-up':>10}{'max diff':>10}")
+    print(f"{'in-process':<14}{baseline:>10.1f}{1.0:>10.1f}{0.0:>10.1e}")
+
+    for workers in args.workers:
+        engine = InferenceEngine(workers).start()
+        try:
+            # Wait until every worker has loaded its models
+            while engine.status()["workers_ready"] < workers:
+                if engine.status()["workers_alive"] < workers:
+                    raise SystemExit("An inference worker exited while loading its models")
+                time.sleep(0.1)
+            run(engine.embed_faces, requests[:workers], workers)
+            throughput, results = run(engine.embed_faces, requests, args.clients)
+            diff = max(float(np.abs(a - b).max()) for a, b in zip(results, expected))
+            print(f"{f'{workers} workers':<14}{throughput:>10.1f}{throughput / baseline:>10.1f}{diff:>10.1e}")
+        finally:
+            engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import json
+import struct
+import numpy as np
+
+# Binary embedding format: a fixed 64-byte little-endian header followed by
+# count x dim float32 values, row-major. The header holds:
+#   magic (4s) b"FEMB", version (H), flags (H), dim (I), count (I), model name (32s)
+# and is zero-padded to 64 bytes so the vectors start on an aligned offset.
+MAGIC = b"FEMB"
+VERSION = 1
+HEADER_FORMAT = "<4sHHII32s"
+HEADER_SIZE = 64
+FLAG_NORMALIZED = 0x1
+
+EMBEDDING_FILE = "embeddings.femb"
+GALLERY_FILE = "gallery.femb"
+
+
+def pack_header(model_name, dim, count, normalized=False):
+    """
+    Builds the fixed-size header for count vectors of the given dimension
+    """
+    flags = FLAG_NORMALIZED if normalized else 0
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, flags, dim, count,
+                         model_name.encode("ascii")[:32])
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def unpack_header(buffer):
+    """
+    Parses and validates a header
+    Returns: dict with model, dim, count and normalized
+    """
+    magic, version, flags, dim, count, model = struct.unpack_from(HEADER_FORMAT, buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not an embedding file (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported embedding format version {version}")
+    return {
+        "model": model.rstrip(b"\0").decode("ascii"),
+        "dim": dim,
+        "count": count,
+        "normalized": bool(flags & FLAG_NORMALIZED)
+    }
+
+
+def pack_embeddings(vectors, model_name="Facenet", normalized=False):
+    """
+    Serialises an N x D matrix into header + float32 bytes
+    """
+    vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype="<f4")
+    return pack_header(model_name, vectors.shape[1], vectors.shape[0], normalized) + vectors.tobytes()
+
+
+def unpack_embeddings(buffer):
+    """
+    Zero-copy view of the vectors in a packed buffer (bytes, bson Binary, mmap, ...)
+    Returns: (header, read-only count x dim float32 array)
+    """
+    header = unpack_header(buffer)
+    vectors = np.frombuffer(buffer, dtype="<f4", count=header["count"] * header["dim"], offset=HEADER_SIZE)
+    return header, vectors.reshape(header["count"], header["dim"])
+
+
+def write_embedding_file(path, vectors, model_name="Facenet", normalized=False):
+    """
+    Writes an embedding file atomically (temp file, then rename)
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(pack_embeddings(vectors, model_name, normalized))
+    os.replace(temp_path, path)
+
+
+def read_embedding_file(path):
+    """
+    Memory-maps an embedding file read-only; pages are loaded only when touched
+    Returns: (header, count x dim float32 memmap)
+    """
+    with open(path, "rb") as f:
+        header = unpack_header(f.read(HEADER_SIZE))
+    if header["count"] == 0:
+        return header, np.zeros((0, header["dim"]), dtype=np.float32)
+    vectors = np.memmap(path, dtype="<f4", mode="r", offset=HEADER_SIZE,
+                        shape=(header["count"], header["dim"]))
+    return header, vectors
+
+
+def write_gallery_file(path, matrix, metadata, model_name="Facenet", normalized=True):
+    """
+    Writes a whole gallery atomically: the packed vectors followed by a JSON trailer
+    (student IDs per row, student info, ...). Readers that map the old file keep a
+    valid view; new readers see the new file once the rename lands.
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(pack_embeddings(matrix, model_name, normalized))
+        f.write(json.dumps(metadata).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def read_gallery_file(path):
+    """
+    Maps a gallery file read-only, so every process shares the same page cache
+    Returns: (header, count x dim float32 memmap, metadata dict)
+    """
+    # Header, trailer and mapping all come from one open file, so a concurrent
+    # rename cannot pair one version's vectors with another version's metadata
+    with open(path, "rb") as f:
+        header = unpack_header(f.read(HEADER_SIZE))
+        f.seek(HEADER_SIZE + header["count"] * header["dim"] * 4)
+        metadata = json.loads(f.read().decode("utf-8"))
+
+        if header["count"] == 0:
+            return header, np.zeros((0, header["dim"]), dtype=np.float32), metadata
+        vectors = np.memmap(f, dtype="<f4", mode="r", offset=HEADER_SIZE,
+                            shape=(header["count"], header["dim"]))
+    return header, vectors, metadata
@@ -0,0 +1,132 @@
+import os
+import json
+import cv2
+import numpy as np
+import model_registry
+
+# Enrolment embeds the five registration crops in one FaceNet forward pass instead of
+# five DeepFace.represent calls that each re-ran detection on the full photo. Crops use
+# the layout DeepFace.extract_faces returns (RGB float in [0, 1]) and get the same
+# preprocessing DeepFace.represent applies before its forward pass.
+INPUT_SIZE = (160, 160)  # FaceNet
+BATCH_SIZE = 32
+
+# _eye_angle is deliberately identical to FaceDetectionService.eye_angle in
+# backend_2/services/face_detection.py, and align_face crops the same face as
+# FaceDetectors.align_faces in backend_2/services/face_detectors.py does for one
+# box; each backend is deployed on its own, so keep them in sync.
+
+
+def _eye_angle(face):
+    """
+    Angle in degrees that levels the two most prominent eyes in a BGR face crop,
+    or 0 when two plausible eyes are not found
+    """
+    gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+
+    # Eyes sit in the upper half of the face; this also keeps nostrils out
+    eyes = model_registry.detect_eyes(gray[:gray.shape[0] // 2])
+    if len(eyes) < 2:
+        return 0
+
+    eyes = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+    (x1, y1), (x2, y2) = sorted((ex + ew / 2, ey + eh / 2) for ex, ey, ew, eh in eyes)
+    angle = np.degrees(np.arctan2(y2 - y1, x2 - x1))
+
+    # Two detections this far from level are not a pair of eyes
+    return float(angle) if abs(angle) <= 45 else 0
+
+
+def align_face(img, box):
+    """
+    Crops a detected face and rotates it so the eyes are level
+    img: BGR image array, box: (x, y, w, h) from the Haar cascade
+    Returns: face crop as RGB float32 in [0, 1]
+    """
+    x, y, w, h = box
+    img_h, img_w = img.shape[:2]
+
+    # Rotate a padded region rather than the whole photo, so the corners of the
+    # rotated crop still hold image content
+    pad = max(w, h) // 2
+    left, top = max(0, x - pad), max(0, y - pad)
+    right, bottom = min(img_w, x + w + pad), min(img_h, y + h + pad)
+    region = img[top:bottom, left:right]
+    fx, fy = x - left, y - top
+
+    angle = _eye_angle(region[fy:fy + h, fx:fx + w])
+    if angle:
+        rotation = cv2.getRotationMatrix2D((fx + w / 2, fy + h / 2), angle, 1.0)
+        region = cv2.warpAffine(region, rotation, (region.shape[1], region.shape[0]))
+
+    face = region[fy:fy + h, fx:fx + w]
+    return face[:, :, ::-1].astype(np.float32) / 255.0
+
+
+def preprocess_face(face, target_size=INPUT_SIZE):
+    """
+    Prepares one RGB [0, 1] face crop exactly as DeepFace.represent does:
+    BGR, aspect-preserving resize, centred on a black border, float32 in [0, 1]
+    """
+    img = face[:, :, ::-1]
+
+    factor = min(target_size[0] / img.shape[0], target_size[1] / img.shape[1])
+    img = cv2.resize(img, (int(img.shape[1] * factor), int(img.shape[0] * factor)))
+
+    diff_0 = target_size[0] - img.shape[0]
+    diff_1 = target_size[1] - img.shape[1]
+    img = np.pad(img, ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)),
+                 "constant")
+    if img.shape[0:2] != tuple(target_size):
+        img = cv2.resize(img, (target_size[1], target_size[0]))
+
+    img = np.asarray(img, dtype=np.float32)
+    if img.max() > 1:
+        img = img / 255.0
+    return img
+
+
+def embed_faces(faces, batch_size=BATCH_SIZE):
+    """
+    Embeds face crops with one FaceNet forward pass per batch
+    Returns: len(faces) x D float32 matrix
+    """
+    embeddings = []
+    for start in range(0, len(faces), batch_size):
+        batch = np.stack([preprocess_face(face) for face in faces[start:start + batch_size]])
+        embeddings.append(forward(batch))
+    return np.vstack(embeddings)
+
+
+def forward(batch):
+    """
+    One FaceNet forward pass over a batch of preprocessed faces (N x 160 x 160 x 3)
+    Returns: N x D float32 matrix
+    """
+    model = model_registry.get_facenet()
+    # Newer DeepFace versions wrap the Keras model in a client object
+    keras_model = getattr(model, "model", model)
+    return np.asarray(keras_model(batch, training=False), dtype=np.float32)
+
+
+def face_box_path(image_path):
+    """
+    Sidecar file holding the face box found when an enrolment image was uploaded
+    """
+    return os.path.splitext(image_path)[0] + ".json"
+
+
+def save_face_box(image_path, box):
+    with open(face_box_path(image_path), "w") as f:
+        json.dump({"box": [int(v) for v in box]}, f)
+
+
+def load_face_box(image_path):
+    """
+    The face box saved for an uploaded image, or None if there is none
+    """
+    try:
+        with open(face_box_path(image_path), "r") as f:
+            return tuple(json.load(f)["box"])
+    except (OSError, ValueError, KeyError):
+        return None
@@ -0,0 +1,387 @@
+import os
+import json
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from embedding_store import EMBEDDING_FILE, GALLERY_FILE, read_embedding_file, read_gallery_file, write_gallery_file
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+EMBEDDING_DIM = 128
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy is optional; fall back to the NumPy solver below
+    linear_sum_assignment = None
+
+# _FORBIDDEN_COST and _min_cost_assignment are deliberately identical to the copy
+# in backend_2/services/matching_service.py; each backend is deployed on its own,
+# so keep both in sync.
+# Finite stand-in for "forbidden" pairs so the solvers never see inf
+_FORBIDDEN_COST = 1e6
+
+
+def _min_cost_assignment(cost):
+    """
+    Hungarian algorithm (shortest augmenting paths) for an n x m cost matrix with n <= m
+
+    The inner relaxation runs over all columns at once, so a 150 x 350 problem
+    takes 150 augmentations of vectorised NumPy work.
+
+    Returns:
+        (row_indices, col_indices) of the optimal assignment
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    col_owner = np.zeros(m + 1, dtype=np.int64)  # 1-based row owning each column, 0 = free
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for row in range(1, n + 1):
+        col_owner[0] = row
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+
+        while True:
+            used[j0] = True
+            i0 = col_owner[j0]
+            reduced = np.r_[np.inf, cost[i0 - 1] - u[i0] - v[1:]]
+
+            improve = ~used & (reduced < minv)
+            minv[improve] = reduced[improve]
+            way[improve] = j0
+
+            candidates = np.where(used, np.inf, minv)
+            j1 = int(np.argmin(candidates))
+            delta = candidates[j1]
+
+            u[col_owner[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+
+            j0 = j1
+            if col_owner[j0] == 0:
+                break
+
+        # Flip the augmenting path
+        while j0:
+            j1 = way[j0]
+            col_owner[j0] = col_owner[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(col_owner[1:])
+    rows = col_owner[1:][cols] - 1
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def load_embedding_vectors(embedding_path):
+    """
+    Loads the 128-d vectors stored in a legacy (pickled) embedding_i.npy file
+    Returns: list of float32 numpy arrays
+    """
+    data = np.load(embedding_path, allow_pickle=True)
+    vectors = []
+    for item in data.ravel() if data.dtype == object else [data]:
+        if isinstance(item, dict) and 'embedding' in item:
+            vectors.append(np.asarray(item['embedding'], dtype=np.float32))
+        elif not isinstance(item, dict):
+            vectors.append(np.asarray(item, dtype=np.float32).ravel())
+    return vectors
+
+
+def folder_mtime(folder_path):
+    """
+    Latest modification time of a student folder or any file inside it
+    """
+    latest = os.stat(folder_path).st_mtime
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            latest = max(latest, entry.stat().st_mtime)
+    return latest
+
+
+@contextmanager
+def _file_lock(lock_path):
+    """
+    Exclusive lock shared by every worker process, so only one rebuilds the gallery file at a time
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def match_faces_to_gallery(face_vectors, gallery_matrix, gallery_student_ids, threshold):
+    """
+    Matches face embeddings to students using cosine distance, solving the
+    face <-> student assignment jointly (each student matches at most one face)
+    Returns: dict of student_id -> {"distance", "margin"} for matches under threshold,
+             where margin is the runner-up student's distance minus the match distance
+    """
+    if len(face_vectors) == 0 or len(gallery_student_ids) == 0:
+        return {}
+
+    faces = np.asarray(face_vectors, dtype=np.float32)
+    faces = faces / np.maximum(np.linalg.norm(faces, axis=1, keepdims=True), 1e-10)
+
+    # F x N cosine distances from a single matrix multiply (gallery rows are unit length)
+    distances = 1.0 - faces @ gallery_matrix.T
+
+    # Reduce to F x S: each student's closest stored embedding (a student's rows are contiguous)
+    ids = np.asarray(gallery_student_ids)
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    student_ids = ids[starts]
+    student_distances = np.minimum.reduceat(distances, starts, axis=1).astype(np.float64)
+    num_faces, num_students = student_distances.shape
+
+    # Every face may also stay unmatched at a cost equal to the threshold
+    cost = np.full((num_faces, num_students + num_faces), _FORBIDDEN_COST)
+    cost[:, :num_students] = np.where(student_distances < threshold, student_distances, _FORBIDDEN_COST)
+    cost[np.arange(num_faces), num_students + np.arange(num_faces)] = threshold
+
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(cost)
+    else:
+        rows, cols = _min_cost_assignment(cost)
+
+    matches = {}
+    for face_idx, student_idx in zip(rows, cols):
+        if student_idx >= num_students or student_distances[face_idx, student_idx] >= threshold:
+            continue
+        distance = float(student_distances[face_idx, student_idx])
+        others = np.delete(student_distances[face_idx], student_idx)
+        matches[str(student_ids[student_idx])] = {
+            "distance": distance,
+            "margin": float(others.min()) - distance if others.size else None
+        }
+    return matches
+
+
+class Gallery:
+    """
+    Process-wide view of every student's stored embeddings.
+
+    All embeddings live in one gallery file (embeddings/gallery.femb): a contiguous
+    float32 (N x 128) matrix of unit-length rows followed by a JSON trailer with the
+    parallel student IDs, student info and the folder mtimes it was built from.
+    Every worker process maps that file read-only, so they share one copy in the
+    page cache and recognition never reads the embeddings folders.
+
+    Whenever folders change (upload_face, or edits picked up by the watcher), the
+    file is rebuilt under an inter-process lock and atomically replaced; workers
+    notice the new file version and remap it without a restart.
+    """
+
+    def __init__(self, embeddings_folder, gallery_file=None):
+        self.embeddings_folder = embeddings_folder
+        self.gallery_file = gallery_file or os.path.join(embeddings_folder, GALLERY_FILE)
+        self._lock = threading.Lock()
+        self._folders = {}  # folder name -> {"mtime", "student_id", "count"} of the mapped version
+        self._snapshot = (np.zeros((0, EMBEDDING_DIM), dtype=np.float32), np.array([], dtype=str), {})
+        self._version = None
+        self._watcher = None
+
+    def snapshot(self):
+        """
+        Returns: (gallery_matrix, gallery_student_ids, student_db) from one consistent version
+        """
+        return self._snapshot
+
+    def __len__(self):
+        return len(self._snapshot[1])
+
+    def _file_version(self):
+        try:
+            stat = os.stat(self.gallery_file)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def remap(self):
+        """
+        Maps the gallery file again if another process replaced it
+        Returns: True if a new version was mapped
+        """
+        version = self._file_version()
+        if version is None or version == self._version:
+            return False
+
+        _, matrix, metadata = read_gallery_file(self.gallery_file)
+        self._folders = metadata.get("folders", {})
+        # Swap in the new version in one assignment so readers never see a partial gallery
+        self._snapshot = (matrix, np.array(metadata["student_ids"], dtype=str), metadata["students"])
+        self._version = version
+        return True
+
+    def _read_folder(self, folder_path):
+        with open(os.path.join(folder_path, "info.json"), "r") as f:
+            student_info = json.load(f)
+        student_id = f"{student_info['name']}_{student_info['roll_no']}"
+
+        embedding_file = os.path.join(folder_path, EMBEDDING_FILE)
+        if os.path.exists(embedding_file):
+            _, matrix = read_embedding_file(embedding_file)
+            vectors = np.array(matrix, dtype=np.float32)
+        else:
+            # Folders written before the binary format existed
+            vectors = []
+            for file_name in sorted(os.listdir(folder_path)):
+                if file_name.startswith("embedding_") and file_name.endswith(".npy"):
+                    vectors.extend(load_embedding_vectors(os.path.join(folder_path, file_name)))
+            vectors = np.array(vectors, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-10)
+        return student_id, student_info, vectors
+
+    def _rebuild(self):
+        """
+        Rebuilds the gallery file from the folders, re-reading only folders whose
+        mtime differs from the mapped version. Caller holds the file lock.
+        Returns: True if a new file was written
+        """
+        matrix, student_ids, student_db = self._snapshot
+        rows = {}
+        if len(student_ids):
+            starts = np.flatnonzero(np.r_[True, student_ids[1:] != student_ids[:-1]])
+            ends = np.r_[starts[1:], len(student_ids)]
+            rows = {str(student_ids[start]): (start, end) for start, end in zip(starts, ends)}
+
+        changed = False
+        folders = {}
+        blocks = []
+        new_student_ids = []
+        new_student_db = {}
+
+        for folder_name in sorted(os.listdir(self.embeddings_folder)):
+            folder_path = os.path.join(self.embeddings_folder, folder_name)
+            if not os.path.isdir(folder_path):
+                continue
+
+            try:
+                mtime = folder_mtime(folder_path)
+                cached = self._folders.get(folder_name)
+                if cached and cached["mtime"] == mtime and cached["student_id"] in rows:
+                    student_id = cached["student_id"]
+                    start, end = rows[student_id]
+                    vectors = np.asarray(matrix[start:end])
+                    student_info = student_db[student_id]
+                elif cached and cached["mtime"] == mtime and cached["count"] == 0:
+                    # Unchanged folder that has no usable embeddings
+                    folders[folder_name] = cached
+                    continue
+                else:
+                    student_id, student_info, vectors = self._read_folder(folder_path)
+                    changed = True
+            except Exception as e:
+                print(f"Error loading student embeddings from {folder_name}: {str(e)}")
+                continue
+
+            folders[folder_name] = {"mtime": mtime, "student_id": student_id, "count": len(vectors)}
+            if len(vectors) == 0 or student_id in new_student_db:
+                continue
+            blocks.append(vectors)
+            new_student_ids.extend([student_id] * len(vectors))
+            new_student_db[student_id] = student_info
+
+        if set(self._folders) - set(folders):
+            changed = True
+        if not changed and self._version is not None:
+            return False
+
+        new_matrix = np.vstack(blocks) if blocks else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        metadata = {"student_ids": new_student_ids, "students": new_student_db, "folders": folders}
+        write_gallery_file(self.gallery_file, new_matrix, metadata, "Facenet", normalized=True)
+        return True
+
+    def refresh(self):
+        """
+        Picks up new, changed and removed student folders, rewriting the shared
+        gallery file if needed, and maps the newest version
+        Returns: True if the gallery changed
+        """
+        with self._lock, _file_lock(self.gallery_file + ".lock"):
+            # Start from the newest version any worker has written
+            remapped = self.remap()
+            written = self._rebuild()
+            if written:
+                self.remap()
+            return remapped or written
+
+    def _replace_folder(self, folder_name):
+        """
+        Rewrites the gallery file with one folder read again and every other
+        student's rows copied from the mapped version. Caller holds the file lock.
+        """
+        folder_path = os.path.join(self.embeddings_folder, folder_name)
+        mtime = folder_mtime(folder_path)
+        student_id, student_info, vectors = self._read_folder(folder_path)
+
+        matrix, student_ids, student_db = self._snapshot
+        keep = student_ids != student_id
+        # The student's rows go last, so every student's rows stay contiguous
+        new_matrix = np.vstack([np.asarray(matrix)[keep], vectors])
+        new_student_ids = [str(sid) for sid in student_ids[keep]] + [student_id] * len(vectors)
+        new_student_db = {sid: info for sid, info in student_db.items() if sid != student_id}
+        if len(vectors):
+            new_student_db[student_id] = student_info
+
+        folders = dict(self._folders)
+        folders[folder_name] = {"mtime": mtime, "student_id": student_id, "count": len(vectors)}
+        metadata = {"student_ids": new_student_ids, "students": new_student_db, "folders": folders}
+        write_gallery_file(self.gallery_file, new_matrix, metadata, "Facenet", normalized=True)
+
+    def refresh_student(self, folder_name):
+        """
+        Publishes one new or rewritten embeddings/<name>_<roll>/ folder, e.g. right
+        after upload_face writes it, without checking the other folders (the watcher does)
+        """
+        try:
+            with self._lock, _file_lock(self.gallery_file + ".lock"):
+                # Start from the newest version any worker has written
+                self.remap()
+                if self._version is None:
+                    # Nothing mapped yet to copy the other students from
+                    self._rebuild()
+                else:
+                    self._replace_folder(folder_name)
+                self.remap()
+        except Exception as e:
+            print(f"Error publishing embeddings for {folder_name}: {str(e)}")
+
+    def load(self):
+        """
+        Maps the gallery file, building it first if it is missing or out of date
+        """
+        self.refresh()
+        print(f"Gallery loaded with {len(self)} embeddings")
+        return self
+
+    def start_watcher(self, interval=5.0):
+        """
+        Polls in a daemon thread: remaps versions written by other workers and
+        publishes folder edits made outside upload_face
+        """
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Gallery refresh error: {str(e)}")
+
+        self._watcher = threading.Thread(target=watch, name="gallery-watcher", daemon=True)
+        self._watcher.start()
@@ -0,0 +1,22 @@
+"""
+gunicorn settings for modified_app with one inference engine per host
+
+Usage (from backend/):
+    gunicorn -c gunicorn.conf.py modified_app:app
+"""
+import os
+
+# Request workers use the engine the master starts in on_starting instead of each
+# starting a pool of their own
+os.environ["INFERENCE_ENGINE_START"] = "hook"
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+
+def on_starting(server):
+    # Started in the master, before any request worker is forked, so every worker
+    # inherits the same engine
+    import inference_engine
+    inference_engine.start()
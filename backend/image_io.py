@@ -0,0 +1,54 @@
+import threading
+import cv2
+import numpy as np
+
+# Uploads are decoded straight from the request bytes and the arrays are handed to
+# detection and DeepFace directly. These counters record the temp-file traffic that
+# no longer happens: every avoided file would have been written once and read back once.
+_metrics_lock = threading.Lock()
+_avoided = {}
+
+
+def decode_image(data):
+    """
+    Decodes an encoded image (JPEG, PNG, ...) from memory
+    Returns: BGR uint8 array, or None if the bytes are not a readable image
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def load_image(image):
+    """
+    Accepts either an already-decoded BGR array or a path on disk
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    return cv2.imread(image)
+
+
+def record_avoided_io(source, written=0, read=0):
+    """
+    Counts one temp file that the in-memory pipeline did not write and/or read back
+    source: what the file would have held ("group_upload", "face_crop", ...)
+    """
+    with _metrics_lock:
+        counters = _avoided.setdefault(source, {"files": 0, "bytes_written": 0, "bytes_read": 0})
+        counters["files"] += 1
+        counters["bytes_written"] += int(written)
+        counters["bytes_read"] += int(read)
+
+
+def avoided_io_snapshot():
+    """
+    Disk I/O avoided since the process started, per source and in total
+    """
+    with _metrics_lock:
+        by_source = {source: dict(counters) for source, counters in _avoided.items()}
+    return {
+        "files": sum(c["files"] for c in by_source.values()),
+        "bytes": sum(c["bytes_written"] + c["bytes_read"] for c in by_source.values()),
+        "by_source": by_source
+    }
@@ -0,0 +1,386 @@
+import os
+import time
+import queue
+import atexit
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from face_embedding import INPUT_SIZE, preprocess_face, embed_faces as embed_in_process
+from gallery import EMBEDDING_DIM
+
+# FaceNet on a pool of long-lived worker processes, so embedding throughput scales
+# with cores instead of being held by the GIL and TensorFlow's per-process state.
+# Each worker loads the models once and runs single-threaded TensorFlow; requests
+# reach it through shared-memory slots (preprocessed faces in, embeddings out), so
+# only a slot number crosses the process boundary, never a pickled image.
+#
+# Every piece of slot state lives in shared memory or multiprocessing primitives, so
+# an engine started in a server's master process (see gunicorn.conf.py) is inherited
+# by the forked request workers and one pool serves the whole host.
+THREADS_PER_WORKER = int(os.environ.get("INFERENCE_THREADS_PER_WORKER", 1))
+# Every worker holds its own TensorFlow runtime and FaceNet, about 0.8-1 GB resident,
+# so the default stays small whatever the core count; raise it only with the RAM to match
+MAX_DEFAULT_WORKERS = 4
+WORKERS = int(os.environ.get(
+    "INFERENCE_WORKERS",
+    min(MAX_DEFAULT_WORKERS, max(1, (os.cpu_count() or 1) // THREADS_PER_WORKER))
+))  # 0 embeds in-process
+SLOT_FACES = 8  # Faces per slot, i.e. per forward pass in a worker
+SLOTS_PER_WORKER = 2  # Lets a worker pick up its next batch while the last one is collected
+JOB_TIMEOUT = 120  # Seconds one embed_faces call may wait for slots and batches in total
+WATCH_INTERVAL = 1.0  # Seconds between checks that every worker process is still alive
+# "app": the process importing the app starts the engine (flask run, a single process);
+# "hook": only the gunicorn master starts it and request workers inherit it
+START_MODE = os.environ.get("INFERENCE_ENGINE_START", "app")
+
+# Per-slot outcome of the batch it holds
+_PENDING, _DONE, _FAILED = 0, 1, 2
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def _limit_threads(threads):
+    """
+    Caps TensorFlow's thread pools in a worker before its runtime starts, so the
+    workers together use one thread per core instead of each claiming every core
+    """
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+
+
+def _alive(process):
+    """
+    Process.is_alive, also for a worker already reaped by someone else, as gunicorn's
+    arbiter does with every child of the master
+    """
+    if not process.is_alive():
+        return False
+    try:
+        os.kill(process.pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def _worker_main(index, input_name, output_name, slots, threads, tasks, results, generations, slot_lock):
+    """
+    Worker process: load the models, then embed whichever slot each task names
+
+    A task carries the generation its slot had when it was queued. The parent bumps
+    the generation when it gives up on a job, so a late or cancelled job never writes
+    over the slot's next occupant.
+    """
+    _limit_threads(threads)
+    import model_registry
+    from face_embedding import forward
+
+    input_shm = shared_memory.SharedMemory(name=input_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    inputs = np.ndarray((slots, SLOT_FACES) + INPUT_SIZE + (3,), dtype=np.float32, buffer=input_shm.buf)
+    outputs = np.ndarray((slots, SLOT_FACES, EMBEDDING_DIM), dtype=np.float32, buffer=output_shm.buf)
+
+    model_registry.initialize()
+    results.put(("ready", index, model_registry.status().get("error")))
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            slot, count, generation = task
+            if generations[slot] != generation:
+                continue  # Cancelled while it waited in the queue
+            results.put(("started", index, slot, generation, None))
+            try:
+                embeddings = forward(inputs[slot, :count])
+                with slot_lock:
+                    if generations[slot] == generation:
+                        outputs[slot, :count] = embeddings
+                results.put(("done", index, slot, generation, None))
+            except Exception as e:
+                results.put(("done", index, slot, generation, str(e)))
+    finally:
+        del inputs, outputs
+        input_shm.close()
+        output_shm.close()
+
+
+class InferenceEngine:
+    """
+    Pool of worker processes that turn face crops into FaceNet embeddings
+
+    embed_faces() may be called from many request threads, and from processes forked
+    after start(), at once. A caller waits for a free slot before writing a batch
+    (backpressure when every slot is busy), then on that slot's semaphore, which the
+    collector thread of the starting process releases when the batch is done. A call
+    that runs out of time cancels its batches and reclaims their slots, and a worker
+    that dies is restarted, failing the batch it was running, so lost work never
+    holds a slot.
+    """
+
+    def __init__(self, workers=WORKERS, threads_per_worker=THREADS_PER_WORKER):
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker
+        self.slots = self.workers * SLOTS_PER_WORKER
+        self._processes = []
+        self._running = {}  # worker index -> (slot, generation) of the batch it is running
+        self._errors = []
+        self._closing = False
+        self._last_check = 0.0
+
+    def start(self):
+        """
+        Allocate the shared slots and start the workers; returns at once, the
+        workers load their models in the background
+        """
+        input_bytes = self.slots * SLOT_FACES * INPUT_SIZE[0] * INPUT_SIZE[1] * 3 * 4
+        output_bytes = self.slots * SLOT_FACES * EMBEDDING_DIM * 4
+        self._input_shm = shared_memory.SharedMemory(create=True, size=input_bytes)
+        self._output_shm = shared_memory.SharedMemory(create=True, size=output_bytes)
+        self._inputs = np.ndarray((self.slots, SLOT_FACES) + INPUT_SIZE + (3,), dtype=np.float32,
+                                  buffer=self._input_shm.buf)
+        self._outputs = np.ndarray((self.slots, SLOT_FACES, EMBEDDING_DIM), dtype=np.float32,
+                                   buffer=self._output_shm.buf)
+
+        # Fresh interpreters: forking a process that has already started TensorFlow's
+        # thread pools is unsafe
+        self._context = multiprocessing.get_context("spawn")
+        self._owner = os.getpid()
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        self._slot_lock = self._context.Lock()
+        self._generations = self._context.Array("q", self.slots, lock=False)
+        self._busy = self._context.Array("b", self.slots, lock=False)
+        self._outcomes = self._context.Array("b", self.slots, lock=False)
+        self._free_slots = self._context.Semaphore(self.slots)
+        self._slot_done = [self._context.Semaphore(0) for _ in range(self.slots)]
+        # Shared so /health reads the same numbers in every process using the engine
+        self._ready = self._context.Array("b", self.workers, lock=False)
+        self._counters = self._context.Array("q", 5, lock=False)  # batches, faces, timeouts, restarts, load errors
+        self._processes = [self._spawn(index) for index in range(self.workers)]
+
+        threading.Thread(target=self._collect, name="inference-collector", daemon=True).start()
+        return self
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self._input_shm.name, self._output_shm.name, self.slots, self.threads_per_worker,
+                  self._tasks, self._results, self._generations, self._slot_lock),
+            name=f"inference-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def _count(self, counter, amount=1):
+        with self._slot_lock:
+            self._counters[counter] += amount
+
+    def _collect(self):
+        """Runs in the starting process: signals finished slots and watches the workers"""
+        while True:
+            try:
+                message = self._results.get(timeout=WATCH_INTERVAL)
+            except queue.Empty:
+                message = ()
+            if message is None:
+                break
+            if message:
+                kind, index, *details = message
+                if kind == "ready":
+                    self._ready[index] = 1
+                    if details[0]:
+                        self._errors.append(details[0])
+                        self._count(4)
+                elif kind == "started":
+                    self._running[index] = tuple(details[:2])
+                else:
+                    slot, generation, error = details
+                    self._running.pop(index, None)
+                    if error:
+                        print(f"Inference worker {index} failed a batch: {error}")
+                    self._finish(slot, generation, _FAILED if error else _DONE)
+            if time.monotonic() - self._last_check >= WATCH_INTERVAL:
+                self._last_check = time.monotonic()
+                self._check_workers()
+
+    def _finish(self, slot, generation, outcome):
+        """Wake the caller waiting on a slot, unless it already gave up on that batch"""
+        with self._slot_lock:
+            if self._generations[slot] != generation:
+                return
+            self._outcomes[slot] = outcome
+            self._slot_done[slot].release()
+
+    def _acquire_slot(self, deadline, block=True):
+        """
+        Take a free slot; returns (slot, generation), or None if block is False and
+        every slot is taken
+        """
+        if not block:
+            if not self._free_slots.acquire(block=False):
+                return None
+        elif not self._free_slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise TimeoutError(f"No free inference slot within {JOB_TIMEOUT}s")
+        with self._slot_lock:
+            slot = next(slot for slot in range(self.slots) if not self._busy[slot])
+            self._busy[slot] = 1
+            self._outcomes[slot] = _PENDING
+            return slot, self._generations[slot]
+
+    def _release_slot(self, slot, cancel=False):
+        """
+        Return a slot to the pool. Cancelling bumps its generation first, so the worker
+        (if any) does not write to it later and the collector does not signal it.
+        """
+        with self._slot_lock:
+            if cancel:
+                self._generations[slot] += 1
+                # The batch may have finished just before the bump
+                self._slot_done[slot].acquire(block=False)
+            self._busy[slot] = 0
+        self._free_slots.release()
+
+    def _check_workers(self):
+        """Restart workers that have died, failing the batches they were running"""
+        for index, process in enumerate(self._processes):
+            if _alive(process) or self._closing:
+                continue
+            self._ready[index] = 0
+            self._count(3)
+            print(f"Inference worker {index} exited (code {process.exitcode}); restarting it")
+            lost = self._running.pop(index, None)
+            if lost is not None:
+                self._finish(*lost, _FAILED)
+            self._processes[index] = self._spawn(index)
+
+    def _submit(self, slot, generation, batch):
+        """Write one preprocessed batch into a slot this call holds and queue it"""
+        self._inputs[slot, :len(batch)] = batch
+        self._tasks.put((slot, len(batch), generation))
+        self._count(0)
+        self._count(1, len(batch))
+
+    def _result(self, slot, count, deadline):
+        """Wait for one batch and copy its embeddings out; the slot is returned to the pool"""
+        if not self._slot_done[slot].acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._release_slot(slot, cancel=True)
+            raise TimeoutError(f"Inference did not finish within {JOB_TIMEOUT}s")
+        if self._outcomes[slot] != _DONE:
+            self._release_slot(slot)
+            raise RuntimeError("Inference worker failed the batch; see the server log")
+        embeddings = self._outputs[slot, :count].copy()
+        self._release_slot(slot)
+        return embeddings
+
+    def embed_faces(self, faces):
+        """
+        Embeds face crops (RGB float32 in [0, 1], as align_face and
+        DeepFace.extract_faces return them) across the workers. The whole call,
+        waiting for slots included, is bounded by one JOB_TIMEOUT deadline.
+        Returns: len(faces) x D float32 matrix
+        """
+        if len(faces) == 0:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+        deadline = time.monotonic() + JOB_TIMEOUT
+        jobs = []  # (slot, count) of this call's batches not yet collected, oldest first
+        embeddings = []
+        try:
+            for start in range(0, len(faces), SLOT_FACES):
+                batch = np.stack([preprocess_face(face) for face in faces[start:start + SLOT_FACES]])
+                # Slots are freed by their callers, so with every slot taken this call
+                # collects its own oldest batch rather than wait on slots it holds
+                acquired = self._acquire_slot(deadline, block=not jobs)
+                while acquired is None:
+                    slot, count = jobs.pop(0)
+                    embeddings.append(self._result(slot, count, deadline))
+                    acquired = self._acquire_slot(deadline, block=not jobs)
+                self._submit(*acquired, batch)
+                jobs.append((acquired[0], len(batch)))
+            while jobs:
+                slot, count = jobs.pop(0)
+                embeddings.append(self._result(slot, count, deadline))
+            return np.vstack(embeddings)
+        except TimeoutError:
+            self._count(2)
+            raise
+        finally:
+            # Batches still outstanding after a failure would otherwise hold their slots
+            for slot, _ in jobs:
+                self._release_slot(slot, cancel=True)
+
+    def status(self):
+        """
+        Worker details for the /health endpoint
+        """
+        with self._slot_lock:
+            batches, faces, timeouts, restarts, load_errors = self._counters[:]
+        status = {
+            "workers": self.workers,
+            "workers_ready": sum(self._ready[:]),
+            "threads_per_worker": self.threads_per_worker,
+            "batches": batches,
+            "faces": faces,
+            "timeouts": timeouts,
+            "restarts": restarts,
+            "load_errors": load_errors
+        }
+        # Only the starting process holds the worker handles and their messages
+        if os.getpid() == self._owner:
+            status["workers_alive"] = sum(_alive(process) for process in self._processes)
+            status["errors"] = list(self._errors)
+        return status
+
+    def close(self):
+        if os.getpid() != self._owner:
+            return  # A forked request worker exiting; the pool belongs to the master
+        self._closing = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+        self._results.put(None)
+        del self._inputs, self._outputs
+        self._input_shm.close()
+        self._input_shm.unlink()
+        self._output_shm.close()
+        self._output_shm.unlink()
+
+
+def start(workers=WORKERS):
+    """
+    Starts the process-wide engine (once); with workers=0 embedding stays in-process.
+    Processes forked afterwards share it, so a server starts it once per host, before
+    forking its request workers
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None and workers > 0:
+            _engine = InferenceEngine(workers).start()
+            # Stop the workers and release the shared memory when the server exits
+            atexit.register(_engine.close)
+        return _engine
+
+
+def embed_faces(faces):
+    """
+    Embeds face crops on the worker pool, or in this process if no engine was started
+    Returns: len(faces) x D float32 matrix
+    """
+    if _engine is None:
+        return embed_in_process(faces)
+    return _engine.embed_faces(faces)
+
+
+def status():
+    if _engine is None:
+        return {"workers": 0}
+    return _engine.status()
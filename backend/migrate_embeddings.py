@@ -0,0 +1,76 @@
+"""
+Converts the embeddings/ tree from pickled embedding_i.npy files to one
+embeddings.femb file per student (see embedding_store.py)
+
+Usage:
+    python migrate_embeddings.py [--embeddings-folder embeddings] [--delete-legacy] [--dry-run]
+"""
+import os
+import argparse
+import numpy as np
+from embedding_store import EMBEDDING_FILE, write_embedding_file, read_embedding_file
+from gallery import load_embedding_vectors
+
+
+def migrate_student_folder(folder_path, delete_legacy=False, dry_run=False):
+    """
+    Converts one embeddings/<name>_<roll>/ folder
+    Returns: number of vectors written (0 if there was nothing to convert)
+    """
+    legacy_files = sorted(
+        file_name for file_name in os.listdir(folder_path)
+        if file_name.startswith("embedding_") and file_name.endswith(".npy")
+    )
+    if not legacy_files:
+        return 0
+
+    vectors = []
+    for file_name in legacy_files:
+        vectors.extend(load_embedding_vectors(os.path.join(folder_path, file_name)))
+    if not vectors:
+        return 0
+
+    if dry_run:
+        return len(vectors)
+
+    matrix = np.vstack(vectors).astype(np.float32)
+    embedding_path = os.path.join(folder_path, EMBEDDING_FILE)
+    write_embedding_file(embedding_path, matrix, "Facenet")
+
+    # Check the round trip before touching the originals
+    _, stored = read_embedding_file(embedding_path)
+    if not np.array_equal(np.asarray(stored), matrix):
+        raise ValueError(f"Round-trip mismatch in {embedding_path}")
+
+    if delete_legacy:
+        for file_name in legacy_files:
+            os.remove(os.path.join(folder_path, file_name))
+    return len(vectors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings-folder", default="embeddings")
+    parser.add_argument("--delete-legacy", action="store_true", help="remove embedding_i.npy files after converting")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be converted without writing")
+    args = parser.parse_args()
+
+    converted = 0
+    for student_folder in sorted(os.listdir(args.embeddings_folder)):
+        folder_path = os.path.join(args.embeddings_folder, student_folder)
+        if not os.path.isdir(folder_path):
+            continue
+        try:
+            count = migrate_student_folder(folder_path, args.delete_legacy, args.dry_run)
+        except Exception as e:
+            print(f"Error migrating {student_folder}: {str(e)}")
+            continue
+        if count:
+            converted += 1
+            print(f"{student_folder}: {count} vectors")
+
+    print(f"{'Would convert' if args.dry_run else 'Converted'} {converted} student folders")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import threading
+import time
+import cv2
+import numpy as np
+from deepface import DeepFace
+
+FACE_MODEL = "Facenet"
+
+# Shared model state for the whole process. DeepFace keeps the models it has built
+# in its own cache, so building FaceNet here and running one warm-up inference
+# means no request pays the model-load cost.
+_lock = threading.Lock()
+_cascade_lock = threading.Lock()
+_face_cascade = None
+_eye_cascade = None
+_facenet = None
+_state = "not_started"  # not_started -> loading -> ready | failed
+_error = None
+_timings = {}
+
+
+def _load_cascade(file_name='haarcascade_frontalface_default.xml'):
+    return cv2.CascadeClassifier(cv2.data.haarcascades + file_name)
+
+
+def _load():
+    global _face_cascade, _eye_cascade, _facenet, _state, _error
+    try:
+        start = time.time()
+        _face_cascade = _load_cascade()
+        _eye_cascade = _load_cascade('haarcascade_eye.xml')
+        _timings['face_cascade'] = round(time.time() - start, 3)
+
+        start = time.time()
+        _facenet = DeepFace.build_model(FACE_MODEL)
+        _timings['facenet_load'] = round(time.time() - start, 3)
+
+        # One inference through each path so graph building and detector setup happen now
+        start = time.time()
+        blank = np.zeros((160, 160, 3), dtype=np.uint8)
+        DeepFace.represent(img_path=blank, model_name=FACE_MODEL,
+                           detector_backend="skip", enforce_detection=False)
+        DeepFace.extract_faces(img_path=blank, detector_backend="opencv", enforce_detection=False)
+        _timings['warm_up'] = round(time.time() - start, 3)
+
+        _state = "ready"
+        print(f"Models ready: {_timings}")
+    except Exception as e:
+        _state = "failed"
+        _error = str(e)
+        print(f"Model warm-up failed: {str(e)}")
+
+
+def initialize(background=False):
+    """
+    Loads and warms up every model once per process
+    background: run in a daemon thread so the app can serve /health straight away
+    """
+    global _state
+    with _lock:
+        if _state in ("loading", "ready"):
+            return
+        _state = "loading"
+
+    if background:
+        threading.Thread(target=_load, name="model-warmup", daemon=True).start()
+    else:
+        _load()
+
+
+def is_ready():
+    return _state == "ready"
+
+
+def status():
+    """
+    Readiness details for the /health endpoint
+    """
+    details = {"state": _state, "face_model": FACE_MODEL, "load_seconds": dict(_timings)}
+    if _error:
+        details["error"] = _error
+    return details
+
+
+def get_facenet():
+    """
+    The shared FaceNet model (built on first use if initialize() was not called)
+    """
+    global _facenet
+    if _facenet is None:
+        _facenet = DeepFace.build_model(FACE_MODEL)
+    return _facenet
+
+
+def detect_faces(gray, scale_factor=1.3, min_neighbors=5):
+    """
+    Runs the shared Haar cascade on a grayscale image. A CascadeClassifier is not
+    safe to use from several threads at once, so calls are serialised.
+    """
+    global _face_cascade
+    with _cascade_lock:
+        if _face_cascade is None:
+            _face_cascade = _load_cascade()
+        return _face_cascade.detectMultiScale(gray, scale_factor, min_neighbors)
+
+
+def detect_eyes(gray, scale_factor=1.1, min_neighbors=10):
+    """
+    Runs the shared eye cascade on a grayscale face crop (serialised like detect_faces)
+    """
+    global _eye_cascade
+    with _cascade_lock:
+        if _eye_cascade is None:
+            _eye_cascade = _load_cascade('haarcascade_eye.xml')
+        return _eye_cascade.detectMultiScale(gray, scale_factor, min_neighbors)
@@ -8,7 +8,14 @@ import uuid
 import shutil
 import json
 import time
+import multiprocessing
 from concurrent.futures import ThreadPoolExecutor
+from gallery import Gallery, match_faces_to_gallery
+from embedding_store import EMBEDDING_FILE, write_embedding_file
+from face_embedding import align_face, save_face_box, load_face_box
+from image_io import decode_image, load_image, record_avoided_io, avoided_io_snapshot
+import model_registry
+import inference_engine
 
 app = Flask(__name__)
 CORS(app)
@@ -16,55 +23,93 @@ CORS(app)
 UPLOAD_FOLDER = 'uploads'
 EMBEDDINGS_FOLDER = 'embeddings'
 CONFIDENCE_THRESHOLD = 0.45  # Adjusted threshold for face matching
-MAX_WORKERS = 4  # For parallel processing
+MAX_WORKERS = 4  # Threads extracting faces from student images on the verify path
+VERIFY_THRESHOLD = 0.40  # DeepFace.verify's cosine threshold for Facenet
 
 # Create folders if they don't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(EMBEDDINGS_FOLDER, exist_ok=True)
 
-# Pre-load face detection model
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# Load every stored embedding once; recognition requests read only this in-memory copy
+gallery = Gallery(EMBEDDINGS_FOLDER)
 
-def detect_face(image_path):
+# Inference workers are spawned processes that import this module again; only the
+# server processes load the gallery and models
+if multiprocessing.parent_process() is None:
+    gallery.load()
+    gallery.start_watcher()
+    
+    # Load and warm up the face models once; /health reports when they are ready
+    model_registry.initialize(background=True)
+    
+    # FaceNet runs on one pool of worker processes per host (INFERENCE_WORKERS; see
+    # inference_engine for the default). Under gunicorn the master starts it
+    # (gunicorn.conf.py) and every request worker uses that pool
+    if inference_engine.START_MODE == "app":
+        inference_engine.start()
+
+def locate_face(image):
     """
     Detects if there's exactly one face in the image with good conditions
-    Returns: (success, message)
+    image: decoded BGR array or a path on disk
+    Returns: (success, message, box) where box is the face's (x, y, w, h) or None
     """
     try:
-        img = cv2.imread(image_path)
+        img = load_image(image)
         if img is None:
-            return False, "Failed to read image"
+            return False, "Failed to read image", None
         
         # Convert to grayscale for face detection
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
-        # Use pre-loaded haar cascade for faster face detection
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+        # Use the shared, pre-loaded haar cascade for faster face detection
+        faces = model_registry.detect_faces(gray, 1.3, 5)
         
         if len(faces) == 0:
-            return False, "No face detected"
+            return False, "No face detected", None
         if len(faces) > 1:
-            return False, "Multiple faces detected"
+            return False, "Multiple faces detected", None
         
         # Check image brightness
         brightness = np.mean(gray)
         if brightness < 50:
-            return False, "Poor lighting conditions"
+            return False, "Poor lighting conditions", None
             
-        return True, "Face detected successfully"
+        x, y, w, h = (int(v) for v in faces[0])
+        return True, "Face detected successfully", (x, y, w, h)
     except Exception as e:
-        return False, f"Error: {str(e)}"
+        return False, f"Error: {str(e)}", None
 
-def create_embedding(image_path):
+def create_enrolment_embeddings(image_paths):
     """
-    Creates facial embedding using FaceNet
+    Crops the face in each enrolment image once, reusing the box found at upload,
+    and embeds all of them in one batched forward pass
+    Returns: N x 128 float32 matrix, or None if any image has no usable face
     """
-    try:
-        embedding = DeepFace.represent(img_path=image_path, model_name="Facenet", enforce_detection=False)
-        return embedding
-    except Exception as e:
-        print(f"Error creating embedding: {str(e)}")
-        return None
+    faces = []
+    for image_path in image_paths:
+        img = cv2.imread(image_path)
+        if img is None:
+            return None
+        box = load_face_box(image_path)
+        if box is None:
+            found, _, box = locate_face(img)
+            if not found:
+                return None
+        faces.append(align_face(img, box))
+    return inference_engine.embed_faces(faces)
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    ready = model_registry.is_ready()
+    return jsonify({
+        "status": "healthy" if ready else "starting",
+        "ready": ready,
+        "models": model_registry.status(),
+        "gallery_embeddings": len(gallery),
+        "inference_engine": inference_engine.status(),
+        "disk_io_avoided": avoided_io_snapshot()
+    }), 200 if ready else 503
 
 @app.route('/api/upload-face', methods=['POST'])
 def upload_face():
@@ -84,28 +129,32 @@ def upload_face():
     user_folder = os.path.join(UPLOAD_FOLDER, f"{name}_{roll_no}")
     os.makedirs(user_folder, exist_ok=True)
     
-    # Save the image
-    image_path = os.path.join(user_folder, f"image_{image_index}.jpg")
-    image.save(image_path)
+    # Validate the decoded upload before anything touches the disk
+    image_bytes = image.read()
+    img = decode_image(image_bytes)
+    if img is None:
+        return jsonify({"success": False, "message": "Failed to read image"}), 400
     
     # Detect face
-    is_valid, message = detect_face(image_path)
+    is_valid, message, face_box = locate_face(img)
+    # Only valid images are written now, and the check no longer reads the file back
+    record_avoided_io("upload_check", written=0 if is_valid else len(image_bytes), read=len(image_bytes))
     if not is_valid:
-        os.remove(image_path)  # Remove invalid image
         return jsonify({"success": False, "message": message}), 400
     
+    # Keep the original bytes; the five images are embedded together once index 4 arrives
+    image_path = os.path.join(user_folder, f"image_{image_index}.jpg")
+    with open(image_path, "wb") as f:
+        f.write(image_bytes)
+    save_face_box(image_path, face_box)
+    
     # If this is the last image (index 4), create embeddings for all images
     if image_index == 4:
-        user_embeddings = []
-        
-        for i in range(5):
-            img_path = os.path.join(user_folder, f"image_{i}.jpg")
-            embedding = create_embedding(img_path)
-            if embedding:
-                user_embeddings.append(embedding)
+        image_paths = [os.path.join(user_folder, f"image_{i}.jpg") for i in range(5)]
+        vectors = create_enrolment_embeddings(image_paths)
         
         # Save embeddings
-        if len(user_embeddings) == 5:
+        if vectors is not None and len(vectors) == 5:
             embedding_folder = os.path.join(EMBEDDINGS_FOLDER, f"{name}_{roll_no}")
             os.makedirs(embedding_folder, exist_ok=True)
             
@@ -119,10 +168,11 @@ def upload_face():
             with open(os.path.join(embedding_folder, "info.json"), "w") as f:
                 json.dump(student_info, f)
             
-            # Save each embedding
-            for i, emb in enumerate(user_embeddings):
-                embedding_path = os.path.join(embedding_folder, f"embedding_{i}.npy")
-                np.save(embedding_path, np.array(emb))
+            # Save all five vectors as one float32 embedding file
+            write_embedding_file(os.path.join(embedding_folder, EMBEDDING_FILE), vectors, "Facenet")
+            
+            # Make the new student recognizable without waiting for the watcher
+            gallery.refresh_student(f"{name}_{roll_no}")
             
             return jsonify({
                 "success": True, 
@@ -139,26 +189,57 @@ def upload_face():
         "message": f"Image {image_index+1} uploaded and validated successfully"
     })
 
-def verify_face(args):
+def extract_student_faces(student_img_path):
     """
-    Worker function for parallel verification
+    Faces in one enrolment image, detected and aligned as DeepFace.verify does
+    (the whole image stands in when no face is found)
     """
-    group_image_path, student_img_path, student_info = args
     try:
-        verification = DeepFace.verify(
-            img1_path=group_image_path,
-            img2_path=student_img_path,
-            model_name="Facenet",
-            distance_metric="cosine",
+        return [face_obj['face'] for face_obj in DeepFace.extract_faces(
+            img_path=student_img_path,
             detector_backend="opencv",
             enforce_detection=False
-        )
-        
-        if verification.get('verified', False):
-            return student_info
-        return None
+        )]
     except Exception:
-        return None
+        return []
+
+def recognize_group_by_embeddings(group_image):
+    """
+    Embeds every face in the group photo once and matches it against the in-memory gallery
+    group_image: decoded BGR array (or a path on disk)
+    Returns: (recognized_students, faces_detected)
+    """
+    gallery_matrix, gallery_student_ids, student_db = gallery.snapshot()
+    
+    # Detection stays here; the crops are embedded on the inference workers. Faces are
+    # cropped and aligned by align_face, as at enrolment, so gallery and probe
+    # embeddings come from the same pipeline
+    img = load_image(group_image)
+    face_objs = DeepFace.extract_faces(
+        img_path=img,
+        detector_backend="opencv",
+        enforce_detection=True,
+        align=False
+    )
+    print(f"Detected {len(face_objs)} faces in the group photo")
+    
+    boxes = [tuple(int(face_obj['facial_area'][k]) for k in ('x', 'y', 'w', 'h'))
+             for face_obj in face_objs]
+    face_vectors = inference_engine.embed_faces([align_face(img, box) for box in boxes])
+    matches = match_faces_to_gallery(face_vectors, gallery_matrix, gallery_student_ids,
+                                     CONFIDENCE_THRESHOLD)
+    
+    recognized_students = []
+    for student_id, match in sorted(matches.items(), key=lambda item: item[1]['distance']):
+        student_info = student_db.get(student_id, {})
+        recognized_students.append({
+            'name': student_info.get('name'),
+            'roll_no': student_info.get('roll_no'),
+            'class': student_info.get('class'),
+            'distance': round(match['distance'], 4),
+            'margin': round(match['margin'], 4) if match['margin'] is not None else None
+        })
+    return recognized_students, len(face_objs)
 
 @app.route('/api/recognize-group', methods=['POST'])
 def recognize_group():
@@ -168,10 +249,40 @@ def recognize_group():
         return jsonify({"success": False, "message": "No image provided"}), 400
     
     image = request.files['image']
+    # "embedding" matches against the in-memory gallery; "verify" keeps the parallel DeepFace.verify path
+    mode = request.form.get('mode', 'embedding')
+    
+    image_bytes = image.read()
     
-    # Save the group image temporarily
+    if mode == 'embedding':
+        # Decode once in memory; detection and embedding both work on this array
+        group_image = decode_image(image_bytes)
+        if group_image is None:
+            return jsonify({"success": False, "message": "Failed to read image"}), 400
+        record_avoided_io("group_upload", written=len(image_bytes), read=len(image_bytes))
+        
+        try:
+            recognized_students, face_count = recognize_group_by_embeddings(group_image)
+            end_time = time.time()
+            print(f"Recognition completed in {end_time - start_time:.2f} seconds")
+            
+            return jsonify({
+                "success": True,
+                "recognized_students": recognized_students,
+                "faces_detected": face_count,
+                "processing_time_seconds": round(end_time - start_time, 2)
+            })
+        except Exception as e:
+            print(f"Recognition process error: {str(e)}")
+            return jsonify({
+                "success": False,
+                "message": f"Recognition error: {str(e)}"
+            }), 500
+    
+    # The legacy verify path hands file paths to DeepFace.verify
     group_image_path = os.path.join(UPLOAD_FOLDER, f"group_{uuid.uuid4()}.jpg")
-    image.save(group_image_path)
+    with open(group_image_path, "wb") as f:
+        f.write(image_bytes)
     
     try:
         # Extract faces from the group photo first to validate face count
@@ -221,7 +332,7 @@ def recognize_group():
                     print(f"Error loading student info: {str(e)}")
                     continue
         
-        # Approach 1: Using parallel verification with a fixed maximum output
+        # Approach 1: verify every (group photo, student image) pair with a fixed maximum output
         recognized_students = []
         verification_tasks = []
         
@@ -229,11 +340,28 @@ def recognize_group():
         for student_info in all_students:
             for img_path in student_info.get('images', []):
                 if os.path.exists(img_path):
-                    verification_tasks.append((group_image_path, img_path, student_info))
+                    verification_tasks.append((img_path, student_info))
         
-        # Process tasks in parallel
+        # Detection is mostly OpenCV, which releases the GIL, so threads suffice here
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            results = list(executor.map(verify_face, verification_tasks))
+            student_faces = list(executor.map(extract_student_faces, [task[0] for task in verification_tasks]))
+        
+        # Every group and student face goes to the inference workers in one call,
+        # instead of DeepFace.verify embedding the group photo again for each pair
+        group_faces = [face_obj['face'] for face_obj in detected_faces]
+        all_faces = group_faces + [face for faces in student_faces for face in faces]
+        vectors = inference_engine.embed_faces(all_faces)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        group_vectors = vectors[:len(group_faces)]
+        
+        # A pair verifies as in DeepFace.verify: the closest pair of faces is within the threshold
+        results = []
+        offset = len(group_faces)
+        for (img_path, student_info), faces in zip(verification_tasks, student_faces):
+            student_vectors = vectors[offset:offset + len(faces)]
+            offset += len(faces)
+            verified = len(faces) > 0 and (1 - group_vectors @ student_vectors.T).min() <= VERIFY_THRESHOLD
+            results.append(student_info if verified else None)
         
         # Process results
         student_matches = {}
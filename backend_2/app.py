@@ -9,11 +9,20 @@ from config import mongo_client
 # Import controllers
 from controllers.student_controller import register_student_routes
 from controllers.recognition_controller import register_recognition_routes
+from services.model_registry import ModelRegistry
+from services.job_queue import JobQueue
+from utils.io_metrics import DiskIOMetrics
 
 # Create Flask app
 app = Flask(__name__)
 CORS(app)
 
+# Load and warm up the face models once; /health reports when they are ready
+ModelRegistry.initialize(background=True)
+
+# Start the recognition job workers; jobs queued before a restart resume here
+JobQueue.shared()
+
 # Register routes
 register_student_routes(app)
 register_recognition_routes(app)
@@ -21,11 +30,16 @@ register_recognition_routes(app)
 # Simple health check route
 @app.route('/health', methods=['GET'])
 def health_check():
+    ready = ModelRegistry.is_ready()
     return {
-        "status": "healthy",
+        "status": "healthy" if ready else "starting",
+        "ready": ready,
+        "models": ModelRegistry.status(),
         "timestamp": datetime.now().isoformat(),
-        "version": "1.0.0"
-    }
+        "version": "1.0.0",
+        "disk_io_avoided": DiskIOMetrics.snapshot(),
+        "recognition_jobs": JobQueue.shared().stats()
+    }, 200 if ready else 503
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Speed and face counts of the group photo detectors
+
+Runs every detector over the photos of a folder and reports, per photo, the faces
+each one found, then per detector:
+  - median detection time per photo
+  - alignment time per face (FaceDetectors.align_faces)
+  - faces found in total, and how many of the tiled Haar detector's faces it also
+    found (IoU >= 0.3), as a rough agreement measure when no labels exist
+
+YuNet runs at each --yunet-sizes input size. It needs YUNET_MODEL_PATH (see config.py).
+
+Usage (from backend_2/):
+    python benchmarks/benchmark_detectors.py [--photos uploads/group_photos] [--yunet-sizes 640 1280 1920]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.face_detectors import FaceDetectors, HaarTiledDetector, DeepFaceOpenCVDetector, YuNetDetector
+from utils.image_utils import load_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Intersection over union of every (x, y, w, h) box in a with every box in b"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 0] + a[:, None, 2], b[None, :, 0] + b[None, :, 2])
+    y2 = np.minimum(a[:, None, 1] + a[:, None, 3], b[None, :, 1] + b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def time_detector(detector, photos, repeats):
+    """
+    Detections, median seconds per photo and alignment seconds of one detector
+    """
+    detections, seconds, align_seconds = [], [], 0.0
+    for img in photos:
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            faces = detector.detect(img)
+            times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        FaceDetectors.align_faces(img, faces)
+        align_seconds += time.perf_counter() - start
+        detections.append(faces)
+        seconds.append(float(np.median(times)))
+    return detections, seconds, align_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", default=os.path.join("uploads", "group_photos"))
+    parser.add_argument("--yunet-sizes", type=int, nargs="+", default=[640, 1280, 1920])
+    parser.add_argument("--repeats", type=int, default=3, help="timed detections per photo")
+    args = parser.parse_args()
+
+    names = sorted(f for f in os.listdir(args.photos) if f.lower().endswith(IMAGE_EXTENSIONS))
+    photos = [img for img in (load_image(os.path.join(args.photos, name)) for name in names) if img is not None]
+    if not photos:
+        raise SystemExit(f"No photos found in {args.photos}")
+    print(f"{len(photos)} photos, {os.cpu_count()} cores")
+
+    detectors = [("tiled", HaarTiledDetector()), ("deepface", DeepFaceOpenCVDetector())]
+    detectors += [(f"yunet@{size}", YuNetDetector(input_size=size)) for size in args.yunet_sizes]
+
+    results = {}
+    for label, detector in detectors:
+        try:
+            # First call loads models and starts thread pools
+            detector.detect(photos[0])
+        except Exception as e:
+            print(f"{label}: {str(e)}")
+            continue
+        results[label] = time_detector(detector, photos, args.repeats)
+
+    labels = list(results)
+    print(f"\n{'photo':<12}{'pixels':>10}" + "".join(f"{label:>12}" for label in labels))
+    for i, img in enumerate(photos):
+        counts = "".join(f"{len(results[label][0][i]):>12}" for label in labels)
+        print(f"{i:<12}{f'{img.shape[1]}x{img.shape[0]}':>10}{counts}")
+
+    baseline = results.get("tiled")
+    print(f"\n{'detector':<14}{'ms/photo':>10}{'align ms/face':>15}{'faces':>8}{'tiled found':>13}")
+    for label in labels:
+        detections, seconds, align_seconds = results[label]
+        total = sum(len(faces) for faces in detections)
+        agreed = ""
+        if baseline:
+            found = reference = 0
+            for faces, reference_faces in zip(detections, baseline[0]):
+                reference += len(reference_faces)
+                if faces and reference_faces:
+                    overlaps = iou_matrix([f.box for f in reference_faces], [f.box for f in faces])
+                    found += int(np.sum(overlaps.max(axis=1) >= 0.3))
+            agreed = f"{found}/{reference}"
+        per_face = align_seconds * 1000 / total if total else 0.0
+        print(f"{label:<14}{np.median(seconds) * 1000:>10.1f}{per_face:>15.2f}{total:>8}{agreed:>13}")
+
+
+if __name__ == "__main__":
+    main()
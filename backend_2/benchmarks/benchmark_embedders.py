@@ -0,0 +1,119 @@
+"""
+Load time, memory and latency of the FaceNet backends
+
+Runs every variant in a fresh child process, so the load time and resident memory
+of one are not hidden by models already loaded for another, and reports:
+  - seconds to build the model
+  - resident memory before and after loading it
+  - per-face latency for single faces (an upload) and for batches (a group photo)
+
+Export the ONNX variants first with scripts/export_onnx.py --int8.
+
+Usage (from backend_2/):
+    python benchmarks/benchmark_embedders.py [--batch-size 32] [--repeats 20] [--threads N]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+VARIANTS = [
+    ("Facenet", "tensorflow"),
+    ("Facenet-onnx", "onnxruntime"),
+    ("Facenet-onnx", "opencv"),
+    ("Facenet-onnx-int8", "onnxruntime"),
+]
+
+
+def rss_mb():
+    """Resident memory of this process in MB (Linux)"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def median_seconds(model, batch, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        np.asarray(model(batch, training=False))
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def child(model_name, runtime, batch_size, repeats, threads):
+    """Measures one variant in this process and prints the result as JSON"""
+    baseline_rss = rss_mb()
+    start = time.perf_counter()
+    if runtime == "tensorflow":
+        from deepface import DeepFace
+        from services.model_registry import ModelRegistry
+        ModelRegistry.configure_threads(threads)
+        client = DeepFace.build_model(model_name)
+        # Called directly, as BatchEmbedder does
+        model = getattr(client, "model", client)
+    else:
+        # Only the runtime itself: the point is what a server pays without TensorFlow
+        from services.onnx_embedder import OnnxFaceNet
+        model = OnnxFaceNet(OnnxFaceNet.model_path(model_name), runtime=runtime, threads=threads)
+    load_seconds = time.perf_counter() - start
+    loaded_rss = rss_mb()
+
+    rng = np.random.default_rng(0)
+    single = rng.random((1, 160, 160, 3), dtype=np.float32)
+    batch = rng.random((batch_size, 160, 160, 3), dtype=np.float32)
+    # First calls build graphs and allocate buffers
+    model(single, training=False)
+    model(batch, training=False)
+
+    print(json.dumps({
+        "load_seconds": load_seconds,
+        "rss_before_mb": baseline_rss,
+        "rss_after_mb": loaded_rss,
+        "peak_rss_mb": rss_mb(),
+        "single_ms": median_seconds(model, single, repeats) * 1000,
+        "batch_ms_per_face": median_seconds(model, batch, max(1, repeats // 4)) * 1000 / batch_size
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads (default: all cores)")
+    parser.add_argument("--child", nargs=2, metavar=("MODEL", "RUNTIME"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], args.batch_size, args.repeats, args.threads)
+        return
+
+    print(f"{os.cpu_count()} cores, batch of {args.batch_size}")
+    print(f"{'model':<20}{'runtime':<13}{'load s':>8}{'RSS MB':>9}{'1 face ms':>11}{'batch ms/face':>15}")
+    for model_name, runtime in VARIANTS:
+        command = [sys.executable, os.path.abspath(__file__), "--child", model_name, runtime,
+                   "--batch-size", str(args.batch_size), "--repeats", str(args.repeats)]
+        if args.threads:
+            command += ["--threads", str(args.threads)]
+        result = subprocess.run(command, capture_output=True, text=True)
+        lines = result.stdout.strip().splitlines()
+        if result.returncode != 0 or not lines:
+            error = (result.stderr.strip().splitlines() or ["failed"])[-1]
+            print(f"{model_name:<20}{runtime:<13}{error}")
+            continue
+
+        stats = json.loads(lines[-1])
+        print(f"{model_name:<20}{runtime:<13}{stats['load_seconds']:>8.2f}"
+              f"{stats['peak_rss_mb'] - stats['rss_before_mb']:>9.0f}"
+              f"{stats['single_ms']:>11.1f}{stats['batch_ms_per_face']:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Recall vs latency of the approximate gallery index against the exact path
+
+Builds a synthetic FaceNet-like gallery (several noisy embeddings per student
+around a per-student centre), then queries it with fresh noisy faces.
+
+Usage (from backend_2/):
+    python benchmarks/benchmark_gallery_index.py --students 20000 --faces 60
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.gallery_index import ExactIndex, IVFIndex
+
+
+def make_gallery(num_students, per_student, dim, noise, rng):
+    centres = rng.normal(size=(num_students, dim)).astype(np.float32)
+    vectors = np.repeat(centres, per_student, axis=0)
+    vectors += noise * rng.normal(size=vectors.shape).astype(np.float32) * np.linalg.norm(centres[0]) / np.sqrt(dim)
+    student_ids = np.repeat(np.arange(num_students).astype(str), per_student)
+    return centres, vectors, student_ids
+
+
+def best_students(index, queries, k):
+    student_ids, distances = index.student_distance_matrix(queries, k)
+    return np.asarray(student_ids)[np.argmin(distances, axis=1)]
+
+
+def time_queries(index, queries, k, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        best = best_students(index, queries, k)
+    return (time.perf_counter() - start) / repeats, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--per-student", type=int, default=5)
+    parser.add_argument("--faces", type=int, default=60, help="faces per simulated group photo")
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--noise", type=float, default=0.6, help="within-student spread relative to centre norm")
+    parser.add_argument("--k", type=int, default=20, help="neighbours fetched per face")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centres, vectors, student_ids = make_gallery(args.students, args.per_student, args.dim, args.noise, rng)
+
+    truth = rng.choice(args.students, args.faces, replace=False)
+    queries = centres[truth] + args.noise * rng.normal(size=(args.faces, args.dim)).astype(np.float32) \
+        * np.linalg.norm(centres[0]) / np.sqrt(args.dim)
+
+    exact = ExactIndex(args.dim)
+    exact.add(vectors, student_ids)
+    exact_time, exact_best = time_queries(exact, queries, args.k, args.repeats)
+
+    start = time.perf_counter()
+    ivf = IVFIndex(args.dim)
+    ivf.add(vectors, student_ids)
+    build_time = time.perf_counter() - start
+
+    print(f"Gallery: {args.students} students x {args.per_student} = {len(vectors)} embeddings, "
+          f"{args.faces} faces per query batch")
+    print(f"IVF build: {build_time:.2f}s with {len(ivf.centroids)} buckets")
+    print(f"Exact accuracy vs ground truth: {np.mean(exact_best == truth.astype(str)):.3f}")
+    print()
+    print(f"{'index':<14}{'ms / batch':>12}{'ms / face':>12}{'recall@1':>12}{'speed-up':>10}")
+    print(f"{'exact':<14}{exact_time * 1000:>12.2f}{exact_time * 1000 / args.faces:>12.3f}{1.0:>12.3f}{1.0:>10.1f}")
+
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        ivf_time, ivf_best = time_queries(ivf, queries, args.k, args.repeats)
+        recall = np.mean(ivf_best == exact_best)
+        print(f"{'ivf/' + str(nprobe):<14}{ivf_time * 1000:>12.2f}{ivf_time * 1000 / args.faces:>12.3f}"
+              f"{recall:>12.3f}{exact_time / ivf_time:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
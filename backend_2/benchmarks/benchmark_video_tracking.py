@@ -0,0 +1,68 @@
+"""
+FaceNet work saved by tracking faces across video frames
+
+Runs video attendance over a recorded clip, or over a synthetic camera that pans
+across a still group photo, and compares the face crops actually embedded with
+embedding every detection in every sampled frame.
+
+Usage (from backend_2/):
+    python benchmarks/benchmark_video_tracking.py --photo uploads/group_photos/<photo>.jpg [--frames 60]
+    python benchmarks/benchmark_video_tracking.py --video classroom.mp4 [--sample-fps 2] [--division DIV]
+"""
+import os
+import sys
+import time
+import argparse
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import VIDEO_SAMPLE_FPS, VIDEO_MAX_SECONDS
+from services.batch_embedder import BatchEmbedder
+from services.face_detectors import FaceDetectors
+from services.model_registry import ModelRegistry
+from services.video_attendance import VideoAttendanceService, VideoFrameSource, SyntheticFrameSource
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--video", help="video file or stream URL")
+    source.add_argument("--photo", help="still photo for the synthetic camera")
+    parser.add_argument("--frames", type=int, default=60, help="synthetic frames")
+    parser.add_argument("--sample-fps", type=float, default=VIDEO_SAMPLE_FPS)
+    parser.add_argument("--max-seconds", type=float, default=VIDEO_MAX_SECONDS)
+    parser.add_argument("--division", default=None)
+    args = parser.parse_args()
+
+    if args.video:
+        frames = list(VideoFrameSource(args.video, args.sample_fps, args.max_seconds))
+    else:
+        image = cv2.imread(args.photo)
+        if image is None:
+            sys.exit(f"Could not read {args.photo}")
+        frames = list(SyntheticFrameSource(image, args.frames, args.sample_fps))
+
+    ModelRegistry.initialize()
+
+    start = time.perf_counter()
+    recognized_students, stats = VideoAttendanceService.recognize_stream(frames, args.division)
+    tracked_time = time.perf_counter() - start
+
+    # Baseline: embed every detection of every sampled frame
+    start = time.perf_counter()
+    for _, frame in frames:
+        boxes = VideoAttendanceService.detect_faces(frame)
+        if boxes:
+            BatchEmbedder.embed_faces(FaceDetectors.align_boxes(frame, boxes))
+    naive_time = time.perf_counter() - start
+
+    print(f"{stats['frames']} sampled frames, {stats['detections']} detections, {stats['tracks']} tracks")
+    print(f"{'mode':<12}{'embeddings':>12}{'seconds':>10}")
+    print(f"{'per-frame':<12}{stats['detections']:>12}{naive_time:>10.2f}")
+    print(f"{'tracked':<12}{stats['embeddings']:>12}{tracked_time:>10.2f}")
+    print(f"Recognized {len(recognized_students)} students")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,11 +17,74 @@ EMBEDDINGS_COLLECTION = "embeddings"
 UPLOAD_FOLDER = 'uploads'
 TEMP_GROUP_FOLDER = os.path.join(UPLOAD_FOLDER, 'group_photos')
 
+INDEX_FOLDER = 'indexes'
+ONNX_MODEL_FOLDER = 'onnx_models'  # Exported FaceNet graphs and the YuNet face detector
+JOBS_FOLDER = 'jobs'
+
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(TEMP_GROUP_FOLDER, exist_ok=True)
+os.makedirs(INDEX_FOLDER, exist_ok=True)
+os.makedirs(JOBS_FOLDER, exist_ok=True)
 
 # Face recognition settings
+# "Facenet" runs DeepFace's TensorFlow model; "Facenet-onnx" and "Facenet-onnx-int8" run the
+# FP32 / INT8 graphs exported by scripts/export_onnx.py
 FACE_RECOGNITION_MODEL = "Facenet"
+DEEPFACE_MODEL = FACE_RECOGNITION_MODEL.split("-onnx")[0]  # The DeepFace model behind FACE_RECOGNITION_MODEL
 DISTANCE_METRIC = "cosine"
-RECOGNITION_THRESHOLD = 0.5  # Threshold for face match (lower is more strict)
\ No newline at end of file
+RECOGNITION_THRESHOLD = 0.5  # Threshold for face match (lower is more strict)
+
+# Gallery index used when recognition is not limited to a division
+GALLERY_INDEX_TYPE = "ivf"  # "exact" (brute force) or "ivf" (approximate)
+GALLERY_INDEX_PATH = os.path.join(INDEX_FOLDER, 'gallery_index.npz')
+GALLERY_INDEX_NEIGHBOURS = 20  # Nearest stored embeddings fetched per face before exact re-ranking
+IVF_NLIST = None  # Number of k-means buckets (None: 4 * sqrt(number of embeddings))
+IVF_NPROBE = 16  # Buckets scanned per query
+
+# Per-division gallery cache: seconds between polls when change streams are unavailable
+GALLERY_CACHE_POLL_SECONDS = 30
+
+# Group photo face detection
+GROUP_DETECTOR = "tiled"  # "tiled" (Haar, TiledFaceDetector), "yunet" (OpenCV's YuNet CNN) or "deepface" (DeepFace's opencv backend)
+DETECTION_MAX_SIDE = 3000  # Longest side of the working copy; bounds detection time on 24 MP photos
+DETECTION_TILE_SIZE = 1024  # Square tiles searched at working resolution
+DETECTION_TILE_OVERLAP = 192  # Pixels shared by neighbouring tiles (largest face always whole in a tile)
+DETECTION_WORKERS = 4  # Tiles searched at once
+DETECTION_NMS_IOU = 0.3  # Overlap above which duplicate boxes are merged
+# face_detection_yunet_2023mar.onnx from https://github.com/opencv/opencv_zoo/tree/main/models/face_detection_yunet
+YUNET_MODEL_PATH = os.path.join(ONNX_MODEL_FOLDER, 'face_detection_yunet_2023mar.onnx')
+YUNET_INPUT_SIZE = 1280  # Longest side of the copy YuNet searches; larger finds smaller faces but costs more
+YUNET_SCORE_THRESHOLD = 0.8  # Minimum YuNet face score
+
+# Face embedding inference
+EMBEDDING_BATCH_SIZE = 32  # Face crops per FaceNet forward pass
+INFERENCE_THREADS = None  # TensorFlow / ONNX intra-op CPU threads (None: the runtime's default, all cores)
+ONNX_RUNTIME = "auto"  # "onnxruntime", "opencv" (cv2.dnn, FP32 graph only) or "auto" (onnxruntime when installed)
+
+# Asynchronous recognition jobs (POST /api/recognition-jobs)
+JOBS_DB_PATH = os.path.join(JOBS_FOLDER, 'recognition_jobs.sqlite3')
+JOB_WORKERS = 2  # Jobs processed at once; more only adds contention for the CPU
+JOB_QUEUE_LIMIT = 100  # Waiting jobs before new submissions get 429
+JOB_MAX_ATTEMPTS = 3  # Runs lost to crashes/restarts before a job is marked failed
+JOB_LEASE_SECONDS = 300  # Lease renewed while a job runs; a job whose runner died is run again after it
+JOB_RETENTION_SECONDS = 24 * 60 * 60  # Finished jobs stay queryable this long
+WEBHOOK_TIMEOUT_SECONDS = 5
+WEBHOOK_ALLOWED_HOSTS = []  # Host names webhook_url may point at; empty disables webhooks
+
+# Multi-photo lecture sessions (POST /api/recognize-session)
+SESSION_MAX_PHOTOS = 10  # Photos accepted per session
+SESSION_WORKERS = 4  # Photos whose faces are extracted at once
+SESSION_DUPLICATE_THRESHOLD = 0.3  # Faces in different photos closer than this are one person
+
+# Video / CCTV attendance (POST /api/recognize-video)
+VIDEO_SAMPLE_FPS = 2  # Frames analysed per second of video
+VIDEO_MAX_SECONDS = 300  # Longest stretch of a video or stream analysed per request
+STREAM_ALLOWED_HOSTS = []  # Camera hosts stream_url may point at; empty disables stream URLs
+TRACK_IOU_THRESHOLD = 0.3  # Box overlap needed to continue a face track
+TRACK_MAX_MISSED = 5  # Sampled frames a track may go undetected before it ends
+TRACK_QUALITY_GAIN = 0.2  # Re-embed a track only when its face crop is this much better
+TRACK_MIN_HITS = 2  # Frames a track must appear in to count towards attendance
+
+# Upload checks: longest side of the working copy used for detection and brightness
+QUALITY_MAX_SIDE = 1280
@@ -1,8 +1,13 @@
 import os
+import json
 import uuid
-from flask import request, jsonify
+from flask import request, jsonify, Response
+from config import TEMP_GROUP_FOLDER, VIDEO_SAMPLE_FPS, VIDEO_MAX_SECONDS, SESSION_MAX_PHOTOS
 from services.recognition_service import RecognitionService
-from config import TEMP_GROUP_FOLDER
+from services.job_queue import JobQueue, QueueFullError
+from services.video_attendance import VideoAttendanceService, VideoFrameSource
+from utils.image_utils import decode_image
+from utils.io_metrics import DiskIOMetrics
 
 def register_recognition_routes(app):
     @app.route('/api/recognize-group', methods=['POST'])
@@ -15,15 +20,17 @@ def register_recognition_routes(app):
         
         image = request.files['image']
         
-        # Save the group image temporarily
-        image_filename = f"group_{uuid.uuid4()}.jpg"
-        group_image_path = os.path.join(TEMP_GROUP_FOLDER, image_filename)
-        image.save(group_image_path)
+        # Decode the upload once; detection and embedding all work on this array
+        image_bytes = image.read()
+        group_image = decode_image(image_bytes)
+        if group_image is None:
+            return jsonify({"success": False, "message": "Failed to read image"}), 400
+        DiskIOMetrics.record("group_upload", written=len(image_bytes), read=len(image_bytes))
         
         try:
             # Perform face recognition
             recognized_students = RecognitionService.recognize_faces_in_group(
-                group_image_path, division
+                group_image, division
             )
             
             # Return results
@@ -34,18 +41,179 @@ def register_recognition_routes(app):
             })
         
         except Exception as e:
-            # Clean up in case of error
-            if os.path.exists(group_image_path):
-                os.remove(group_image_path)
+            return jsonify({
+                "success": False,
+                "message": f"Recognition error: {str(e)}"
+            }), 500
+    
+    @app.route('/api/recognize-session', methods=['POST'])
+    def recognize_session():
+        """
+        One attendance result from several overlapping photos ('images') of a lecture;
+        a student seen in more than one photo is counted once
+        """
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({"success": False, "message": "No images provided"}), 400
+        if len(files) > SESSION_MAX_PHOTOS:
+            return jsonify({"success": False, "message": f"At most {SESSION_MAX_PHOTOS} photos per session"}), 400
+        
+        division = request.form.get('division', None)
+        
+        group_images = []
+        for image in files:
+            image_bytes = image.read()
+            group_image = decode_image(image_bytes)
+            if group_image is None:
+                return jsonify({"success": False, "message": f"Failed to read image {image.filename}"}), 400
+            DiskIOMetrics.record("group_upload", written=len(image_bytes), read=len(image_bytes))
+            group_images.append(group_image)
+        
+        try:
+            result = RecognitionService.recognize_session(group_images, division)
             
+            return jsonify({
+                "success": True,
+                **result,
+                "total_recognized": len(result['recognized_students'])
+            })
+        
+        except Exception as e:
             return jsonify({
                 "success": False,
                 "message": f"Recognition error: {str(e)}"
             }), 500
+    
+    @app.route('/api/recognize-group/stream', methods=['POST'])
+    def recognize_group_stream():
+        """
+        Same recognition as /api/recognize-group, streamed as Server-Sent Events:
+        'faces' (detected boxes) as soon as detection finishes, then one 'match' or
+        'no_match' per face, then 'done' with the full sorted list
+        """
+        if 'image' not in request.files:
+            return jsonify({"success": False, "message": "No image provided"}), 400
+        
+        division = request.form.get('division', None)
+        
+        image_bytes = request.files['image'].read()
+        group_image = decode_image(image_bytes)
+        if group_image is None:
+            return jsonify({"success": False, "message": "Failed to read image"}), 400
+        DiskIOMetrics.record("group_upload", written=len(image_bytes), read=len(image_bytes))
+        
+        def sse(event_name, payload):
+            # default=float: distances may still be numpy scalars
+            return f"event: {event_name}\ndata: {json.dumps(payload, default=float)}\n\n"
+        
+        def generate():
+            try:
+                for event in RecognitionService.iter_recognition_events(group_image, division):
+                    yield sse(event['event'], event)
+            except Exception as e:
+                print(f"Recognition error: {str(e)}")
+                yield sse('error', {"event": "error", "message": f"Recognition error: {str(e)}"})
+        
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+        })
+    
+    @app.route('/api/recognition-jobs', methods=['POST'])
+    def submit_recognition_job():
+        """
+        Queue a group photo for recognition and return at once with a job ID;
+        poll GET /api/recognition-jobs/<job_id> or pass webhook_url to be notified
+        """
+        if 'image' not in request.files:
+            return jsonify({"success": False, "message": "No image provided"}), 400
         
+        division = request.form.get('division', None)
+        webhook_url = request.form.get('webhook_url', None)
+        if webhook_url and not JobQueue.shared().webhook_allowed(webhook_url):
+            return jsonify({
+                "success": False,
+                "message": "webhook_url must be an http(s) URL on a host listed in WEBHOOK_ALLOWED_HOSTS"
+            }), 400
+        
+        # Decoded by the worker; an unreadable image shows up as a failed job
+        image_bytes = request.files['image'].read()
+        
+        try:
+            job_id = JobQueue.shared().submit(image_bytes, division, webhook_url)
+        except QueueFullError as e:
+            response = jsonify({"success": False, "message": f"Recognition queue is full ({str(e)})"})
+            response.headers['Retry-After'] = '30'
+            return response, 429
+        
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "status_url": f"/api/recognition-jobs/{job_id}"
+        }), 202
+    
+    @app.route('/api/recognition-jobs/<job_id>', methods=['GET'])
+    def get_recognition_job(job_id):
+        """
+        Status and partial results of a recognition job; pass ?after=<next_event>
+        from the previous response to receive only new events
+        """
+        after = request.args.get('after', 0, type=int)
+        job = JobQueue.shared().get(job_id, max(0, after))
+        if job is None:
+            return jsonify({"success": False, "message": "Job not found"}), 404
+        
+        return jsonify({"success": True, **job})
+    
+    @app.route('/api/recognize-video', methods=['POST'])
+    def recognize_video():
+        """
+        Attendance from a classroom video: either an uploaded file ('video') or a
+        camera stream URL ('stream_url', rtsp(s):// or http(s)://, on a host in
+        STREAM_ALLOWED_HOSTS). Optional form fields: division, sample_fps,
+        max_seconds (capped at VIDEO_MAX_SECONDS)
+        """
+        division = request.form.get('division', None)
+        stream_url = request.form.get('stream_url', None)
+        sample_fps = request.form.get('sample_fps', VIDEO_SAMPLE_FPS, type=float)
+        max_seconds = min(request.form.get('max_seconds', VIDEO_MAX_SECONDS, type=float), VIDEO_MAX_SECONDS)
+        if sample_fps <= 0:
+            return jsonify({"success": False, "message": "sample_fps must be positive"}), 400
+        
+        video_path = None
+        if 'video' in request.files:
+            # OpenCV can only open videos from a path, so this upload does go to disk
+            video_path = os.path.join(TEMP_GROUP_FOLDER, f"video_{uuid.uuid4()}.mp4")
+            request.files['video'].save(video_path)
+            source = video_path
+        elif stream_url:
+            if not VideoFrameSource.url_allowed(stream_url):
+                return jsonify({
+                    "success": False,
+                    "message": "stream_url must be an rtsp(s) or http(s) URL on a host listed in STREAM_ALLOWED_HOSTS"
+                }), 400
+            source = stream_url
+        else:
+            return jsonify({"success": False, "message": "No video or stream_url provided"}), 400
+        
+        try:
+            frames = VideoFrameSource(source, sample_fps, max_seconds)
+            recognized_students, stats = VideoAttendanceService.recognize_stream(frames, division)
+            
+            return jsonify({
+                "success": True,
+                "recognized_students": recognized_students,
+                "total_recognized": len(recognized_students),
+                "stats": stats
+            })
+        
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+        except Exception as e:
+            return jsonify({
+                "success": False,
+                "message": f"Recognition error: {str(e)}"
+            }), 500
         finally:
-            # Optionally, you can choose to keep or delete the group photo here
-            # If you want to delete:
-            # if os.path.exists(group_image_path):
-            #     os.remove(group_image_path)
-            pass
\ No newline at end of file
+            if video_path and os.path.exists(video_path):
+                os.remove(video_path)
@@ -4,6 +4,8 @@ from flask import request, jsonify
 from models.student import Student
 from services.face_detection import FaceDetectionService
 from services.embedding_service import EmbeddingService
+from utils.image_utils import decode_image
+from utils.io_metrics import DiskIOMetrics
 from config import UPLOAD_FOLDER
 
 def register_student_routes(app):
@@ -25,16 +27,25 @@ def register_student_routes(app):
         user_folder = os.path.join(UPLOAD_FOLDER, f"{name}_{roll_no}")
         os.makedirs(user_folder, exist_ok=True)
         
-        # Save the image
-        image_path = os.path.join(user_folder, f"image_{image_index}.jpg")
-        image.save(image_path)
+        # Validate the decoded upload before anything touches the disk
+        image_bytes = image.read()
+        img = decode_image(image_bytes)
+        if img is None:
+            return jsonify({"success": False, "message": "Failed to read image"}), 400
         
         # Detect face
-        is_valid, message = FaceDetectionService.detect_face(image_path)
+        is_valid, message, face_box = FaceDetectionService.locate_face(img)
+        # Only valid images are written now, and the check no longer reads the file back
+        DiskIOMetrics.record("upload_check", written=0 if is_valid else len(image_bytes), read=len(image_bytes))
         if not is_valid:
-            os.remove(image_path)  # Remove invalid image
             return jsonify({"success": False, "message": message}), 400
         
+        # Keep the original bytes; the five images are embedded together once index 4 arrives
+        image_path = os.path.join(user_folder, f"image_{image_index}.jpg")
+        with open(image_path, "wb") as f:
+            f.write(image_bytes)
+        EmbeddingService.save_face_box(image_path, face_box)
+        
         # Check if this is the first image (index 0), if so, register student in DB
         if image_index == 0:
             try:
@@ -65,7 +76,7 @@ def register_student_routes(app):
             
             # Process images and create embeddings
             success, message = EmbeddingService.process_student_images(
-                student_id, name, division, image_paths
+                student_id, name, division, image_paths, roll_no
             )
             
             if success:
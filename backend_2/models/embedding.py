@@ -1,7 +1,7 @@
 from datetime import datetime
-from bson import ObjectId
-import numpy as np
-from config import db, EMBEDDINGS_COLLECTION
+from bson import ObjectId, Binary
+from config import db, EMBEDDINGS_COLLECTION, FACE_RECOGNITION_MODEL
+from utils.embedding_format import pack_embeddings, to_vector_matrix
 
 class Embedding:
     """Model for facial embeddings in MongoDB"""
@@ -9,7 +9,7 @@ class Embedding:
     collection = db[EMBEDDINGS_COLLECTION]
     
     @staticmethod
-    def create(student_id, student_name, division, embedding_data):
+    def create(student_id, student_name, division, embedding_data, roll_no=None):
         """
         Create a new embedding record
         
@@ -17,25 +17,26 @@ class Embedding:
             student_id: MongoDB ObjectId or string of the student
             student_name: Name of the student
             division: Class/division of the student
-            embedding_data: List of 5 embedding arrays
+            embedding_data: List of 5 embeddings (arrays or DeepFace represent output)
+            roll_no: Roll number, stored alongside the name so recognition
+                     can report students without a lookup in the students collection
         """
         if isinstance(student_id, str):
             student_id = ObjectId(student_id)
         
-        # Convert numpy arrays to lists for MongoDB storage
-        processed_embeddings = []
-        for emb in embedding_data:
-            if isinstance(emb, np.ndarray):
-                processed_embeddings.append(emb.tolist())
-            else:
-                processed_embeddings.append(emb)
+        # Store the vectors as one packed float32 blob instead of nested BSON doubles
+        vectors = to_vector_matrix(embedding_data)
         
+        now = datetime.now()
         embedding_doc = {
             "student_id": student_id,
             "student_name": student_name,
             "division": division,
-            "embeddings": processed_embeddings,
-            "created_at": datetime.now()
+            "roll_no": roll_no,
+            "model": FACE_RECOGNITION_MODEL,
+            "vectors": Binary(pack_embeddings(vectors, FACE_RECOGNITION_MODEL)),
+            "created_at": now,
+            "updated_at": now  # Bumped on every later write; the gallery cache polls on it
         }
         
         result = Embedding.collection.insert_one(embedding_doc)
@@ -50,11 +51,11 @@ class Embedding:
         return Embedding.collection.find_one({"student_id": student_id})
     
     @staticmethod
-    def get_by_division(division):
-        """Get all embeddings for students in a specific division"""
-        return list(Embedding.collection.find({"division": division}))
+    def get_by_division(division, projection=None):
+        """Get all embeddings for students in a specific division, optionally projected"""
+        return list(Embedding.collection.find({"division": division}, projection))
     
     @staticmethod
-    def get_all():
-        """Get all embeddings"""
-        return list(Embedding.collection.find())
\ No newline at end of file
+    def get_all(projection=None):
+        """Get all embeddings, optionally projected"""
+        return list(Embedding.collection.find({}, projection))
\ No newline at end of file
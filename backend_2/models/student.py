@@ -24,6 +24,24 @@ class Student:
         """Get student by ID"""
         return Student.collection.find_one({"_id": ObjectId(student_id)})
     
+    @staticmethod
+    def get_many(student_ids, projection=None):
+        """
+        Get several students in one round-trip
+        
+        Args:
+            student_ids: Iterable of student IDs (strings or ObjectIds)
+            projection: Optional MongoDB projection, e.g. {"name": 1, "roll_no": 1}
+            
+        Returns:
+            Dict of string student ID -> student document
+        """
+        object_ids = [ObjectId(sid) if isinstance(sid, str) else sid for sid in set(student_ids)]
+        if not object_ids:
+            return {}
+        cursor = Student.collection.find({"_id": {"$in": object_ids}}, projection)
+        return {str(student["_id"]): student for student in cursor}
+    
     @staticmethod
     def get_by_roll_no(roll_no):
         """Get student by roll number"""
@@ -0,0 +1,184 @@
+"""
+Enrols many students at once from a directory or a zip archive
+
+Each student is one folder named <name>_<roll_no> holding their face images
+(.jpg/.jpeg/.png), the same naming the upload route uses under uploads/.
+Folders may sit at any depth inside the archive.
+
+Detection, alignment and embedding run in a pool of worker processes, each with
+its own copy of FaceNet; the parent process writes students and embeddings to
+MongoDB and rebuilds the gallery index once at the end.
+
+Usage (from backend_2/):
+    python scripts/bulk_enrol.py SOURCE --division DIV [--workers N] [--threads-per-worker N]
+                                 [--min-images 3] [--replace] [--dry-run]
+"""
+import os
+import sys
+import time
+import zipfile
+import argparse
+import multiprocessing
+from collections import defaultdict
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import GALLERY_INDEX_TYPE, GALLERY_INDEX_PATH
+from models.embedding import Embedding
+from models.student import Student
+from services.embedding_service import EmbeddingService
+from services.face_detection import FaceDetectionService
+from services.gallery_index import GalleryIndexService
+from services.model_registry import ModelRegistry
+from utils.image_utils import decode_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def find_students(source):
+    """
+    Lists the student folders in a directory tree or zip archive
+
+    Returns:
+        List of (folder_name, [image paths or archive member names]), sorted by folder
+    """
+    students = defaultdict(list)
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for member in archive.namelist():
+                if member.lower().endswith(IMAGE_EXTENSIONS):
+                    students[os.path.basename(os.path.dirname(member))].append(member)
+    else:
+        for folder, _, files in os.walk(source):
+            for file_name in files:
+                if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                    students[os.path.basename(folder)].append(os.path.join(folder, file_name))
+
+    return sorted((folder, sorted(images)) for folder, images in students.items() if folder)
+
+
+def parse_folder_name(folder_name):
+    """Splits <name>_<roll_no>; returns (name, roll_no) or None"""
+    name, _, roll_no = folder_name.rpartition('_')
+    if not name or not roll_no:
+        return None
+    return name, roll_no
+
+
+def init_worker(threads):
+    # Each worker loads FaceNet once; capping its threads keeps N workers from
+    # oversubscribing the CPU
+    ModelRegistry.initialize(threads=threads)
+
+
+def embed_student(task):
+    """
+    Worker: detect, align and batch-embed one student's images
+
+    Returns:
+        (folder_name, vectors or None, message)
+    """
+    folder_name, source, images, min_images = task
+    try:
+        if zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as archive:
+                decoded = [decode_image(archive.read(member)) for member in images]
+        else:
+            decoded = []
+            for path in images:
+                with open(path, "rb") as f:
+                    decoded.append(decode_image(f.read()))
+
+        # Bulk sources are not hand-checked like uploads, so unusable images are skipped
+        usable, face_boxes = [], []
+        for img in decoded:
+            if img is None:
+                continue
+            found, _, box = FaceDetectionService.locate_face(img)
+            if found:
+                usable.append(img)
+                face_boxes.append(box)
+
+        if len(usable) < min_images:
+            return folder_name, None, f"only {len(usable)} of {len(images)} images have exactly one usable face"
+
+        vectors, message = EmbeddingService.embed_enrolment_images(usable, face_boxes)
+        return folder_name, vectors, message
+    except Exception as e:
+        return folder_name, None, str(e)
+
+
+def save_student(name, roll_no, division, vectors, replace=False):
+    """
+    Creates (or reuses) the student record and stores their embeddings
+    """
+    student = Student.get_by_roll_no(roll_no)
+    student_id = str(student['_id']) if student else Student.create(name, roll_no, division)
+
+    if replace:
+        Embedding.collection.delete_many({"student_id": ObjectId(student_id)})
+    Embedding.create(student_id, name, division, vectors, roll_no)
+    return student_id
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory or .zip of <name>_<roll_no>/ image folders")
+    parser.add_argument("--division", required=True)
+    parser.add_argument("--workers", type=int, default=max(1, cpu_count // 2))
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="TensorFlow threads per worker (default: cores / workers)")
+    parser.add_argument("--min-images", type=int, default=3, help="usable images required per student")
+    parser.add_argument("--replace", action="store_true", help="re-enrol students who already have embeddings")
+    parser.add_argument("--dry-run", action="store_true", help="embed but do not write to MongoDB")
+    args = parser.parse_args()
+
+    threads = args.threads_per_worker or max(1, cpu_count // args.workers)
+
+    enrolled_rolls = set() if args.replace else set(Embedding.collection.distinct("roll_no"))
+    tasks, student_info = [], {}
+    for folder_name, images in find_students(args.source):
+        parsed = parse_folder_name(folder_name)
+        if parsed is None:
+            print(f"Skipping {folder_name}: expected <name>_<roll_no>")
+            continue
+        if parsed[1] in enrolled_rolls:
+            print(f"Skipping {folder_name}: already enrolled (use --replace to re-enrol)")
+            continue
+        student_info[folder_name] = parsed
+        tasks.append((folder_name, args.source, images, args.min_images))
+
+    print(f"Enrolling {len(tasks)} students with {args.workers} workers x {threads} threads")
+
+    start = time.time()
+    enrolled, failed = 0, []
+    # spawn, not fork: TensorFlow and the MongoDB client are not fork-safe
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.workers, initializer=init_worker, initargs=(threads,)) as pool:
+        for done, (folder_name, vectors, message) in enumerate(pool.imap_unordered(embed_student, tasks), 1):
+            if vectors is None:
+                failed.append(folder_name)
+                print(f"[{done}/{len(tasks)}] {folder_name}: failed ({message})")
+                continue
+
+            name, roll_no = student_info[folder_name]
+            if not args.dry_run:
+                save_student(name, roll_no, args.division, vectors, args.replace)
+            enrolled += 1
+            rate = done / (time.time() - start)
+            print(f"[{done}/{len(tasks)}] {folder_name}: {len(vectors)} embeddings ({rate:.1f} students/s)")
+
+    if enrolled and not args.dry_run:
+        # One rebuild instead of an index write per student; running servers reload
+        # it on their next query, and per-division galleries refresh through their cache
+        GalleryIndexService.replace_index(GalleryIndexService.build(Embedding.get_all(), GALLERY_INDEX_TYPE))
+        print(f"Rebuilt gallery index at {GALLERY_INDEX_PATH}")
+
+    print(f"{'Would enrol' if args.dry_run else 'Enrolled'} {enrolled} students in "
+          f"{time.time() - start:.1f}s; {len(failed)} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Checks the exported ONNX FaceNet variants against DeepFace's TensorFlow model
+
+Embeds the enrolment faces of a folder of students (<name>_<roll_no>/ folders, as
+under uploads/ or for scripts/bulk_enrol.py) with TensorFlow and with every variant
+found in onnx_models/, then reports for each variant:
+  - the cosine distance of its embedding to TensorFlow's, per face
+  - how often it reaches a different match decision at RECOGNITION_THRESHOLD
+    over every pair of faces
+  - rank-1 identification (each face against every other face) for both models
+
+Switch FACE_RECOGNITION_MODEL only when the decisions agree on your own photos.
+
+Usage (from backend_2/):
+    python scripts/check_onnx_accuracy.py SOURCE [--runtime auto|onnxruntime|opencv]
+"""
+import os
+import sys
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deepface import DeepFace
+from config import DEEPFACE_MODEL, DISTANCE_METRIC, RECOGNITION_THRESHOLD, ONNX_RUNTIME
+from services.batch_embedder import BatchEmbedder
+from services.face_detection import FaceDetectionService
+from services.face_detectors import FaceDetectors
+from services.matching_service import MatchingService
+from services.onnx_embedder import OnnxFaceNet
+from utils.image_utils import load_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+VARIANTS = (f"{DEEPFACE_MODEL}-onnx", f"{DEEPFACE_MODEL}-onnx-int8")
+
+
+def load_faces(source):
+    """
+    Aligned single-face crops of every student image, as enrolment produces them
+
+    Returns:
+        (crops, folder label of each crop)
+    """
+    crops, labels = [], []
+    for folder_name in sorted(os.listdir(source)):
+        folder = os.path.join(source, folder_name)
+        if not os.path.isdir(folder):
+            continue
+        for file_name in sorted(os.listdir(folder)):
+            if not file_name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            img = load_image(os.path.join(folder, file_name))
+            if img is None:
+                continue
+            found, _, box = FaceDetectionService.locate_face(img)
+            if found:
+                crops.extend(FaceDetectors.align_boxes(img, [box]))
+                labels.append(folder_name)
+    return crops, np.asarray(labels)
+
+
+def pair_distances(embeddings):
+    """N x N distances between every pair of faces, in the metric recognition uses"""
+    if DISTANCE_METRIC == "cosine":
+        normalized = MatchingService.normalize_rows(embeddings)
+        return np.clip(1.0 - normalized @ normalized.T, 0.0, 1.0)
+    diff = embeddings[:, None, :] - embeddings[None, :, :]
+    return np.linalg.norm(diff, axis=2)
+
+
+def rank1_accuracy(distances, labels):
+    """Share of faces whose nearest other face belongs to the same student"""
+    distances = distances.copy()
+    np.fill_diagonal(distances, np.inf)
+    # Faces of students with a single image have no correct answer to find
+    has_pair = np.array([np.sum(labels == label) > 1 for label in labels])
+    if not has_pair.any():
+        return float("nan")
+    nearest = np.argmin(distances, axis=1)
+    return float(np.mean(labels[nearest][has_pair] == labels[has_pair]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="folder of <name>_<roll_no>/ student folders")
+    parser.add_argument("--runtime", default=ONNX_RUNTIME, choices=["auto", "onnxruntime", "opencv"])
+    args = parser.parse_args()
+
+    crops, labels = load_faces(args.source)
+    if len(crops) < 2:
+        raise SystemExit(f"Need at least two usable faces under {args.source}")
+    print(f"{len(crops)} faces of {len(set(labels))} students")
+
+    expected = BatchEmbedder.embed_faces(crops, model=DeepFace.build_model(DEEPFACE_MODEL))
+    expected_pairs = pair_distances(expected)
+    upper = np.triu_indices(len(crops), k=1)
+    expected_match = expected_pairs[upper] <= RECOGNITION_THRESHOLD
+    print(f"{DEEPFACE_MODEL} (TensorFlow): rank-1 {rank1_accuracy(expected_pairs, labels):.3f}")
+
+    for variant in VARIANTS:
+        path = OnnxFaceNet.model_path(variant)
+        if not os.path.exists(path):
+            print(f"{variant}: {path} not found, skipped")
+            continue
+        try:
+            model = OnnxFaceNet(path, runtime=args.runtime)
+        except (ImportError, ValueError) as e:
+            print(f"{variant}: {str(e)}")
+            continue
+
+        embeddings = BatchEmbedder.embed_faces(crops, model=model)
+        normalized = MatchingService.normalize_rows(embeddings)
+        drift = 1.0 - np.sum(normalized * MatchingService.normalize_rows(expected), axis=1)
+        pairs = pair_distances(embeddings)
+        disagreements = int(np.sum((pairs[upper] <= RECOGNITION_THRESHOLD) != expected_match))
+
+        print(f"{variant} ({model.runtime}):")
+        print(f"  cosine distance to TensorFlow: mean {drift.mean():.2e}, max {drift.max():.2e}")
+        print(f"  pair distance change: max {np.abs(pairs - expected_pairs).max():.2e}")
+        print(f"  match decisions at {RECOGNITION_THRESHOLD}: {disagreements} of {len(expected_match)} differ")
+        print(f"  rank-1 {rank1_accuracy(pairs, labels):.3f}")
+
+
+if __name__ == "__main__":
+    main()
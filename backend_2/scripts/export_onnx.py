@@ -0,0 +1,130 @@
+"""
+Exports DeepFace's FaceNet to ONNX, optionally with an INT8-quantised copy
+
+Writes onnx_models/<model>.onnx (FP32) from the exact weights DeepFace loads, and
+checks that ONNX Runtime reproduces the TensorFlow embeddings. With --int8 it also
+writes onnx_models/<model>-int8.onnx:
+  - with --calibration-dir, static quantisation (INT8 weights and activations, QDQ
+    format) calibrated on faces detected in the photos of that folder; this is the
+    faster variant on CPU
+  - without it, dynamic quantisation (INT8 weights, activations quantised per call)
+
+Select a variant with FACE_RECOGNITION_MODEL = "Facenet-onnx" / "Facenet-onnx-int8"
+in config.py, after checking it with scripts/check_onnx_accuracy.py.
+
+Requires tensorflow, tf2onnx and onnxruntime (only on the machine doing the export).
+
+Usage (from backend_2/):
+    python scripts/export_onnx.py [--int8] [--calibration-dir uploads/group_photos] [--opset 13]
+"""
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deepface import DeepFace
+from config import DEEPFACE_MODEL, ONNX_MODEL_FOLDER
+from services.batch_embedder import BatchEmbedder
+from services.onnx_embedder import OnnxFaceNet
+from utils.image_utils import load_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def export_fp32(keras_model, input_size, path, opset):
+    import tensorflow as tf
+    import tf2onnx
+
+    signature = (tf.TensorSpec((None,) + tuple(input_size) + (3,), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(keras_model, input_signature=signature, opset=opset, output_path=path)
+
+
+def calibration_faces(folder, limit):
+    """
+    Preprocessed faces detected in the photos of a folder, as recognition sees them
+    """
+    faces = []
+    for file_name in sorted(os.listdir(folder)):
+        if not file_name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        img = load_image(os.path.join(folder, file_name))
+        if img is None:
+            continue
+        for face_obj in DeepFace.extract_faces(img_path=img, detector_backend="opencv", enforce_detection=False):
+            if face_obj.get('confidence', 1) > 0:
+                faces.append(BatchEmbedder.preprocess(face_obj['face']))
+            if len(faces) >= limit:
+                return faces
+    return faces
+
+
+def quantize(fp32_path, int8_path, calibration=None):
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic,
+                                          quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Fold constants and infer shapes first, as the quantiser expects
+        prepared_path = os.path.join(tmp, "prepared.onnx")
+        quant_pre_process(fp32_path, prepared_path, skip_symbolic_shape=True)
+
+        if not calibration:
+            quantize_dynamic(prepared_path, int8_path, weight_type=QuantType.QInt8)
+            return "dynamic"
+
+        class FaceReader(CalibrationDataReader):
+            def __init__(self, faces):
+                self.batches = iter([{"input": face[None]} for face in faces])
+
+            def get_next(self):
+                return next(self.batches, None)
+
+        quantize_static(prepared_path, int8_path, FaceReader(calibration), quant_format=QuantFormat.QDQ,
+                        per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+        return f"static, {len(calibration)} calibration faces"
+
+
+def max_cosine_distance(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return float(np.max(1 - np.sum(a * b, axis=1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--int8", action="store_true", help="also write the INT8-quantised graph")
+    parser.add_argument("--calibration-dir", help="photos whose faces calibrate static INT8 quantisation")
+    parser.add_argument("--calibration-faces", type=int, default=200)
+    parser.add_argument("--opset", type=int, default=13)
+    args = parser.parse_args()
+
+    os.makedirs(ONNX_MODEL_FOLDER, exist_ok=True)
+    model = DeepFace.build_model(DEEPFACE_MODEL)
+    keras_model = getattr(model, "model", model)
+    input_size = BatchEmbedder.input_size(model)
+
+    fp32_path = OnnxFaceNet.model_path(f"{DEEPFACE_MODEL}-onnx")
+    export_fp32(keras_model, input_size, fp32_path, args.opset)
+    print(f"Wrote {fp32_path} ({os.path.getsize(fp32_path) / 1e6:.1f} MB)")
+
+    # Same inputs through TensorFlow and the exported graph
+    calibration = calibration_faces(args.calibration_dir, args.calibration_faces) if args.calibration_dir else []
+    sample = np.stack(calibration[:16]) if calibration else \
+        np.random.default_rng(0).random((16,) + tuple(input_size) + (3,), dtype=np.float32)
+    expected = np.asarray(keras_model(sample, training=False), dtype=np.float32)
+    fp32 = OnnxFaceNet(fp32_path, runtime="onnxruntime")
+    print(f"FP32: max cosine distance to TensorFlow {max_cosine_distance(expected, fp32(sample)):.2e}")
+
+    if args.int8:
+        int8_path = OnnxFaceNet.model_path(f"{DEEPFACE_MODEL}-onnx-int8")
+        method = quantize(fp32_path, int8_path, calibration)
+        int8 = OnnxFaceNet(int8_path, runtime="onnxruntime")
+        print(f"Wrote {int8_path} ({os.path.getsize(int8_path) / 1e6:.1f} MB, {method})")
+        print(f"INT8: max cosine distance to TensorFlow {max_cosine_distance(expected, int8(sample)):.2e}")
+
+
+if __name__ == "__main__":
+    main()
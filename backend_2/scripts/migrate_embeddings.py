@@ -0,0 +1,68 @@
+"""
+Converts embedding documents from nested DeepFace dicts ('embeddings') to the
+packed float32 blob format ('vectors', see utils/embedding_format.py)
+
+Usage (from backend_2/):
+    python scripts/migrate_embeddings.py [--drop-legacy] [--dry-run]
+"""
+import os
+import sys
+import argparse
+from datetime import datetime
+from bson import Binary
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import FACE_RECOGNITION_MODEL
+from models.embedding import Embedding
+from utils.embedding_format import pack_embeddings, unpack_embeddings, to_vector_matrix
+
+
+def migrate_document(emb_doc, drop_legacy=False, dry_run=False):
+    """
+    Converts one embedding document
+
+    Returns:
+        Number of vectors packed (0 if the document had nothing to convert)
+    """
+    vectors = to_vector_matrix(emb_doc.get('embeddings', []))
+    if len(vectors) == 0:
+        return 0
+    if dry_run:
+        return len(vectors)
+
+    blob = pack_embeddings(vectors, FACE_RECOGNITION_MODEL)
+    _, stored = unpack_embeddings(blob)
+    if (stored != vectors).any():
+        raise ValueError(f"Round-trip mismatch for {emb_doc['_id']}")
+
+    update = {"$set": {"vectors": Binary(blob), "model": FACE_RECOGNITION_MODEL, "updated_at": datetime.now()}}
+    if drop_legacy:
+        update["$unset"] = {"embeddings": ""}
+    Embedding.collection.update_one({"_id": emb_doc["_id"]}, update)
+    return len(vectors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drop-legacy", action="store_true", help="remove the nested 'embeddings' field after packing")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be converted without writing")
+    args = parser.parse_args()
+
+    converted = 0
+    query = {"vectors": {"$exists": False}, "embeddings": {"$exists": True}}
+    for emb_doc in Embedding.collection.find(query):
+        try:
+            count = migrate_document(emb_doc, args.drop_legacy, args.dry_run)
+        except Exception as e:
+            print(f"Error migrating {emb_doc['_id']}: {str(e)}")
+            continue
+        if count:
+            converted += 1
+            print(f"{emb_doc.get('student_name', emb_doc['_id'])}: {count} vectors")
+
+    print(f"{'Would convert' if args.dry_run else 'Converted'} {converted} embedding documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+from services.model_registry import ModelRegistry
+from config import EMBEDDING_BATCH_SIZE
+
+
+class BatchEmbedder:
+    """
+    Embeds many face crops with one FaceNet forward pass per batch
+
+    DeepFace.represent embeds one image per call, so a group photo with 60 faces paid for
+    60 single-image forward passes. The crops from DeepFace.extract_faces are already
+    detected and aligned; here they get the same preprocessing DeepFace.represent applies
+    and are stacked into one input tensor per batch.
+    """
+
+    DEFAULT_INPUT_SIZE = (160, 160)  # FaceNet
+
+    @staticmethod
+    def input_size(model):
+        """
+        (height, width) the model expects
+
+        Newer DeepFace versions wrap the Keras model in a client whose input_shape is
+        (height, width); older ones return the Keras model itself, (None, h, w, 3).
+        """
+        shape = getattr(model, "input_shape", None)
+        if not shape:
+            return BatchEmbedder.DEFAULT_INPUT_SIZE
+        shape = tuple(shape)
+        return tuple(shape[1:3]) if len(shape) == 4 else tuple(shape[:2])
+
+    @staticmethod
+    def preprocess(face, target_size=DEFAULT_INPUT_SIZE):
+        """
+        Prepare one face crop exactly as DeepFace.represent does for a detected face
+
+        Args:
+            face: Face array from DeepFace.extract_faces (RGB float in [0, 1])
+            target_size: (height, width) of the model input
+
+        Returns:
+            target_size + (3,) float32 array, BGR in [0, 1], aspect ratio kept and
+            centred on a black border
+        """
+        img = face[:, :, ::-1]  # RGB -> BGR, the channel order FaceNet was used with
+
+        factor = min(target_size[0] / img.shape[0], target_size[1] / img.shape[1])
+        dsize = (int(img.shape[1] * factor), int(img.shape[0] * factor))
+        img = cv2.resize(img, dsize)
+
+        diff_0 = target_size[0] - img.shape[0]
+        diff_1 = target_size[1] - img.shape[1]
+        img = np.pad(
+            img,
+            ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)),
+            "constant"
+        )
+        if img.shape[0:2] != tuple(target_size):
+            img = cv2.resize(img, (target_size[1], target_size[0]))
+
+        img = np.asarray(img, dtype=np.float32)
+        if img.max() > 1:
+            img = img / 255.0
+        return img
+
+    @staticmethod
+    def iter_batches(faces, batch_size=EMBEDDING_BATCH_SIZE, model=None):
+        """
+        Embed a list of face crops batch by batch, yielding each batch as it is done
+
+        Args:
+            faces: Face arrays from DeepFace.extract_faces
+            batch_size: Crops per forward pass; bounds peak memory for very large photos
+            model: Model to run (default: the shared one from ModelRegistry)
+
+        Yields:
+            (start, embeddings): index of the batch's first face and its rows
+        """
+        if len(faces) == 0:
+            return
+
+        model = model if model is not None else ModelRegistry.get_facenet()
+        keras_model = getattr(model, "model", model)
+        target_size = BatchEmbedder.input_size(model)
+
+        for start in range(0, len(faces), batch_size):
+            batch = np.stack([
+                BatchEmbedder.preprocess(face, target_size) for face in faces[start:start + batch_size]
+            ])
+            # Calling the model directly (not predict) avoids Keras' per-call data pipeline setup
+            yield start, np.asarray(keras_model(batch, training=False), dtype=np.float32)
+
+    @staticmethod
+    def embed_faces(faces, batch_size=EMBEDDING_BATCH_SIZE, model=None):
+        """
+        Embed a list of face crops in batches
+
+        Args:
+            faces: Face arrays from DeepFace.extract_faces
+            batch_size: Crops per forward pass; bounds peak memory for very large photos
+            model: Model to run (default: the shared one from ModelRegistry), e.g. to
+                   compare the TensorFlow and ONNX embedders
+
+        Returns:
+            len(faces) x D float32 matrix, rows in the order of faces
+        """
+        if len(faces) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack([embeddings for _, embeddings in BatchEmbedder.iter_batches(faces, batch_size, model)])
@@ -1,25 +1,65 @@
 import os
+import json
 import numpy as np
-from deepface import DeepFace
 from models.embedding import Embedding
 from models.student import Student
-from config import FACE_RECOGNITION_MODEL
+from services.batch_embedder import BatchEmbedder
+from services.face_detection import FaceDetectionService
+from services.face_detectors import FaceDetectors
+from services.gallery_index import GalleryIndexService
+from services.gallery_cache import GalleryCache
+from utils.image_utils import load_image
 
 class EmbeddingService:
     @staticmethod
-    def create_embedding(image_path):
-        """
-        Creates facial embedding using FaceNet
-        """
+    def face_box_path(image_path):
+        """Path of the sidecar file holding the face box found when an image was uploaded"""
+        return os.path.splitext(image_path)[0] + ".json"
+    
+    @staticmethod
+    def save_face_box(image_path, box):
+        """Remember the face box locate_face found, so enrolment does not detect again"""
+        with open(EmbeddingService.face_box_path(image_path), "w") as f:
+            json.dump({"box": [int(v) for v in box]}, f)
+    
+    @staticmethod
+    def load_face_box(image_path):
+        """The face box saved for an uploaded image, or None if there is none"""
         try:
-            embedding = DeepFace.represent(img_path=image_path, model_name=FACE_RECOGNITION_MODEL)
-            return embedding
-        except Exception as e:
-            print(f"Error creating embedding: {str(e)}")
+            with open(EmbeddingService.face_box_path(image_path), "r") as f:
+                return tuple(json.load(f)["box"])
+        except (OSError, ValueError, KeyError):
             return None
     
     @staticmethod
-    def process_student_images(student_id, student_name, division, image_paths):
+    def embed_enrolment_images(images, face_boxes=None):
+        """
+        Crop and align the face in each enrolment image once, then embed all crops
+        in a single batched forward pass
+        
+        Args:
+            images: Decoded BGR image arrays
+            face_boxes: Optional (x, y, w, h) per image from upload-time detection;
+                        images without a box are detected again with the Haar cascade
+        
+        Returns:
+            (vectors, message) - N x D float32 matrix, or None if any image has no usable face
+        """
+        face_boxes = face_boxes or [None] * len(images)
+        faces = []
+        for i, (img, box) in enumerate(zip(images, face_boxes)):
+            if img is None:
+                return None, f"Could not read image {i+1}"
+            if box is None:
+                found, message, box = FaceDetectionService.locate_face(img)
+                if not found:
+                    return None, f"Image {i+1}: {message}"
+            faces.extend(FaceDetectors.align_boxes(img, [box]))
+        
+        return BatchEmbedder.embed_faces(faces), f"Generated {len(faces)} embeddings"
+    
+    @staticmethod
+    def process_student_images(student_id, student_name, division, image_paths, roll_no=None, face_boxes=None):
         """
         Process multiple images for a student and save their embeddings
         
@@ -28,31 +68,39 @@ class EmbeddingService:
             student_name: Name of the student
             division: Division/class of the student
             image_paths: List of paths to the student's face images
+            roll_no: Roll number, denormalised onto the embedding record
+            face_boxes: Optional face box per image found at upload time (see save_face_box)
         
         Returns:
             (success, message)
         """
         try:
-            # Generate embeddings for all images
-            embeddings = []
-            
-            for img_path in image_paths:
-                if os.path.exists(img_path):
-                    embedding = EmbeddingService.create_embedding(img_path)
-                    if embedding:
-                        embeddings.append(embedding)
+            if face_boxes is None:
+                face_boxes = [EmbeddingService.load_face_box(img_path) for img_path in image_paths]
             
-            # Check if we have enough embeddings
-            if len(embeddings) != len(image_paths):
-                return False, f"Could only generate {len(embeddings)} out of {len(image_paths)} embeddings"
+            # Generate embeddings for all images in one batch
+            images = [load_image(img_path) if os.path.exists(img_path) else None for img_path in image_paths]
+            embeddings, message = EmbeddingService.embed_enrolment_images(images, face_boxes)
+            if embeddings is None:
+                return False, f"Could not generate embeddings: {message}"
             
             # Save embeddings to MongoDB
-            embedding_id = Embedding.create(student_id, student_name, division, embeddings)
+            embedding_id = Embedding.create(student_id, student_name, division, embeddings, roll_no)
+            
+            # Keep the institution-wide gallery index in step without a rebuild
+            try:
+                GalleryIndexService.add_student(student_id, embeddings)
+            except Exception as e:
+                print(f"Error updating gallery index: {str(e)}")
+            
+            # Other processes find out through the cache's change stream or poll
+            GalleryCache.shared().invalidate(division)
             
-            # Delete the images after embeddings are created
+            # Delete the images (and their face boxes) after embeddings are created
             for img_path in image_paths:
-                if os.path.exists(img_path):
-                    os.remove(img_path)
+                for path in (img_path, EmbeddingService.face_box_path(img_path)):
+                    if os.path.exists(path):
+                        os.remove(path)
                     
             return True, f"Embeddings created successfully with ID: {embedding_id}"
             
@@ -1,35 +1,59 @@
 import cv2
 import numpy as np
+from services.model_registry import ModelRegistry
+from utils.image_utils import load_image, prepare_image
 
+# eye_angle is deliberately identical to _eye_angle in backend/face_embedding.py; each
+# backend is deployed on its own, so keep both in sync.
 class FaceDetectionService:
     @staticmethod
-    def detect_face(image_path):
+    def locate_face(image):
         """
         Detects if there's exactly one face in the image with good conditions
-        Returns: (success, message)
+        image: decoded BGR array or a path on disk
+        Returns: (success, message, box) where box is the face's (x, y, w, h) or None
         """
         try:
-            img = cv2.imread(image_path)
+            img = load_image(image)
             if img is None:
-                return False, "Failed to read image"
-            
-            # Convert to grayscale for face detection
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # Use haar cascade for quick face detection
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-            
+                return False, "Failed to read image", None
+
+            # Grayscale working copy of bounded size for detection and the brightness check
+            prepared = prepare_image(img, brightness_limits=(50,))
+
+            # Use the shared, pre-loaded haar cascade for quick face detection
+            faces = ModelRegistry.detect_faces_prepared(prepared, 1.3, 5)
+
             if len(faces) == 0:
-                return False, "No face detected"
+                return False, "No face detected", None
             if len(faces) > 1:
-                return False, "Multiple faces detected"
-            
+                return False, "Multiple faces detected", None
+
             # Check image brightness
-            brightness = np.mean(gray)
-            if brightness < 50:
-                return False, "Poor lighting conditions"
-                
-            return True, "Face detected successfully"
+            if prepared['brightness'] < 50:
+                return False, "Poor lighting conditions", None
+
+            x, y, w, h = (int(v) for v in faces[0])
+            return True, "Face detected successfully", (x, y, w, h)
         except Exception as e:
-            return False, f"Error: {str(e)}"
\ No newline at end of file
+            return False, f"Error: {str(e)}", None
+
+    @staticmethod
+    def eye_angle(face):
+        """
+        Angle in degrees that levels the two most prominent eyes in a face crop,
+        or 0 when two plausible eyes are not found
+        """
+        gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+
+        # Eyes sit in the upper half of the face; this also keeps nostrils out
+        eyes = ModelRegistry.detect_eyes(gray[:gray.shape[0] // 2])
+        if len(eyes) < 2:
+            return 0
+
+        eyes = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+        (x1, y1), (x2, y2) = sorted((ex + ew / 2, ey + eh / 2) for ex, ey, ew, eh in eyes)
+        angle = np.degrees(np.arctan2(y2 - y1, x2 - x1))
+
+        # Two detections this far from level are not a pair of eyes
+        return float(angle) if abs(angle) <= 45 else 0
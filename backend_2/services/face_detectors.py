@@ -0,0 +1,223 @@
+import threading
+import cv2
+import numpy as np
+from deepface import DeepFace
+from services.face_detection import FaceDetectionService
+from services.model_registry import ModelRegistry
+from services.tiled_detection import TiledFaceDetector
+from config import GROUP_DETECTOR, YUNET_INPUT_SIZE, YUNET_SCORE_THRESHOLD
+
+
+class DetectedFace:
+    """
+    One face found by any detector, in the photo's original coordinates
+
+    box is (x, y, w, h). landmarks is an N x 2 float32 array of (x, y) points starting
+    with the subject's right and left eye (YuNet adds the nose tip and both mouth
+    corners), or None when the detector finds none. score is the detector's own
+    confidence, so it only ranks faces found by the same detector.
+    """
+
+    def __init__(self, box, score, landmarks=None):
+        self.box = tuple(int(round(v)) for v in box)
+        self.score = float(score)
+        self.landmarks = None if landmarks is None else np.asarray(landmarks, dtype=np.float32).reshape(-1, 2)
+
+    def to_face_obj(self, face):
+        """
+        This face in DeepFace.extract_faces layout, with its aligned crop
+        """
+        x, y, w, h = self.box
+        facial_area = {'x': x, 'y': y, 'w': w, 'h': h}
+        if self.landmarks is not None:
+            facial_area['right_eye'] = tuple(int(v) for v in self.landmarks[0])
+            facial_area['left_eye'] = tuple(int(v) for v in self.landmarks[1])
+        return {'face': face, 'facial_area': facial_area, 'confidence': self.score}
+
+
+class HaarTiledDetector:
+    """
+    Haar cascade over tiles of the photo (TiledFaceDetector); no landmarks
+    """
+
+    name = "tiled"
+
+    def detect(self, image):
+        return [DetectedFace(box, score) for box, score in TiledFaceDetector.detect(image)]
+
+
+class DeepFaceOpenCVDetector:
+    """
+    DeepFace's opencv backend on the whole photo: Haar faces plus Haar eyes
+    """
+
+    name = "deepface"
+
+    def detect(self, image):
+        face_objs = DeepFace.extract_faces(img_path=image, detector_backend="opencv", enforce_detection=False,
+                                           align=False)
+        faces = []
+        for face_obj in face_objs:
+            # Without a detection DeepFace returns the whole photo with confidence 0
+            if not face_obj.get('confidence'):
+                continue
+            area = face_obj['facial_area']
+            eyes = [area.get('right_eye'), area.get('left_eye')]
+            landmarks = eyes if all(eye is not None for eye in eyes) else None
+            faces.append(DetectedFace((area['x'], area['y'], area['w'], area['h']), face_obj['confidence'], landmarks))
+        return faces
+
+
+class YuNetDetector:
+    """
+    OpenCV's YuNet CNN face detector (cv2.FaceDetectorYN) on a downscaled copy
+
+    Runs once over a copy no larger than input_size on its longer side, so its cost is
+    bounded like the tiled detector's, and returns five landmarks per face. YuNet's
+    boxes are taller than wide and tighter than the Haar boxes enrolment crops were
+    cut from, so each is widened to a square around the same centre.
+    """
+
+    name = "yunet"
+
+    def __init__(self, input_size=YUNET_INPUT_SIZE, score_threshold=YUNET_SCORE_THRESHOLD):
+        self.input_size = input_size
+        self.score_threshold = score_threshold
+
+    def detect(self, image):
+        height, width = image.shape[:2]
+        scale = min(1.0, self.input_size / max(height, width))
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else image
+
+        detector = ModelRegistry.get_thread_yunet()
+        detector.setInputSize((small.shape[1], small.shape[0]))
+        detector.setScoreThreshold(self.score_threshold)
+        _, rows = detector.detect(small)
+
+        faces = []
+        for row in rows if rows is not None else []:
+            x, y, w, h = row[:4] / scale
+            side = max(w, h)
+            left, top = max(0.0, x + (w - side) / 2), max(0.0, y + (h - side) / 2)
+            right, bottom = min(float(width), x + (w + side) / 2), min(float(height), y + (h + side) / 2)
+            if right - left < 1 or bottom - top < 1:
+                continue
+            faces.append(DetectedFace((left, top, right - left, bottom - top), row[14], row[4:14] / scale))
+        faces.sort(key=lambda face: face.score, reverse=True)
+        return faces
+
+
+class FaceDetectors:
+    """
+    The group photo detectors behind one interface
+
+    Every detector's detect(image) returns DetectedFace objects; align_faces turns
+    them into the crops BatchEmbedder embeds, whichever detector found them.
+    """
+
+    DETECTORS = {
+        HaarTiledDetector.name: HaarTiledDetector,
+        YuNetDetector.name: YuNetDetector,
+        DeepFaceOpenCVDetector.name: DeepFaceOpenCVDetector,
+    }
+
+    _instances = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(name=GROUP_DETECTOR):
+        """
+        The shared detector registered under name (see GROUP_DETECTOR)
+        """
+        if name not in FaceDetectors.DETECTORS:
+            raise ValueError(f"Unknown face detector: {name} (expected one of {', '.join(FaceDetectors.DETECTORS)})")
+        with FaceDetectors._lock:
+            if name not in FaceDetectors._instances:
+                FaceDetectors._instances[name] = FaceDetectors.DETECTORS[name]()
+            return FaceDetectors._instances[name]
+
+    @staticmethod
+    def eye_angles(faces):
+        """
+        Angle in degrees that levels the eyes of each face
+
+        Faces with landmarks are handled together from their eye points; the rest
+        (Haar detections) fall back to the eye cascade, as enrolment does.
+        """
+        angles = np.zeros(len(faces), dtype=np.float64)
+        with_eyes = [i for i, face in enumerate(faces) if face.landmarks is not None]
+        if with_eyes:
+            eyes = np.stack([faces[i].landmarks[:2] for i in with_eyes])
+            # From the eye further left in the photo to the other one, as eye_angle measures it
+            delta = eyes[:, 1] - eyes[:, 0]
+            delta[delta[:, 0] < 0] *= -1
+            eye_angles = np.degrees(np.arctan2(delta[:, 1], delta[:, 0]))
+            angles[with_eyes] = np.where(np.abs(eye_angles) <= 45, eye_angles, 0)
+        return angles
+
+    # For a face without landmarks this crops what align_face in backend/face_embedding.py
+    # crops for the same box; each backend is deployed on its own, so keep both in sync.
+    @staticmethod
+    def align_faces(image, faces):
+        """
+        Crop every detected face with its eyes level
+
+        Rotation and crop are a single affine warp per face, read straight from the
+        photo: no padded region is copied per face, and rotated corners still hold
+        image content.
+
+        Args:
+            image: BGR image array the faces were detected in
+            faces: DetectedFace list
+
+        Returns:
+            One crop per face in DeepFace.extract_faces layout (RGB float32 in [0, 1])
+        """
+        if not faces:
+            return []
+
+        angles = FaceDetectors.eye_angles(faces)
+        for i, face in enumerate(faces):
+            if face.landmarks is None:
+                x, y, w, h = face.box
+                angles[i] = FaceDetectionService.eye_angle(image[y:y + h, x:x + w])
+
+        # cv2.getRotationMatrix2D about each box centre, shifted so the box lands at the origin
+        boxes = np.asarray([face.box for face in faces], dtype=np.float64)
+        half_w, half_h = boxes[:, 2] / 2, boxes[:, 3] / 2
+        cx, cy = boxes[:, 0] + half_w, boxes[:, 1] + half_h
+        cos, sin = np.cos(np.radians(angles)), np.sin(np.radians(angles))
+        matrices = np.empty((len(faces), 2, 3), dtype=np.float64)
+        matrices[:, 0] = np.stack([cos, sin, half_w - cos * cx - sin * cy], axis=1)
+        matrices[:, 1] = np.stack([-sin, cos, half_h + sin * cx - cos * cy], axis=1)
+
+        crops = []
+        for matrix, face in zip(matrices, faces):
+            crop = cv2.warpAffine(image, matrix, (face.box[2], face.box[3]))
+            crops.append(crop[:, :, ::-1].astype(np.float32) / 255.0)
+        return crops
+
+    @staticmethod
+    def align_boxes(image, boxes):
+        """
+        align_faces for plain (x, y, w, h) boxes, such as the single face the upload
+        check found; enrolment crops this way so gallery and group photo faces are
+        cropped and aligned alike
+        """
+        return FaceDetectors.align_faces(image, [DetectedFace(box, 1.0) for box in boxes])
+
+    @staticmethod
+    def extract_faces(image, detector=GROUP_DETECTOR):
+        """
+        Detect and align the faces of a group photo
+
+        Args:
+            image: BGR image array
+            detector: Name of the detector to use
+
+        Returns:
+            Face objects in DeepFace.extract_faces layout: 'face', 'facial_area', 'confidence'
+        """
+        faces = FaceDetectors.get(detector).detect(image)
+        crops = FaceDetectors.align_faces(image, faces)
+        return [face.to_face_obj(crop) for face, crop in zip(faces, crops)]
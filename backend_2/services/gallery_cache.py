@@ -0,0 +1,203 @@
+import threading
+import time
+from pymongo.errors import PyMongoError
+from services.matching_service import Gallery
+
+# Only what matching and reporting need; timestamps stay on the server
+GALLERY_PROJECTION = {
+    "_id": 0,
+    "student_id": 1,
+    "student_name": 1,
+    "roll_no": 1,
+    "division": 1,
+    "vectors": 1,
+    "embeddings": 1  # Legacy documents written before the packed format
+}
+
+
+class GalleryCache:
+    """
+    In-process cache of packed galleries, one per division
+
+    Each entry holds only the Gallery built from that division's embedding documents
+    (packed matrix plus student IDs), so steady-state recognition makes no database
+    round-trips. Entries are invalidated from a MongoDB change stream when the server
+    supports one, otherwise by polling for documents written (inserted or updated)
+    after the last one seen.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, collection, poll_interval=30.0):
+        """
+        Args:
+            collection: pymongo (or mongomock) collection holding embedding documents
+            poll_interval: Seconds between polls when change streams are unavailable
+        """
+        self.collection = collection
+        self.poll_interval = poll_interval
+        self.mode = None  # "change_stream" or "polling" once started
+        self._galleries = {}
+        self._generation = 0  # Bumped on every invalidation so stale loads are not cached
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._last_updated_at = None
+        self._last_count = None
+
+    @classmethod
+    def shared(cls):
+        """
+        The process-wide cache over the embeddings collection, started on first use
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                from config import GALLERY_CACHE_POLL_SECONDS
+                from models.embedding import Embedding
+
+                cls._shared = cls(Embedding.collection, GALLERY_CACHE_POLL_SECONDS)
+                cls._shared.start()
+            return cls._shared
+
+    def get(self, division):
+        """
+        Packed gallery for a division, loaded from MongoDB only on a cache miss
+        """
+        gallery = self._galleries.get(division)
+        if gallery is not None:
+            return gallery
+
+        generation = self._generation
+        embedding_docs = list(self.collection.find({"division": division}, GALLERY_PROJECTION))
+        gallery = Gallery.from_embedding_docs(embedding_docs)
+
+        with self._lock:
+            if generation == self._generation:
+                self._galleries[division] = gallery
+                print(f"Cached gallery for division {division}: {len(gallery)} embeddings")
+        return gallery
+
+    def invalidate(self, division=None):
+        """
+        Drop one division's gallery, or every gallery when division is None
+        """
+        with self._lock:
+            self._generation += 1
+            if division is None:
+                self._galleries.clear()
+            else:
+                self._galleries.pop(division, None)
+
+    def start(self):
+        """
+        Begin watching for changes: change streams first, polling as the fallback
+        """
+        if self._watcher is not None:
+            return
+
+        stream = None
+        try:
+            # mongomock collections have no watch method at all
+            if not hasattr(type(self.collection), "watch"):
+                raise NotImplementedError("collection has no change stream support")
+            stream = self.collection.watch(full_document="updateLookup")
+            self.mode = "change_stream"
+        except (PyMongoError, NotImplementedError) as e:
+            # Standalone mongod (no replica set) rejects change streams as well
+            print(f"Change streams unavailable ({str(e)}), polling every {self.poll_interval}s")
+            self.mode = "polling"
+            self._remember_latest()
+
+        target = self._watch_change_stream if stream is not None else self._poll
+        args = (stream,) if stream is not None else ()
+        self._watcher = threading.Thread(target=target, args=args, name="gallery-cache-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch_change_stream(self, stream):
+        try:
+            with stream:
+                for change in stream:
+                    self.apply_change(change)
+        except PyMongoError as e:
+            print(f"Change stream closed ({str(e)}), falling back to polling")
+            self.invalidate()
+            self.mode = "polling"
+            self._remember_latest()
+            self._poll()
+
+    def invalidate_student(self, student_id):
+        """
+        Drop every cached gallery that holds rows of a student
+        """
+        with self._lock:
+            self._generation += 1
+            for division, gallery in list(self._galleries.items()):
+                if student_id in gallery.student_ids:
+                    del self._galleries[division]
+
+    def apply_change(self, change):
+        """
+        Invalidate the galleries touched by one change stream event
+        """
+        document = change.get("fullDocument") or {}
+        operation = change.get("operationType")
+        if operation in ("insert", "update", "replace") and "division" in document:
+            self.invalidate(document["division"])
+            if operation != "insert":
+                # The event only shows the document after the change; if it moved out of
+                # another division, that division's gallery still holds the student
+                if "student_id" in document:
+                    self.invalidate_student(str(document["student_id"]))
+                else:
+                    self.invalidate()
+        else:
+            # Deletes and drops carry no division; start over
+            self.invalidate()
+
+    @staticmethod
+    def _written_at(doc):
+        """When a document was last written; legacy documents only carry created_at"""
+        return doc.get("updated_at") or doc.get("created_at")
+
+    def _remember_latest(self):
+        stamps = []
+        for field in ("updated_at", "created_at"):
+            for doc in self.collection.find({field: {"$exists": True}}, {field: 1}).sort(field, -1).limit(1):
+                stamps.append(doc[field])
+        self._last_updated_at = max(stamps, default=None)
+        self._last_count = self.collection.count_documents({})
+
+    def poll_once(self):
+        """
+        Invalidate divisions with documents inserted or updated since the last poll;
+        any drop in the document count (a delete) invalidates everything
+        """
+        query = {}
+        if self._last_updated_at is not None:
+            query = {"$or": [
+                {"updated_at": {"$gt": self._last_updated_at}},
+                {"updated_at": {"$exists": False}, "created_at": {"$gt": self._last_updated_at}}
+            ]}
+
+        projection = {"division": 1, "student_id": 1, "created_at": 1, "updated_at": 1}
+        for doc in self.collection.find(query, projection):
+            self.invalidate(doc.get("division"))
+            written_at = self._written_at(doc)
+            if written_at != doc.get("created_at") and "student_id" in doc:
+                # An update may have moved the student out of another cached division
+                self.invalidate_student(str(doc["student_id"]))
+            if written_at is not None and (self._last_updated_at is None or written_at > self._last_updated_at):
+                self._last_updated_at = written_at
+
+        count = self.collection.count_documents({})
+        if self._last_count is not None and count < self._last_count:
+            self.invalidate()
+        self._last_count = count
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"Gallery cache poll error: {str(e)}")
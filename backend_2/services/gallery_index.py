@@ -0,0 +1,579 @@
+import os
+import copy
+import tempfile
+import threading
+from contextlib import contextmanager
+import numpy as np
+from services.matching_service import Gallery, MatchingService
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+
+@contextmanager
+def _file_lock(lock_path):
+    """
+    Exclusive lock shared by every server process (and scripts/bulk_enrol.py), so
+    read-modify-write updates of the index file never overwrite each other
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ExactIndex:
+    """
+    Brute-force gallery index: every query is compared against every stored row
+
+    Rows are stored unit-normalised together with their original norms, so both
+    cosine and euclidean distances can be recovered for the re-ranking step.
+    """
+
+    kind = "exact"
+
+    def __init__(self, dim=128):
+        self.dim = dim
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.student_ids = np.zeros(0, dtype=object)
+        self._student_rows = None  # student ID -> row indices, rebuilt lazily
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def add(self, vectors, student_ids):
+        """
+        Append embeddings to the index
+
+        Args:
+            vectors: N x D matrix of raw embeddings
+            student_ids: N student IDs, one per row
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if vectors.size == 0:
+            return
+        norms = np.linalg.norm(vectors, axis=1).astype(np.float32)
+        self.vectors = np.vstack([self.vectors, MatchingService.normalize_rows(vectors)])
+        self.norms = np.concatenate([self.norms, norms])
+        self.student_ids = np.concatenate([self.student_ids, np.asarray(student_ids, dtype=object)])
+        self._student_rows = None
+        self._on_add(len(vectors))
+
+    def remove(self, student_id):
+        """
+        Drop every row belonging to a student
+
+        Returns:
+            Number of rows removed
+        """
+        keep = self.student_ids != str(student_id)
+        removed = int(len(keep) - keep.sum())
+        if removed:
+            self.vectors = self.vectors[keep]
+            self.norms = self.norms[keep]
+            self.student_ids = self.student_ids[keep]
+            self._student_rows = None
+            self._on_remove(keep)
+        return removed
+
+    def _on_add(self, count):
+        pass
+
+    def _on_remove(self, keep):
+        pass
+
+    def _candidate_rows(self, queries):
+        return [None] * len(queries)  # None means "all rows"
+
+    def search(self, queries, k=10):
+        """
+        Nearest stored rows for every query by cosine distance
+
+        Args:
+            queries: F x D matrix of face embeddings
+            k: Number of neighbours per query
+
+        Returns:
+            (distances, rows) - two F x k arrays; missing neighbours have row -1
+        """
+        queries = MatchingService.normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        if len(self) == 0 or len(queries) == 0:
+            return distances, rows
+
+        candidate_rows = self._candidate_rows(queries)
+        if all(candidates is None for candidates in candidate_rows):
+            # Exhaustive: one F x N matrix multiply for the whole batch
+            all_distances = 1.0 - queries @ self.vectors.T
+            top = min(k, len(self))
+            nearest = np.argpartition(all_distances, top - 1, axis=1)[:, :top]
+            nearest_distances = np.take_along_axis(all_distances, nearest, axis=1)
+            order = np.argsort(nearest_distances, axis=1)
+            distances[:, :top] = np.take_along_axis(nearest_distances, order, axis=1)
+            rows[:, :top] = np.take_along_axis(nearest, order, axis=1)
+            return distances, rows
+
+        for query_idx, candidates in enumerate(candidate_rows):
+            if len(candidates) == 0:
+                continue
+            query_distances = 1.0 - self.vectors[candidates] @ queries[query_idx]
+            top = min(k, len(query_distances))
+            nearest = np.argpartition(query_distances, top - 1)[:top]
+            nearest = nearest[np.argsort(query_distances[nearest])]
+            distances[query_idx, :top] = query_distances[nearest]
+            rows[query_idx, :top] = candidates[nearest]
+        return distances, rows
+
+    def _student_row_map(self):
+        """
+        Student ID -> row indices of that student
+        """
+        if self._student_rows is None:
+            unique_ids, inverse = np.unique(self.student_ids.astype(str), return_inverse=True)
+            order = np.argsort(inverse, kind="stable")
+            bounds = np.searchsorted(inverse[order], np.arange(len(unique_ids) + 1))
+            self._student_rows = {
+                student_id: order[bounds[i]:bounds[i + 1]] for i, student_id in enumerate(unique_ids)
+            }
+        return self._student_rows
+
+    def distances_to_students(self, queries, student_ids, metric="cosine"):
+        """
+        Face x student distances to the given students, computed exactly over all of
+        each student's stored rows
+
+        Returns:
+            F x len(student_ids) matrix; columns of students not in the index are inf
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        distances = np.full((len(queries), len(student_ids)), np.inf, dtype=np.float32)
+        row_map = self._student_row_map()
+        present = [i for i, student_id in enumerate(student_ids) if student_id in row_map]
+        if present:
+            # Rows grouped student by student, so the gallery's columns follow present
+            rows = np.concatenate([row_map[student_ids[i]] for i in present])
+            gallery = Gallery(self.vectors[rows] * self.norms[rows, None], self.student_ids[rows])
+            distances[:, present] = MatchingService.student_distance_matrix(queries, gallery, metric)
+        return distances
+
+    def student_distance_matrix(self, queries, k=20, metric="cosine"):
+        """
+        Face x student distances restricted to the students found near any face
+
+        Candidate students come from search(); each candidate's distances are then
+        computed exactly over all of that student's stored rows.
+
+        Returns:
+            (student_ids, F x S distance matrix)
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        _, rows = self.search(queries, k)
+        candidate_ids = list(dict.fromkeys(str(sid) for sid in self.student_ids[rows[rows >= 0]]))
+        if not candidate_ids:
+            return [], np.zeros((len(queries), 0), dtype=np.float32)
+        return candidate_ids, self.distances_to_students(queries, candidate_ids, metric)
+
+    def _state(self):
+        return {"vectors": self.vectors, "norms": self.norms, "student_ids": self.student_ids.astype(str)}
+
+    def _load_state(self, state):
+        self.vectors = state["vectors"].astype(np.float32)
+        self.norms = state["norms"].astype(np.float32)
+        self.student_ids = state["student_ids"].astype(object)
+        self._student_rows = None
+
+    def save(self, path):
+        """
+        Persist the index to an .npz file (written to a uniquely named temp file, then renamed)
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, kind=np.array(self.kind), dim=np.array(self.dim), **self._state())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def load(path):
+        """
+        Load an index saved with save(), whatever its kind
+        """
+        with np.load(path, allow_pickle=False) as data:
+            state = {key: data[key] for key in data.files}
+        index_class = INDEX_TYPES[str(state["kind"])]
+        index = index_class(dim=int(state["dim"]))
+        index._load_state(state)
+        return index
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted-file index: rows are bucketed by their nearest k-means centroid and a
+    query only scans the nprobe closest buckets
+
+    The index behaves exactly until it holds enough rows to train its centroids.
+    Later additions are dropped into their nearest existing bucket, so enrolment
+    never needs a full retrain; once the gallery outgrows its buckets
+    (needs_retrain), train a copy off the request path and adopt_buckets() it.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, dim=128, nlist=None, nprobe=8, train_iterations=10):
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.assignments = np.zeros(0, dtype=np.int64)
+        self._lists = None  # (order, offsets) CSR view over assignments, rebuilt lazily
+
+    @property
+    def is_trained(self):
+        return len(self.centroids) > 0
+
+    def train(self, seed=0):
+        """
+        Spherical k-means over the stored rows to (re)build the buckets
+        """
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(self))))
+        if len(self) < 2 * nlist:
+            return False
+
+        rng = np.random.default_rng(seed)
+        sample = self.vectors
+        if len(sample) > 256 * nlist:
+            sample = sample[rng.choice(len(sample), 256 * nlist, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            labels = self._nearest_centroid(sample, centroids)
+            sums = np.stack([
+                np.bincount(labels, weights=sample[:, d], minlength=nlist) for d in range(sample.shape[1])
+            ], axis=1).astype(np.float32)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = MatchingService.normalize_rows(sums)
+
+        self.centroids = centroids
+        self.assignments = self._nearest_centroid(self.vectors, centroids)
+        self._lists = None
+        return True
+
+    @staticmethod
+    def _nearest_centroid(vectors, centroids, chunk_size=8192):
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            labels[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+        return labels
+
+    @property
+    def needs_retrain(self):
+        """True once the gallery has outgrown the buckets an automatic nlist gave it"""
+        return self.is_trained and self.nlist is None and 4 * np.sqrt(len(self)) >= 2 * len(self.centroids)
+
+    def adopt_buckets(self, trained):
+        """
+        Take the centroids of a retrained copy of this index. Rows the copy held keep
+        its assignments and rows added since go to their nearest bucket; if rows were
+        removed in the meantime, every row is reassigned.
+        """
+        held = len(trained)
+        unchanged = (len(self) >= held
+                     and np.array_equal(self.student_ids[:held], trained.student_ids)
+                     and np.array_equal(self.vectors[:held], trained.vectors))
+        self.centroids = trained.centroids
+        if unchanged:
+            self.assignments = np.concatenate([trained.assignments,
+                                               self._nearest_centroid(self.vectors[held:], self.centroids)])
+        else:
+            self.assignments = self._nearest_centroid(self.vectors, self.centroids)
+        self._lists = None
+
+    def _on_add(self, count):
+        # Train once there is enough data; a trained index only drops new rows into
+        # their nearest bucket (retraining is the caller's call, see needs_retrain)
+        if not self.is_trained:
+            self.train()
+            return
+        new_labels = self._nearest_centroid(self.vectors[-count:], self.centroids)
+        self.assignments = np.concatenate([self.assignments, new_labels])
+        self._lists = None
+
+    def _on_remove(self, keep):
+        if self.is_trained:
+            self.assignments = self.assignments[keep]
+            self._lists = None
+
+    def _candidate_rows(self, queries):
+        if not self.is_trained:
+            return super()._candidate_rows(queries)
+
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            offsets = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, offsets)
+        order, offsets = self._lists
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        return [
+            np.concatenate([order[offsets[bucket]:offsets[bucket + 1]] for bucket in query_probes])
+            for query_probes in probes
+        ]
+
+    def _state(self):
+        state = super()._state()
+        state.update({
+            "centroids": self.centroids,
+            "assignments": self.assignments,
+            "nlist": np.array(self.nlist or 0),
+            "nprobe": np.array(self.nprobe)
+        })
+        return state
+
+    def _load_state(self, state):
+        super()._load_state(state)
+        self.centroids = state["centroids"].astype(np.float32)
+        self.assignments = state["assignments"].astype(np.int64)
+        self.nlist = int(state["nlist"]) or None
+        self.nprobe = int(state["nprobe"])
+        self._lists = None
+
+
+INDEX_TYPES = {
+    ExactIndex.kind: ExactIndex,
+    IVFIndex.kind: IVFIndex
+}
+
+
+class GalleryIndexService:
+    """
+    Process-wide gallery index over every student's embeddings
+
+    Every server process keeps its own copy of the index file and reloads it when
+    another process (or scripts/bulk_enrol.py) replaces the file, detected from its
+    inode, mtime and size. Updates re-read the latest file, change it and write it
+    back under an inter-process file lock, so concurrent enrolments in different
+    processes all survive. IVF buckets outgrown by enrolments are retrained on a
+    background thread, never on the request that crossed the threshold.
+    """
+
+    _index = None
+    _version = None  # (inode, mtime_ns, size) of the file _index was loaded from or saved to
+    _lock = threading.Lock()
+    _retrainer = None  # Background thread retraining the IVF buckets, while one runs
+
+    @staticmethod
+    def create_index(kind):
+        from config import IVF_NLIST, IVF_NPROBE
+
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"Unknown gallery index type: {kind}")
+        if kind == IVFIndex.kind:
+            return IVFIndex(nlist=IVF_NLIST, nprobe=IVF_NPROBE)
+        return INDEX_TYPES[kind]()
+
+    @staticmethod
+    def build(embedding_docs, kind):
+        """
+        Build a fresh index from embedding documents
+        """
+        index = GalleryIndexService.create_index(kind)
+        vectors = []
+        student_ids = []
+        for emb_doc in embedding_docs:
+            doc_vectors = MatchingService.document_vectors(emb_doc)
+            vectors.extend(doc_vectors)
+            student_ids.extend([str(emb_doc['student_id'])] * len(doc_vectors))
+        if vectors:
+            index.add(np.vstack(vectors), student_ids)
+        if isinstance(index, IVFIndex):
+            index.train()
+        return index
+
+    @staticmethod
+    def _file_version(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _load_current(path, kind):
+        """
+        Make sure this process holds the latest index file, reloading it if it changed
+        Caller holds _lock.
+
+        Returns:
+            True if the index in memory matches the file
+        """
+        version = GalleryIndexService._file_version(path)
+        if version is None:
+            return False
+        if GalleryIndexService._index is not None and version == GalleryIndexService._version:
+            return True
+        try:
+            index = ExactIndex.load(path)
+        except Exception as e:
+            print(f"Error loading gallery index: {str(e)}")
+            return False
+        if index.kind != kind:
+            return False
+        GalleryIndexService._index = index
+        GalleryIndexService._version = version
+        print(f"Gallery index ({index.kind}) loaded with {len(index)} embeddings")
+        return True
+
+    @staticmethod
+    def _save(index, path):
+        """Write the index and remember the file version. Caller holds _lock and the file lock."""
+        index.save(path)
+        GalleryIndexService._index = index
+        GalleryIndexService._version = GalleryIndexService._file_version(path)
+
+    @staticmethod
+    def _ensure_index(path, kind, locked=False):
+        """
+        The current index: reloaded if the file changed, built from MongoDB if there is
+        no usable file. Caller holds _lock, and the file lock when locked is True
+        (flock is not re-entrant across file handles, so it is not taken twice).
+        """
+        if GalleryIndexService._load_current(path, kind) or GalleryIndexService._index is not None:
+            return GalleryIndexService._index
+        if locked:
+            return GalleryIndexService._build_and_save(path, kind)
+        with _file_lock(path + ".lock"):
+            # Another process may have written it while this one waited for the lock
+            if GalleryIndexService._load_current(path, kind):
+                return GalleryIndexService._index
+            return GalleryIndexService._build_and_save(path, kind)
+
+    @staticmethod
+    def _build_and_save(path, kind):
+        from models.embedding import Embedding
+
+        index = GalleryIndexService.build(Embedding.get_all(), kind)
+        GalleryIndexService._save(index, path)
+        print(f"Gallery index ({index.kind}) built with {len(index)} embeddings")
+        return index
+
+    @staticmethod
+    def get_index():
+        """
+        Return the shared index, reloading it if another process replaced the file, or
+        building it from MongoDB on first use
+        """
+        # Imported lazily so the index classes above work (e.g. in benchmarks) without a database
+        from config import GALLERY_INDEX_TYPE, GALLERY_INDEX_PATH
+
+        with GalleryIndexService._lock:
+            return GalleryIndexService._ensure_index(GALLERY_INDEX_PATH, GALLERY_INDEX_TYPE)
+
+    @staticmethod
+    def add_student(student_id, embeddings):
+        """
+        Add (or replace) one student's embeddings and persist the index
+
+        Applied to the latest file under the file lock, so students enrolled through
+        other processes since this one last read it are kept.
+        """
+        from config import GALLERY_INDEX_TYPE, GALLERY_INDEX_PATH
+
+        vectors = MatchingService.extract_vectors(embeddings)
+        with GalleryIndexService._lock, _file_lock(GALLERY_INDEX_PATH + ".lock"):
+            index = GalleryIndexService._ensure_index(GALLERY_INDEX_PATH, GALLERY_INDEX_TYPE, locked=True)
+            index.remove(str(student_id))
+            if vectors:
+                index.add(np.vstack(vectors), [str(student_id)] * len(vectors))
+            GalleryIndexService._save(index, GALLERY_INDEX_PATH)
+            if getattr(index, "needs_retrain", False):
+                GalleryIndexService._schedule_retrain(index)
+
+    @staticmethod
+    def _schedule_retrain(index):
+        """
+        Retrain a copy of the index on a background thread; enrolments keep appending
+        to the current index meanwhile. Caller holds _lock.
+        """
+        if GalleryIndexService._retrainer is not None:
+            return
+        GalleryIndexService._retrainer = threading.Thread(
+            target=GalleryIndexService._retrain, args=(copy.deepcopy(index),),
+            name="gallery-index-retrain", daemon=True
+        )
+        GalleryIndexService._retrainer.start()
+
+    @staticmethod
+    def _retrain(index):
+        try:
+            started = len(index)
+            if index.train():
+                GalleryIndexService.replace_index(index, retrained=True)
+                print(f"Gallery index retrained with {len(index.centroids)} buckets over {started} embeddings")
+        except Exception as e:
+            print(f"Error retraining gallery index: {str(e)}")
+        finally:
+            with GalleryIndexService._lock:
+                GalleryIndexService._retrainer = None
+
+    @staticmethod
+    def replace_index(index, retrained=False):
+        """
+        Persist a freshly built index (e.g. after a bulk import); running servers
+        reload it on their next query
+
+        Args:
+            index: The new index
+            retrained: index is a retrained copy of the current one; the current index
+                       adopts its buckets, so enrolments made since the copy are kept
+        """
+        from config import GALLERY_INDEX_TYPE, GALLERY_INDEX_PATH
+
+        with GalleryIndexService._lock, _file_lock(GALLERY_INDEX_PATH + ".lock"):
+            if retrained:
+                current = GalleryIndexService._ensure_index(GALLERY_INDEX_PATH, GALLERY_INDEX_TYPE, locked=True)
+                if current.kind != index.kind:
+                    return
+                current.adopt_buckets(index)
+                index = current
+            GalleryIndexService._save(index, GALLERY_INDEX_PATH)
+
+    @staticmethod
+    def student_distance_matrix(face_embeddings, metric="cosine"):
+        """
+        Face x student distances for the students the index finds near any face
+
+        Returns:
+            (student_ids, F x S distance matrix)
+        """
+        from config import GALLERY_INDEX_NEIGHBOURS
+
+        index = GalleryIndexService.get_index()
+        with GalleryIndexService._lock:
+            return index.student_distance_matrix(face_embeddings, GALLERY_INDEX_NEIGHBOURS, metric)
+
+    @staticmethod
+    def distances_to_students(face_embeddings, student_ids, metric="cosine"):
+        """
+        Face x student distances to the given students (inf for students not indexed)
+        """
+        index = GalleryIndexService.get_index()
+        with GalleryIndexService._lock:
+            return index.distances_to_students(face_embeddings, student_ids, metric)
@@ -0,0 +1,372 @@
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its limit"""
+
+
+class JobQueue:
+    """
+    Persistent recognition job queue with a bounded worker pool
+
+    Jobs (including the uploaded image bytes) live in a local SQLite database, so a
+    restart loses nothing: a job that was running when its process died keeps a lease
+    that expires, after which any worker claims it again. Each claim is numbered by
+    the job's attempt count, and a runner only renews the lease, writes results and
+    sends the webhook while that attempt is still the job's current one, so a job
+    claimed again never finishes twice.
+
+    Workers are threads in this process; they share the loaded face models, and
+    TensorFlow releases the GIL during inference. A fixed pool size and a cap on queued
+    jobs keep latency predictable under load instead of letting request threads pile up.
+
+    Job states: queued -> running -> done | failed
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            division TEXT,
+            webhook_url TEXT,
+            image BLOB,
+            events TEXT NOT NULL DEFAULT '[]',
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_until REAL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+    """
+
+    def __init__(self, db_path, handler, workers=2, max_queued=100, max_attempts=3,
+                 lease_seconds=300, retention_seconds=86400, webhook_timeout=5, webhook_hosts=()):
+        """
+        Args:
+            db_path: SQLite database file
+            handler: handler(image_bytes, division) -> iterator of event dicts; the last
+                     event is stored as the job's result
+            workers: Number of worker threads
+            max_queued: Jobs allowed to wait before submit raises QueueFullError
+            max_attempts: Runs (including runs lost to a restart) before a job fails
+            lease_seconds: Lease of a running job; its runner renews it while the job
+                           runs, so it only expires when the runner's process died
+            retention_seconds: How long finished jobs stay queryable
+            webhook_timeout: Seconds per webhook delivery attempt
+            webhook_hosts: Host names webhooks may be sent to (empty: none)
+        """
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.webhook_timeout = webhook_timeout
+        self.webhook_hosts = {host.lower() for host in webhook_hosts}
+
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._stopped = False
+
+        with self._connection() as conn:
+            # WAL lets status reads proceed while a worker is writing progress
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def shared():
+        """
+        The process-wide queue, configured from config and running recognition jobs
+        """
+        with JobQueue._shared_lock:
+            if JobQueue._shared is None:
+                from config import (JOBS_DB_PATH, JOB_WORKERS, JOB_QUEUE_LIMIT, JOB_MAX_ATTEMPTS,
+                                    JOB_LEASE_SECONDS, JOB_RETENTION_SECONDS, WEBHOOK_TIMEOUT_SECONDS,
+                                    WEBHOOK_ALLOWED_HOSTS)
+                from services.recognition_service import RecognitionService
+                from utils.image_utils import decode_image
+
+                def recognize(image_bytes, division):
+                    group_image = decode_image(image_bytes)
+                    if group_image is None:
+                        raise ValueError("Failed to read image")
+                    return RecognitionService.iter_recognition_events(group_image, division)
+
+                queue = JobQueue(JOBS_DB_PATH, recognize, JOB_WORKERS, JOB_QUEUE_LIMIT, JOB_MAX_ATTEMPTS,
+                                 JOB_LEASE_SECONDS, JOB_RETENTION_SECONDS, WEBHOOK_TIMEOUT_SECONDS,
+                                 WEBHOOK_ALLOWED_HOSTS)
+                queue.start()
+                JobQueue._shared = queue
+            return JobQueue._shared
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """
+        A connection that commits on success, rolls back on error and is always closed
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def start(self):
+        """
+        Start the worker threads; jobs left over from a previous run are picked up
+        """
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"recognition-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stopped = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def webhook_allowed(self, webhook_url):
+        """
+        Whether a webhook URL is an http(s) URL on one of the configured hosts; the
+        server POSTs to it, so arbitrary URLs would let callers reach internal services
+        """
+        try:
+            parts = urlsplit(webhook_url)
+        except ValueError:
+            return False
+        return parts.scheme in ("http", "https") and (parts.hostname or "").lower() in self.webhook_hosts
+
+    def submit(self, image_bytes, division=None, webhook_url=None):
+        """
+        Queue a recognition job
+
+        Returns:
+            Job ID
+
+        Raises:
+            QueueFullError: if max_queued jobs are already waiting
+        """
+        job_id = uuid.uuid4().hex
+        with self._connection() as conn:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFullError(f"{queued} jobs already queued")
+            conn.execute(
+                "INSERT INTO jobs (id, status, division, webhook_url, image, created_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, division, webhook_url, sqlite3.Binary(image_bytes), time.time())
+            )
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id, after=0):
+        """
+        Current state of a job
+
+        Args:
+            job_id: ID returned by submit
+            after: Only return events after this many (for incremental polling)
+
+        Returns:
+            Dict with status, events so far, result and timings, or None if unknown
+        """
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT id, status, division, events, result, error, attempts, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row["status"] == "queued":
+                position = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (row["created_at"],)
+                ).fetchone()[0]
+
+        events = json.loads(row["events"])
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "division": row["division"],
+            "queue_position": position,
+            "events": events[after:],
+            "next_event": len(events),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"]
+        }
+
+    def stats(self):
+        """Job counts per status"""
+        with self._connection() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def _claim(self):
+        """
+        Atomically take the oldest queued job, or a running job whose lease has expired
+        (its worker died). BEGIN IMMEDIATE serialises claims across processes.
+
+        Returns:
+            The job, whose attempts (after this claim) identifies this run, or None
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, division, webhook_url, image, attempts FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            if row["attempts"] >= self.max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, image = NULL, finished_at = ? WHERE id = ?",
+                    (f"Gave up after {row['attempts']} attempts", now, row["id"])
+                )
+                conn.execute("COMMIT")
+                return self._claim()
+
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, events = '[]', "
+                "lease_until = ?, started_at = ? WHERE id = ?",
+                (now + self.lease_seconds, now, row["id"])
+            )
+            conn.execute("COMMIT")
+            job = dict(row)
+            job["attempts"] += 1
+            return job
+        finally:
+            conn.close()
+
+    def _work(self):
+        while not self._stopped:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"Job queue error: {str(e)}")
+                job = None
+
+            if job is None:
+                self._purge_expired()
+                with self._wakeup:
+                    # Also re-check periodically for expired leases and other processes' jobs
+                    self._wakeup.wait(timeout=5)
+                continue
+
+            self._run(job)
+
+    def _update_owned(self, job_id, attempt, assignments, params):
+        """
+        Update a running job only if this runner's claim is still the current one
+
+        Returns:
+            False if the job was claimed again (or finished) by another runner
+        """
+        with self._connection() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND status = 'running' AND attempts = ?",
+                (*params, job_id, attempt)
+            )
+            return cursor.rowcount == 1
+
+    def _heartbeat(self, job_id, attempt, stop):
+        """
+        Renew the lease while the handler is in a step that emits no events (detection,
+        embedding), so a slow job is not taken for abandoned
+        """
+        while not stop.wait(max(1.0, self.lease_seconds / 3)):
+            try:
+                if not self._update_owned(job_id, attempt, "lease_until = ?", (time.time() + self.lease_seconds,)):
+                    return
+            except sqlite3.Error as e:
+                print(f"Lease renewal for job {job_id} failed: {str(e)}")
+
+    def _run(self, job):
+        job_id, attempt = job["id"], job["attempts"]
+        events = []
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, attempt, stop), daemon=True).start()
+        try:
+            owned = True
+            for event in self.handler(bytes(job["image"]), job["division"]):
+                events.append(event)
+                # Each event is persisted (and the lease renewed) so pollers see partial results
+                owned = self._update_owned(job_id, attempt, "events = ?, lease_until = ?",
+                                           (json.dumps(events), time.time() + self.lease_seconds))
+                if not owned:
+                    break
+
+            if owned:
+                result = events[-1] if events else None
+                owned = self._update_owned(job_id, attempt, "status = 'done', result = ?, image = NULL, finished_at = ?",
+                                           (json.dumps(result), time.time()))
+        except Exception as e:
+            print(f"Recognition job {job_id} failed: {str(e)}")
+            owned = self._update_owned(job_id, attempt, "status = 'failed', error = ?, image = NULL, finished_at = ?",
+                                       (str(e), time.time()))
+        finally:
+            stop.set()
+
+        if not owned:
+            print(f"Recognition job {job_id} was claimed by another runner; this run's result is dropped")
+            return
+        if job["webhook_url"]:
+            self._notify(job["webhook_url"], self.get(job_id))
+
+    def _notify(self, webhook_url, job, retries=3):
+        """
+        POST the finished job to its webhook, retrying with backoff
+        """
+        if not self.webhook_allowed(webhook_url):
+            print(f"Webhook for job {job['job_id']} skipped: host not in WEBHOOK_ALLOWED_HOSTS")
+            return
+        payload = {key: job[key] for key in ("job_id", "status", "result", "error", "finished_at")}
+        for attempt in range(retries):
+            try:
+                # Redirects are not followed, so an allowed host cannot bounce the POST elsewhere
+                response = requests.post(webhook_url, json=payload, timeout=self.webhook_timeout,
+                                         allow_redirects=False)
+                if response.status_code < 500:
+                    return
+                print(f"Webhook for job {job['job_id']} returned {response.status_code}")
+            except requests.RequestException as e:
+                print(f"Webhook for job {job['job_id']} failed: {str(e)}")
+            time.sleep(2 ** attempt)
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.retention_seconds
+        try:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+        except sqlite3.Error as e:
+            print(f"Job queue cleanup error: {str(e)}")
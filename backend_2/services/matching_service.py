@@ -0,0 +1,325 @@
+import numpy as np
+from utils.embedding_format import unpack_embeddings, to_vector_matrix
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy is optional; fall back to the NumPy solver below
+    linear_sum_assignment = None
+
+# _FORBIDDEN_COST and _min_cost_assignment are deliberately identical to the copy in
+# backend/gallery.py; each backend is deployed on its own, so keep both in sync.
+# Finite stand-in for "forbidden" pairs so the solvers never see inf
+_FORBIDDEN_COST = 1e6
+
+
+def _min_cost_assignment(cost):
+    """
+    Hungarian algorithm (shortest augmenting paths) for an n x m cost matrix with n <= m
+
+    The inner relaxation runs over all columns at once, so a 150 x 350 problem
+    takes 150 augmentations of vectorised NumPy work.
+
+    Returns:
+        (row_indices, col_indices) of the optimal assignment
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    col_owner = np.zeros(m + 1, dtype=np.int64)  # 1-based row owning each column, 0 = free
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for row in range(1, n + 1):
+        col_owner[0] = row
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+
+        while True:
+            used[j0] = True
+            i0 = col_owner[j0]
+            reduced = np.r_[np.inf, cost[i0 - 1] - u[i0] - v[1:]]
+
+            improve = ~used & (reduced < minv)
+            minv[improve] = reduced[improve]
+            way[improve] = j0
+
+            candidates = np.where(used, np.inf, minv)
+            j1 = int(np.argmin(candidates))
+            delta = candidates[j1]
+
+            u[col_owner[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+
+            j0 = j1
+            if col_owner[j0] == 0:
+                break
+
+        # Flip the augmenting path
+        while j0:
+            j1 = way[j0]
+            col_owner[j0] = col_owner[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(col_owner[1:])
+    rows = col_owner[1:][cols] - 1
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+class Gallery:
+    """
+    Packed gallery of stored embeddings
+
+    Holds a G x D float32 matrix with one row per stored embedding, a unit-normalised
+    copy for cosine matching, squared norms for euclidean matching and the student ID
+    of every row. Rows belonging to the same student are contiguous. student_info keeps
+    the display fields denormalised onto embedding documents, when they are present.
+    """
+
+    def __init__(self, vectors, row_student_ids):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.normalized = MatchingService.normalize_rows(self.vectors)
+        self.sq_norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        self.row_student_ids = np.asarray(row_student_ids, dtype=object)
+
+        # Start offset of every student's block of rows, for per-student reductions
+        if len(self.row_student_ids):
+            starts = np.flatnonzero(np.r_[True, self.row_student_ids[1:] != self.row_student_ids[:-1]])
+        else:
+            starts = np.zeros(0, dtype=np.int64)
+        self.student_offsets = starts
+        self.student_ids = [str(student_id) for student_id in self.row_student_ids[starts]]
+        self.student_info = {}
+
+    def __len__(self):
+        return len(self.row_student_ids)
+
+    @classmethod
+    def from_embedding_docs(cls, embedding_docs):
+        """
+        Build a gallery from documents of the embeddings collection
+
+        Args:
+            embedding_docs: Iterable of embedding documents
+
+        Returns:
+            Gallery instance
+        """
+        vectors_by_student = {}
+        student_info = {}
+        for emb_doc in embedding_docs:
+            vectors = MatchingService.document_vectors(emb_doc)
+            if len(vectors):
+                student_id = str(emb_doc['student_id'])
+                vectors_by_student.setdefault(student_id, []).extend(vectors)
+                if emb_doc.get('roll_no') is not None and 'student_name' in emb_doc:
+                    student_info[student_id] = {
+                        'name': emb_doc['student_name'],
+                        'roll_no': emb_doc['roll_no'],
+                        'division': emb_doc.get('division')
+                    }
+
+        vectors = []
+        row_student_ids = []
+        for student_id, student_vectors in vectors_by_student.items():
+            vectors.extend(student_vectors)
+            row_student_ids.extend([student_id] * len(student_vectors))
+
+        if not vectors:
+            return cls(np.zeros((0, 0), dtype=np.float32), [])
+        gallery = cls(np.vstack(vectors), row_student_ids)
+        gallery.student_info = student_info
+        return gallery
+
+
+class MatchingService:
+    @staticmethod
+    def normalize_rows(matrix):
+        """
+        Scale every row of a matrix to unit length (zero rows stay zero)
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.size == 0:
+            return matrix.copy()
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+    @staticmethod
+    def extract_vectors(stored_embeddings):
+        """
+        Flatten the embedding structures stored on a document into plain vectors
+
+        Handles raw lists/arrays of floats as well as DeepFace's represent output
+        (a dict, or a list of dicts, with an 'embedding' key).
+
+        Returns:
+            List of float32 numpy arrays
+        """
+        return list(to_vector_matrix(stored_embeddings))
+
+    @staticmethod
+    def document_vectors(emb_doc):
+        """
+        Vectors of an embedding document: a zero-copy view of the packed 'vectors'
+        blob, or the legacy nested 'embeddings' lists for older documents
+
+        Returns:
+            N x D float32 matrix
+        """
+        if emb_doc.get('vectors') is not None:
+            _, vectors = unpack_embeddings(emb_doc['vectors'])
+            return vectors
+        return to_vector_matrix(emb_doc.get('embeddings', []))
+
+    @staticmethod
+    def distance_matrix(face_embeddings, gallery, metric="cosine"):
+        """
+        Distances between every face and every gallery row from one matrix multiply
+
+        Args:
+            face_embeddings: F x D matrix (or list) of face embeddings
+            gallery: Gallery instance
+            metric: Distance metric to use (cosine or euclidean)
+
+        Returns:
+            F x G float32 matrix of distances
+        """
+        faces = np.atleast_2d(np.asarray(face_embeddings, dtype=np.float32))
+        if len(gallery) == 0 or faces.size == 0:
+            return np.zeros((len(faces), len(gallery)), dtype=np.float32)
+
+        if metric == "cosine":
+            faces_norm = MatchingService.normalize_rows(faces)
+            distances = 1.0 - faces_norm @ gallery.normalized.T
+            # Cosine distance of unit vectors lies in [0, 1] up to rounding
+            return np.clip(distances, 0.0, 1.0)
+
+        # Euclidean: |a - b|^2 = |a|^2 + |b|^2 - 2 a.b
+        face_sq_norms = np.einsum('ij,ij->i', faces, faces)
+        sq_distances = face_sq_norms[:, None] + gallery.sq_norms[None, :] - 2.0 * (faces @ gallery.vectors.T)
+        return np.sqrt(np.maximum(sq_distances, 0.0))
+
+    @staticmethod
+    def student_distance_matrix(face_embeddings, gallery, metric="cosine"):
+        """
+        Distance from every face to every student, taking each student's closest stored embedding
+
+        Returns:
+            F x S float32 matrix, columns ordered as gallery.student_ids
+        """
+        distances = MatchingService.distance_matrix(face_embeddings, gallery, metric)
+        if distances.shape[1] == 0:
+            return distances
+        return np.minimum.reduceat(distances, gallery.student_offsets, axis=1)
+
+    @staticmethod
+    def assign_faces(student_distances, threshold):
+        """
+        Jointly assign faces to students, one student per face at most
+
+        Solves the min-cost matching over the whole F x S distance matrix. Every face
+        may also stay unassigned at a cost equal to the threshold, so a pair is only
+        matched when that lowers the total cost, and pairs at or above the threshold
+        are never matched.
+
+        Args:
+            student_distances: F x S matrix from student_distance_matrix
+            threshold: Distance gate for a match
+
+        Returns:
+            List with one dict per face: student_index (or None), distance and
+            margin (runner-up student distance minus the face's best distance)
+        """
+        distances = np.asarray(student_distances, dtype=np.float64)
+        num_faces, num_students = distances.shape
+
+        # Runner-up margins from the two smallest distances of every row
+        if num_students >= 2:
+            two_best = np.partition(distances, 1, axis=1)[:, :2]
+        elif num_students == 1:
+            two_best = np.c_[distances, np.full(num_faces, np.inf)]
+        else:
+            two_best = np.full((num_faces, 2), np.inf)
+
+        assignments = [
+            {'student_index': None, 'distance': float(two_best[i, 0]), 'margin': float(two_best[i, 1] - two_best[i, 0])}
+            for i in range(num_faces)
+        ]
+        if num_faces == 0 or num_students == 0:
+            return assignments
+
+        # F x (S + F) cost: real students, then one private "unassigned" column per face
+        cost = np.full((num_faces, num_students + num_faces), _FORBIDDEN_COST)
+        cost[:, :num_students] = np.where(distances < threshold, distances, _FORBIDDEN_COST)
+        cost[np.arange(num_faces), num_students + np.arange(num_faces)] = threshold
+
+        if linear_sum_assignment is not None:
+            rows, cols = linear_sum_assignment(cost)
+        else:
+            rows, cols = _min_cost_assignment(cost)
+
+        for face_idx, student_idx in zip(rows, cols):
+            if student_idx >= num_students or distances[face_idx, student_idx] >= threshold:
+                continue
+            face_distances = distances[face_idx]
+            others = np.delete(face_distances, student_idx)
+            runner_up = float(others.min()) if others.size else float('inf')
+            assignments[face_idx] = {
+                'student_index': int(student_idx),
+                'distance': float(face_distances[student_idx]),
+                'margin': runner_up - float(face_distances[student_idx])
+            }
+        return assignments
+
+    @staticmethod
+    def merge_duplicate_faces(face_embeddings, photo_indices, threshold, metric="cosine"):
+        """
+        Group faces from overlapping photos that show the same person
+
+        Pairs are merged closest first (single linkage) while their distance is below
+        the threshold. Two faces from the same photo are always different people, so
+        a merge that would put two faces of one photo in a group is skipped.
+
+        Args:
+            face_embeddings: F x D matrix of face embeddings
+            photo_indices: Photo each face was found in
+            threshold: Distance below which two faces count as the same person
+            metric: Distance metric to use (cosine or euclidean)
+
+        Returns:
+            List of groups, each a sorted list of face indices
+        """
+        photo_indices = np.asarray(photo_indices)
+        num_faces = len(photo_indices)
+        if num_faces == 0:
+            return []
+
+        faces = Gallery(face_embeddings, np.arange(num_faces))
+        distances = MatchingService.distance_matrix(face_embeddings, faces, metric)
+
+        # Candidate pairs: different photos, close enough, closest first
+        rows, cols = np.triu_indices(num_faces, k=1)
+        keep = (photo_indices[rows] != photo_indices[cols]) & (distances[rows, cols] < threshold)
+        rows, cols = rows[keep], cols[keep]
+        order = np.argsort(distances[rows, cols], kind='stable')
+
+        parent = list(range(num_faces))
+        photos = [{int(p)} for p in photo_indices]
+
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j in zip(rows[order], cols[order]):
+            a, b = root(int(i)), root(int(j))
+            if a != b and not (photos[a] & photos[b]):
+                parent[b] = a
+                photos[a] |= photos[b]
+
+        groups = {}
+        for i in range(num_faces):
+            groups.setdefault(root(i), []).append(i)
+        return sorted(groups.values())
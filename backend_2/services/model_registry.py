@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from deepface import DeepFace
+from config import (FACE_RECOGNITION_MODEL, DEEPFACE_MODEL, INFERENCE_THREADS, GROUP_DETECTOR, YUNET_MODEL_PATH,
+                    YUNET_SCORE_THRESHOLD, DETECTION_NMS_IOU)
+from services.onnx_embedder import OnnxFaceNet
+
+
+class ModelRegistry:
+    """
+    Loads the face models once per process and hands the shared instances to services
+
+    DeepFace keeps models it has built in its own cache, so building FaceNet here and
+    running one warm-up inference means no request pays the model-load cost. The Haar
+    cascade is parsed from XML once instead of on every detect_face call. When
+    FACE_RECOGNITION_MODEL names an ONNX variant, the exported graph is loaded instead
+    of building FaceNet in TensorFlow.
+    """
+
+    _lock = threading.Lock()
+    _cascade_lock = threading.Lock()
+    _face_cascade = None
+    _eye_cascade = None
+    _thread_local = threading.local()
+    _facenet = None
+    _state = "not_started"  # not_started -> loading -> ready | failed
+    _error = None
+    _timings = {}
+
+    @staticmethod
+    def initialize(background=False, threads=INFERENCE_THREADS):
+        """
+        Load and warm up every model
+
+        Args:
+            background: Run in a daemon thread so the app can start serving /health at once
+            threads: TensorFlow intra-op CPU threads (see configure_threads)
+        """
+        with ModelRegistry._lock:
+            if ModelRegistry._state in ("loading", "ready"):
+                return
+            ModelRegistry._state = "loading"
+
+        if background:
+            threading.Thread(target=ModelRegistry._load, args=(threads,), name="model-warmup", daemon=True).start()
+        else:
+            ModelRegistry._load(threads)
+
+    @staticmethod
+    def configure_threads(threads=INFERENCE_THREADS):
+        """
+        Set how many CPU threads TensorFlow uses inside one op (matrix multiplies,
+        convolutions). Only takes effect before TensorFlow runs its first op.
+
+        Args:
+            threads: Intra-op thread count, or None to keep TensorFlow's default
+        """
+        if not threads:
+            return
+        try:
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            # A FaceNet forward pass is one chain of ops, so running ops side by side gains little
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except RuntimeError as e:
+            print(f"Could not set inference threads (TensorFlow already initialised): {str(e)}")
+
+    @staticmethod
+    def _load(threads=INFERENCE_THREADS):
+        try:
+            ModelRegistry.configure_threads(threads)
+
+            start = time.time()
+            ModelRegistry._face_cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+            )
+            ModelRegistry._eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+            ModelRegistry._timings['face_cascade'] = round(time.time() - start, 3)
+
+            if GROUP_DETECTOR == "yunet":
+                # Fails start-up early when the detector file is missing
+                start = time.time()
+                ModelRegistry.get_thread_yunet()
+                ModelRegistry._timings['yunet_load'] = round(time.time() - start, 3)
+
+            start = time.time()
+            ModelRegistry._facenet = ModelRegistry._build_facenet()
+            ModelRegistry._timings['facenet_load'] = round(time.time() - start, 3)
+
+            # One inference through each path so graph building and detector setup happen now
+            start = time.time()
+            blank = np.zeros((160, 160, 3), dtype=np.uint8)
+            if OnnxFaceNet.is_onnx_model():
+                ModelRegistry._facenet(np.zeros((1, 160, 160, 3), dtype=np.float32))
+            else:
+                DeepFace.represent(img_path=blank, model_name=DEEPFACE_MODEL,
+                                   detector_backend="skip", enforce_detection=False)
+            DeepFace.extract_faces(img_path=blank, detector_backend="opencv", enforce_detection=False)
+            ModelRegistry._timings['warm_up'] = round(time.time() - start, 3)
+
+            ModelRegistry._state = "ready"
+            print(f"Models ready: {ModelRegistry._timings}")
+        except Exception as e:
+            ModelRegistry._state = "failed"
+            ModelRegistry._error = str(e)
+            print(f"Model warm-up failed: {str(e)}")
+
+    @staticmethod
+    def is_ready():
+        return ModelRegistry._state == "ready"
+
+    @staticmethod
+    def status():
+        """
+        Readiness details for the /health endpoint
+        """
+        status = {
+            "state": ModelRegistry._state,
+            "face_model": FACE_RECOGNITION_MODEL,
+            "runtime": getattr(ModelRegistry._facenet, "runtime", "tensorflow"),
+            "inference_threads": INFERENCE_THREADS,
+            "load_seconds": dict(ModelRegistry._timings)
+        }
+        if ModelRegistry._error:
+            status["error"] = ModelRegistry._error
+        return status
+
+    @staticmethod
+    def _build_facenet():
+        """
+        DeepFace's TensorFlow FaceNet, or the exported ONNX graph FACE_RECOGNITION_MODEL names
+        """
+        if OnnxFaceNet.is_onnx_model():
+            return OnnxFaceNet(OnnxFaceNet.model_path())
+        return DeepFace.build_model(DEEPFACE_MODEL)
+
+    @staticmethod
+    def get_facenet():
+        """
+        The shared FaceNet model (loaded on first use if initialize() was not called)
+        """
+        if ModelRegistry._facenet is None:
+            ModelRegistry._facenet = ModelRegistry._build_facenet()
+        return ModelRegistry._facenet
+
+    @staticmethod
+    def get_face_cascade():
+        """
+        The shared Haar cascade (loaded on first use if initialize() was not called)
+        """
+        if ModelRegistry._face_cascade is None:
+            with ModelRegistry._lock:
+                if ModelRegistry._face_cascade is None:
+                    ModelRegistry._face_cascade = cv2.CascadeClassifier(
+                        cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+                    )
+        return ModelRegistry._face_cascade
+
+    @staticmethod
+    def get_thread_face_cascade():
+        """
+        A face cascade owned by the calling thread, for detectors that run many
+        detections in parallel instead of queueing on the shared one (parsed once
+        per thread, so use it from long-lived pool threads)
+        """
+        cascade = getattr(ModelRegistry._thread_local, 'face_cascade', None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+            ModelRegistry._thread_local.face_cascade = cascade
+        return cascade
+
+    @staticmethod
+    def get_thread_yunet():
+        """
+        A YuNet face detector (cv2.FaceDetectorYN) owned by the calling thread
+
+        The detector keeps its input size and buffers between calls, so it cannot be
+        shared between threads; the model is small and each thread loads it once.
+        """
+        detector = getattr(ModelRegistry._thread_local, 'yunet', None)
+        if detector is None:
+            if not os.path.exists(YUNET_MODEL_PATH):
+                raise FileNotFoundError(f"{YUNET_MODEL_PATH} not found; download face_detection_yunet_2023mar.onnx "
+                                        f"from OpenCV's model zoo (see config.py)")
+            detector = cv2.FaceDetectorYN.create(YUNET_MODEL_PATH, "", (320, 320), YUNET_SCORE_THRESHOLD,
+                                                 DETECTION_NMS_IOU)
+            ModelRegistry._thread_local.yunet = detector
+        return detector
+
+    @staticmethod
+    def get_eye_cascade():
+        """
+        The shared eye cascade used to level enrolment crops
+        """
+        if ModelRegistry._eye_cascade is None:
+            with ModelRegistry._lock:
+                if ModelRegistry._eye_cascade is None:
+                    ModelRegistry._eye_cascade = cv2.CascadeClassifier(
+                        cv2.data.haarcascades + 'haarcascade_eye.xml'
+                    )
+        return ModelRegistry._eye_cascade
+
+    @staticmethod
+    def detect_eyes(gray, scale_factor=1.1, min_neighbors=10):
+        """
+        Run the shared eye cascade on a grayscale face crop (serialised like detect_faces)
+        """
+        cascade = ModelRegistry.get_eye_cascade()
+        with ModelRegistry._cascade_lock:
+            return cascade.detectMultiScale(gray, scale_factor, min_neighbors)
+
+    @staticmethod
+    def detect_faces(gray, scale_factor=1.3, min_neighbors=5):
+        """
+        Run the shared cascade on a grayscale image
+
+        A CascadeClassifier instance is not safe to use from several threads at once,
+        so calls are serialised; single-face upload checks take a few milliseconds.
+        """
+        cascade = ModelRegistry.get_face_cascade()
+        with ModelRegistry._cascade_lock:
+            return cascade.detectMultiScale(gray, scale_factor, min_neighbors)
+
+    @staticmethod
+    def detect_faces_prepared(prepared, scale_factor=1.3, min_neighbors=5):
+        """
+        Run the shared cascade on an image from prepare_image
+
+        Detection runs on the bounded working copy, so its cost does not grow with
+        the upload's resolution. Haar counts shift with scale, so only a single face
+        found there is accepted; no face or several are decided again on the full
+        resolution image.
+
+        Returns:
+            (x, y, w, h) boxes in the original image's coordinates
+        """
+        faces = ModelRegistry.detect_faces(prepared['gray'], scale_factor, min_neighbors)
+        if prepared['scale'] == 1.0:
+            return faces
+        if len(faces) != 1:
+            full_gray = cv2.cvtColor(prepared['image'], cv2.COLOR_BGR2GRAY)
+            return ModelRegistry.detect_faces(full_gray, scale_factor, min_neighbors)
+
+        x, y, w, h = np.asarray(faces[0], dtype=np.float64) / prepared['scale']
+        x, y = min(int(round(x)), prepared['width'] - 1), min(int(round(y)), prepared['height'] - 1)
+        w, h = min(int(round(w)), prepared['width'] - x), min(int(round(h)), prepared['height'] - y)
+        return np.array([[x, y, w, h]])
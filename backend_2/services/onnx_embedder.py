@@ -0,0 +1,96 @@
+import os
+import threading
+import cv2
+import numpy as np
+from config import FACE_RECOGNITION_MODEL, DEEPFACE_MODEL, ONNX_MODEL_FOLDER, ONNX_RUNTIME, INFERENCE_THREADS
+
+try:
+    import onnxruntime
+except ImportError:  # onnxruntime is optional; OpenCV DNN runs the FP32 graph without it
+    onnxruntime = None
+
+
+class OnnxFaceNet:
+    """
+    FaceNet exported to ONNX (scripts/export_onnx.py), run by ONNX Runtime or OpenCV DNN
+
+    Stands in for the DeepFace model ModelRegistry hands out: it has the same
+    input_shape and is called on a preprocessed N x H x W x 3 batch, so BatchEmbedder
+    works with either. The graph is exported from the weights DeepFace loads, so FP32
+    embeddings match the ones already stored; the INT8 variant trades a small,
+    measured drift (scripts/check_onnx_accuracy.py) for speed and memory. Neither
+    needs TensorFlow to build a model at start-up.
+    """
+
+    def __init__(self, path, runtime=ONNX_RUNTIME, threads=INFERENCE_THREADS):
+        """
+        Args:
+            path: .onnx file
+            runtime: "onnxruntime", "opencv" or "auto" (onnxruntime when installed)
+            threads: Intra-op CPU threads (None: the runtime's default)
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; export it with scripts/export_onnx.py")
+        if runtime == "auto":
+            runtime = "onnxruntime" if onnxruntime is not None else "opencv"
+        self.path = path
+        self.runtime = runtime
+
+        if runtime == "onnxruntime":
+            if onnxruntime is None:
+                raise ImportError("ONNX_RUNTIME is 'onnxruntime' but onnxruntime is not installed")
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if threads:
+                options.intra_op_num_threads = threads
+            # A FaceNet forward pass is one chain of ops, so running ops side by side gains little
+            options.inter_op_num_threads = 1
+            self.session = onnxruntime.InferenceSession(path, sess_options=options,
+                                                        providers=["CPUExecutionProvider"])
+            model_input = self.session.get_inputs()[0]
+            self.input_name = model_input.name
+            self.input_shape = tuple(model_input.shape[1:3])
+            self.output_shape = self.session.get_outputs()[0].shape[-1]
+        elif runtime == "opencv":
+            if path.endswith("-int8.onnx"):
+                # OpenCV DNN mis-reads the quantised (QDQ) graph instead of failing
+                raise ValueError("OpenCV DNN runs only the FP32 graph; install onnxruntime for the INT8 one")
+            self.net = cv2.dnn.readNetFromONNX(path)
+            self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            if threads:
+                cv2.setNumThreads(threads)
+            # A cv2.dnn.Net keeps per-call state, so forward passes are serialised
+            self._net_lock = threading.Lock()
+            self.input_shape = (160, 160)
+            self.output_shape = None
+        else:
+            raise ValueError(f"Unknown ONNX runtime: {runtime}")
+
+    @staticmethod
+    def is_onnx_model(model_name=FACE_RECOGNITION_MODEL):
+        return "-onnx" in model_name
+
+    @staticmethod
+    def model_path(model_name=FACE_RECOGNITION_MODEL, folder=ONNX_MODEL_FOLDER):
+        """
+        File holding a model variant: "Facenet-onnx" -> Facenet.onnx,
+        "Facenet-onnx-int8" -> Facenet-int8.onnx
+        """
+        base = model_name.split("-onnx")[0] if OnnxFaceNet.is_onnx_model(model_name) else DEEPFACE_MODEL
+        suffix = "-int8" if model_name.endswith("-int8") else ""
+        return os.path.join(folder, f"{base}{suffix}.onnx")
+
+    def __call__(self, batch, training=False):
+        """
+        Embeddings of a preprocessed batch (same call as the Keras model)
+
+        Returns:
+            N x D float32 array
+        """
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        if self.runtime == "onnxruntime":
+            return self.session.run(None, {self.input_name: batch})[0]
+        with self._net_lock:
+            self.net.setInput(batch)
+            return self.net.forward().reshape(len(batch), -1)
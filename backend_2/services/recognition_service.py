@@ -1,275 +1,411 @@
-import os
-import uuid
 import numpy as np
-import cv2
-from deepface import DeepFace
-from models.embedding import Embedding
+from concurrent.futures import ThreadPoolExecutor
 from models.student import Student
-from config import FACE_RECOGNITION_MODEL, DISTANCE_METRIC, RECOGNITION_THRESHOLD
+from services.matching_service import MatchingService
+from services.gallery_index import GalleryIndexService
+from services.gallery_cache import GalleryCache
+from services.batch_embedder import BatchEmbedder
+from services.face_detectors import FaceDetectors
+from utils.image_utils import load_image
+from utils.io_metrics import DiskIOMetrics
+from config import (DISTANCE_METRIC, RECOGNITION_THRESHOLD, SESSION_WORKERS,
+                    SESSION_DUPLICATE_THRESHOLD, GROUP_DETECTOR)
 
 class RecognitionService:
     @staticmethod
-    def extract_faces_from_group(group_photo_path):
+    def extract_faces_from_group(group_photo):
         """
         Extract faces from a group photo
         
+        Args:
+            group_photo: Decoded BGR image array (or a path to the photo)
+            
         Returns:
             List of face objects
         """
         try:
             print("Extracting Faces")
-            face_objs = DeepFace.extract_faces(
-                img_path=group_photo_path,
-                enforce_detection=True,
-                detector_backend="opencv"
-            )
-            
-            return face_objs
+            return FaceDetectors.extract_faces(load_image(group_photo), GROUP_DETECTOR)
         except Exception as e:
             print(f"Error extracting faces: {str(e)}")
             return []
     
     @staticmethod
-    def calculate_distance(embedding1, embedding2, metric="cosine"):
+    def student_distance_matrix(face_embeddings, gallery, metric=DISTANCE_METRIC):
         """
-        Calculate distance between two embeddings based on the specified metric
+        Compare all face embeddings against a packed gallery in one batch
         
         Args:
-            embedding1: First embedding vector
-            embedding2: Second embedding vector
+            face_embeddings: F x D matrix (or list) of face embeddings
+            gallery: Gallery built from the stored embedding documents
             metric: Distance metric to use (cosine or euclidean)
             
         Returns:
-            Calculated distance value
+            F x S matrix of distances, columns ordered as gallery.student_ids
         """
-        if metric == "cosine":
-            # Normalize vectors to unit length
-            norm1 = np.linalg.norm(embedding1)
-            norm2 = np.linalg.norm(embedding2)
-            
-            if norm1 == 0 or norm2 == 0:
-                return 1.0  # Maximum distance if either vector is zero
-                
-            embedding1_norm = embedding1 / norm1
-            embedding2_norm = embedding2 / norm2
-            
-            # Calculate cosine similarity
-            cosine_sim = np.dot(embedding1_norm, embedding2_norm)
-            
-            # Convert to distance (1 - similarity)
-            # Ensure distance is between 0 and 1
-            return max(0, min(1, 1 - cosine_sim))
-        else:
-            # Euclidean distance
-            return np.linalg.norm(embedding1 - embedding2)
+        return MatchingService.student_distance_matrix(face_embeddings, gallery, metric)
     
     @staticmethod
-    def compare_embedding_vectors(face_embedding, stored_embeddings, metric=DISTANCE_METRIC):
+    def candidate_distances(face_embeddings, division=None):
         """
-        Compare a single face embedding against a set of stored embeddings
-        
+        Distances from faces to the students they could be
+
         Args:
-            face_embedding: Embedding vector for a face from the group photo
-            stored_embeddings: List of stored embeddings for a student
-            metric: Distance metric to use
-            
+            face_embeddings: F x D matrix of face embeddings
+            division: Optional division to limit the candidates to
+
         Returns:
-            (match_found, distance) - Boolean indicating if match was found, and the distance
+            (student_ids, F x S distance matrix, known student fields)
         """
-        # Convert stored embeddings back to numpy arrays if they're lists
-        processed_stored_embeddings = []
-        for emb in stored_embeddings:
-            if isinstance(emb, list):
-                processed_stored_embeddings.append(np.array(emb))
-            else:
-                processed_stored_embeddings.append(emb)
-        
-        # Compare against each stored embedding
-        min_distance = float('inf')
-        match_found = False
+        if division:
+            # A single division is small enough to compare exactly against every embedding;
+            # its packed gallery comes from the in-process cache, not a MongoDB query
+            gallery = GalleryCache.shared().get(division)
+            print(f"Gallery has {len(gallery)} embeddings for {len(gallery.student_ids)} students")
+
+            # F x S distances: every face against every student's closest stored embedding
+            student_distances = RecognitionService.student_distance_matrix(face_embeddings, gallery)
+            return gallery.student_ids, student_distances, gallery.student_info
+
+        # Institution-wide: shortlist candidate students through the gallery index
+        student_ids, student_distances = GalleryIndexService.student_distance_matrix(
+            face_embeddings, DISTANCE_METRIC
+        )
+        print(f"Gallery index shortlisted {len(student_ids)} candidate students")
+        return student_ids, student_distances, {}
+    
+    @staticmethod
+    def resolve_students(student_ids, known_students=None):
+        """
+        Look up display fields for many students with at most one query
         
-        for stored_emb in processed_stored_embeddings:
-            # Calculate distance using proper metric calculation
-            distance = RecognitionService.calculate_distance(face_embedding, stored_emb, metric)
-            
-            # Update minimum distance
-            if distance < min_distance:
-                min_distance = distance
+        Args:
+            student_ids: IDs of the matched students
+            known_students: Optional dict of student ID -> fields already denormalised
+                            on the embedding documents; only the rest are queried
             
-            # Check if this is a match
-            if distance < RECOGNITION_THRESHOLD:
-                match_found = True
-                break
+        Returns:
+            Dict of student ID -> {'name', 'roll_no', 'division'}
+        """
+        known_students = known_students or {}
+        students = {sid: known_students[sid] for sid in student_ids if sid in known_students}
+        missing = [sid for sid in student_ids if sid not in students]
         
-        return match_found, min_distance
+        if missing:
+            students.update(Student.get_many(missing, {"name": 1, "roll_no": 1, "division": 1}))
+        return students
     
     @staticmethod
-    def represent_face(face_img, enforce_detection=False):
+    def nearest_students(student_ids, distances, first_index, max_distance, known_students):
         """
-        Generate face embedding from a face image
-        
+        Each face's nearest student on its own, before faces compete for students
+
         Args:
-            face_img: Face image array
-            enforce_detection: Whether to enforce face detection
-            
+            student_ids: Candidate student IDs, the columns of distances
+            distances: Distances of consecutive faces of the photo to the candidates
+            first_index: Face index of the first row
+            max_distance: Faces with no student closer than this are left out
+            known_students: Student ID -> display fields already at hand; no query is
+                            made for the others
+
         Returns:
-            Face embedding vector
+            List of {'face_index', 'student_id', 'distance', 'student'}; student holds
+            the display fields, or None when they are not known yet
         """
-        try:
-            # Save face temporarily to disk (DeepFace needs a file path)
-            temp_face_path = os.path.join('uploads', f"temp_face_{uuid.uuid4()}.jpg")
-            cv2.imwrite(temp_face_path, face_img)
-            
-            # Generate embedding
-            face_embedding_obj = DeepFace.represent(
-                img_path=temp_face_path,
-                model_name=FACE_RECOGNITION_MODEL,
-                enforce_detection=enforce_detection
-            )
-            
-            # Clean up temporary file
-            if os.path.exists(temp_face_path):
-                os.remove(temp_face_path)
+        if not student_ids:
+            return []
+
+        nearest = np.argmin(distances, axis=1)
+        closest = distances[np.arange(len(nearest)), nearest]
+        results = []
+        for i in np.flatnonzero(closest < max_distance):
+            student_id, distance = student_ids[nearest[i]], float(closest[i])
+            student = known_students.get(student_id)
+            results.append({
+                'face_index': first_index + int(i),
+                'student_id': student_id,
+                'distance': round(distance, 4),
+                'student': {
+                    'name': student['name'],
+                    'roll_no': student['roll_no'],
+                    'class': student['division'],
+                    'confidence': round((1.0 - distance) * 100, 1),
+                    'distance': round(distance, 4)
+                } if student else None
+            })
+        return results
+
+    @staticmethod
+    def merge_batch_distances(batches, division=None):
+        """
+        One face x student distance matrix from the candidate distances of each batch
+
+        Within a division every batch has the same candidates. Institution-wide, each
+        batch shortlists its own; the distances of its faces to students only other
+        batches shortlisted are then computed from the index, without another search.
+
+        Args:
+            batches: List of (embeddings, student_ids, distances) per batch, in face order
+            division: Division the candidates were limited to, if any
+
+        Returns:
+            (student_ids, F x S distance matrix)
+        """
+        student_ids = list(dict.fromkeys(sid for _, ids, _ in batches for sid in ids))
+        column = {sid: i for i, sid in enumerate(student_ids)}
+        blocks = []
+        for embeddings, ids, distances in batches:
+            block = np.full((len(embeddings), len(student_ids)), np.inf, dtype=np.float32)
+            block[:, [column[sid] for sid in ids]] = distances
+            shortlisted = set(ids)
+            missing = [sid for sid in student_ids if sid not in shortlisted]
+            # A division's gallery only differs between batches if it changed meanwhile
+            if missing and not division:
+                block[:, [column[sid] for sid in missing]] = GalleryIndexService.distances_to_students(
+                    embeddings, missing, DISTANCE_METRIC
+                )
+            blocks.append(block)
+        return student_ids, np.vstack(blocks)
+
+    @staticmethod
+    def record_avoided_crop_files(faces):
+        """
+        Count the temp files the batched embedding path no longer writes: one JPEG
+        per crop used to be written and read back by DeepFace.represent (counted at
+        the crop's uint8 size; the JPEG was smaller)
+        """
+        for face in faces:
+            size = face.shape[0] * face.shape[1] * 3
+            DiskIOMetrics.record("face_crop", written=size, read=size)
+
+    @staticmethod
+    def face_box(face_obj):
+        """
+        Integer (x, y, w, h) box of a face from DeepFace.extract_faces
+        """
+        area = face_obj.get('facial_area', {})
+        return {key: int(area.get(key, 0)) for key in ('x', 'y', 'w', 'h')}
+    
+    @staticmethod
+    def iter_recognition_events(group_photo, division=None):
+        """
+        Recognize students in a group photo, yielding results as they become available
+
+        Args:
+            group_photo: Decoded BGR image array (or a path to the photo)
+            division: Optional division to filter embeddings
+
+        Yields (in this order):
+            {'event': 'faces', 'faces': [{'face_index', 'box'}, ...]} once detection is done
+            {'event': 'progress', 'embedded', 'total', 'nearest': [...]} after each embedding
+                batch, with the nearest student of each face in it (see nearest_students);
+                these are tentative, as the final assignment may change them
+            {'event': 'match', 'face_index', 'student': {...}} per face matched to a student
+            {'event': 'no_match', 'face_index'} per face left unmatched
+            {'event': 'done', 'recognized_students': [...]} sorted by confidence
+        """
+        recognized_students = []
+
+        # Extract faces from the group photo
+        extracted_faces = RecognitionService.extract_faces_from_group(group_photo)
+        yield {
+            'event': 'faces',
+            'faces': [
+                {'face_index': face_idx, 'box': RecognitionService.face_box(face_obj)}
+                for face_idx, face_obj in enumerate(extracted_faces or [])
+            ]
+        }
+
+        if not extracted_faces or len(extracted_faces) == 0:
+            print("No faces extracted.")
+            yield {'event': 'done', 'recognized_students': []}
+            return
             
-            # Handle output format of DeepFace
-            if isinstance(face_embedding_obj, list):
-                face_embedding = face_embedding_obj[0]['embedding']
-            else:
-                face_embedding = face_embedding_obj['embedding']
-                
-            return np.array(face_embedding)
-        except Exception as e:
-            print(f"Error generating embedding: {str(e)}")
-            # Clean up temporary file if it exists
-            if 'temp_face_path' in locals() and os.path.exists(temp_face_path):
-                os.remove(temp_face_path)
-            return None
+        print(f"Extracted {len(extracted_faces)} faces from group photo")
+
+        near_threshold = RECOGNITION_THRESHOLD * 1.2  # 20% buffer
+
+        # Embed every face in a few batched forward passes instead of one call per face,
+        # reporting each batch's nearest students while the rest are still embedded
+        # Each batch's distances are computed once and reused for the final assignment
+        faces = [face_obj['face'] for face_obj in extracted_faces]
+        batches = []
+        known_students = {}
+        for start, batch_embeddings in BatchEmbedder.iter_batches(faces):
+            batch_ids, batch_distances, known = RecognitionService.candidate_distances(batch_embeddings, division)
+            known_students.update(known)
+            batches.append((batch_embeddings, batch_ids, batch_distances))
+            yield {
+                'event': 'progress',
+                'embedded': start + len(batch_embeddings),
+                'total': len(faces),
+                'nearest': RecognitionService.nearest_students(
+                    batch_ids, batch_distances, start, near_threshold, known_students
+                )
+            }
+        RecognitionService.record_avoided_crop_files(faces)
+        print(f"Generated {len(faces)} embeddings in {len(batches)} batches")
+
+        student_ids, student_distances = RecognitionService.merge_batch_distances(batches, division)
+
+        if not student_ids:
+            for face_idx in range(len(extracted_faces)):
+                yield {'event': 'no_match', 'face_index': face_idx}
+            yield {'event': 'done', 'recognized_students': []}
+            return
+
+        # Solve face <-> student matching jointly instead of first-come, first-served
+        assignments = MatchingService.assign_faces(student_distances, near_threshold)
+
+        # Display fields for every matched student at once
+        matched_ids = [student_ids[a['student_index']] for a in assignments if a['student_index'] is not None]
+        students = RecognitionService.resolve_students(matched_ids, known_students)
+
+        for face_idx, assignment in enumerate(assignments):
+            if assignment['student_index'] is None:
+                yield {'event': 'no_match', 'face_index': face_idx}
+                continue
+
+            try:
+                student_id = student_ids[assignment['student_index']]
+                distance = assignment['distance']
+                match_found = distance < RECOGNITION_THRESHOLD
+
+                if match_found:
+                    print(f"Match found for student {student_id} with distance {distance:.4f}")
+                else:
+                    print(f"Near match for student {student_id} with distance {distance:.4f}")
+
+                student = students.get(student_id)
+                if student:
+                    student_info = {
+                        'name': student['name'],
+                        'roll_no': student['roll_no'],
+                        'class': student['division'],
+                        'confidence': round((1.0 - distance) * 100, 1),  # Convert to percentage
+                        'distance': round(distance, 4),
+                        # How much closer this student is than the runner-up (None if there is none)
+                        'margin': round(assignment['margin'], 4) if np.isfinite(assignment['margin']) else None
+                    }
+                    if not match_found:
+                        student_info['tentative'] = True  # Mark as tentative match
+                    recognized_students.append(student_info)
+                    yield {'event': 'match', 'face_index': face_idx, 'student': student_info}
+                else:
+                    yield {'event': 'no_match', 'face_index': face_idx}
+
+            except Exception as e:
+                print(f"Error processing face {face_idx+1}: {str(e)}")
+
+        # Sort recognized students by confidence
+        recognized_students.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+        print(f"Recognition complete. Found {len(recognized_students)} students.")
+        yield {'event': 'done', 'recognized_students': recognized_students}
     
     @staticmethod
-    def recognize_faces_in_group(group_photo_path, division=None):
+    def recognize_faces_in_group(group_photo, division=None):
         """
         Recognize students in a group photo using stored embeddings
 
         Args:
-            group_photo_path: Path to the group photo
+            group_photo: Decoded BGR image array (or a path to the photo)
             division: Optional division to filter embeddings
 
         Returns:
             List of recognized students
         """
-        recognized_students = []
-        seen_student_ids = set()  # To prevent duplicates
-
         try:
-            # Extract faces from the group photo
-            extracted_faces = RecognitionService.extract_faces_from_group(group_photo_path)
-
-            if not extracted_faces or len(extracted_faces) == 0:
-                print("No faces extracted.")
-                return []
-                
-            print(f"Extracted {len(extracted_faces)} faces from group photo")
-
-            # Load embeddings from MongoDB, filtered by division if provided
-            if division:
-                embeddings_list = Embedding.get_by_division(division)
-                print(f"Loaded {len(embeddings_list)} embeddings for division {division}")
-            else:
-                embeddings_list = Embedding.get_all()
-                print(f"Loaded {len(embeddings_list)} embeddings total")
-
-            # For each face in the group photo
-            for face_idx, face_obj in enumerate(extracted_faces):
-                print(f"\nProcessing face {face_idx+1}/{len(extracted_faces)}")
-                face_img = face_obj['face']
-
-                try:
-                    # Generate embedding for this face
-                    face_embedding = RecognitionService.represent_face(face_img, enforce_detection=False)
-                    
-                    if face_embedding is None:
-                        print(f"Could not generate embedding for face {face_idx+1}")
-                        continue
-                        
-                    print(f"Generated embedding with shape {face_embedding.shape}")
-
-                    # Track best match
-                    best_match = None
-                    best_match_distance = float('inf')
-                    best_match_student_id = None
-
-                    # Compare against each student's stored embeddings
-                    for emb_doc in embeddings_list:
-                        student_id = str(emb_doc['student_id'])
-                        
-                        if student_id in seen_student_ids:
-                            continue
-
-                        # Extract the embeddings correctly
-                        stored_embeddings_np = []
-                        for idx in range(len(emb_doc['embeddings'])):
-                            # Handle possible different structures
-                            if isinstance(emb_doc['embeddings'][idx], list) and len(emb_doc['embeddings'][idx]) > 0:
-                                if isinstance(emb_doc['embeddings'][idx][0], dict) and 'embedding' in emb_doc['embeddings'][idx][0]:
-                                    embedding_array = emb_doc['embeddings'][idx][0]['embedding']
-                                    stored_embeddings_np.append(np.array(embedding_array))
-                            elif isinstance(emb_doc['embeddings'][idx], dict) and 'embedding' in emb_doc['embeddings'][idx]:
-                                embedding_array = emb_doc['embeddings'][idx]['embedding']
-                                stored_embeddings_np.append(np.array(embedding_array))
-
-                        if not stored_embeddings_np:
-                            continue
-
-                        # Compare embeddings
-                        match_found, distance = RecognitionService.compare_embedding_vectors(
-                            face_embedding, stored_embeddings_np, DISTANCE_METRIC
-                        )
-
-                        # Track best match even if below threshold
-                        if distance < best_match_distance:
-                            best_match_distance = distance
-                            best_match_student_id = student_id
-                            
-                        # If match is found, add to recognized students
-                        if match_found:
-                            print(f"Match found for student {student_id} with distance {distance:.4f}")
-                            student = Student.get_by_id(student_id)
-                            if student:
-                                student_info = {
-                                    'name': student['name'],
-                                    'roll_no': student['roll_no'],
-                                    'class': student['division'],
-                                    'confidence': round((1.0 - distance) * 100, 1)  # Convert to percentage
-                                }
-                                recognized_students.append(student_info)
-                                seen_student_ids.add(student_id)
-                                break
-                    
-                    # If no match was found but we have a best match that's close
-                    if not match_found and best_match_student_id:
-                        near_threshold = RECOGNITION_THRESHOLD * 1.2  # 20% buffer
-                        if best_match_distance < near_threshold:
-                            print(f"Near match for student {best_match_student_id} with distance {best_match_distance:.4f}")
-                            student = Student.get_by_id(best_match_student_id)
-                            if student:
-                                student_info = {
-                                    'name': student['name'],
-                                    'roll_no': student['roll_no'],
-                                    'class': student['division'],
-                                    'confidence': round((1.0 - best_match_distance) * 100, 1),  # Convert to percentage
-                                    'tentative': True  # Mark as tentative match
-                                }
-                                recognized_students.append(student_info)
-                                seen_student_ids.add(best_match_student_id)
-
-                except Exception as e:
-                    print(f"Error processing face: {str(e)}")
-
-            # Sort recognized students by confidence
-            recognized_students.sort(key=lambda x: x.get('confidence', 0), reverse=True)
-            print(f"Recognition complete. Found {len(recognized_students)} students.")
-            return recognized_students
+            for event in RecognitionService.iter_recognition_events(group_photo, division):
+                if event['event'] == 'done':
+                    return event['recognized_students']
+            return []
 
         except Exception as e:
             print(f"Recognition error: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+    @staticmethod
+    def recognize_session(group_photos, division=None):
+        """
+        Recognize students across several overlapping photos of one lecture
+
+        Faces are extracted from the photos in parallel and embedded together in
+        shared batches. Faces of the same person seen in different photos are merged
+        by embedding similarity, and the merged faces are then matched to students
+        jointly, each taking its closest photo's distance.
+
+        Args:
+            group_photos: List of decoded BGR image arrays
+            division: Optional division to filter embeddings
+
+        Returns:
+            Dict with recognized_students (sorted by confidence), faces found per
+            photo, unique_faces and duplicates_merged
+        """
+        workers = max(1, min(SESSION_WORKERS, len(group_photos)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            extracted = list(pool.map(RecognitionService.extract_faces_from_group, group_photos))
+
+        faces, photo_indices = [], []
+        for photo_idx, face_objs in enumerate(extracted):
+            for face_obj in face_objs or []:
+                faces.append(face_obj['face'])
+                photo_indices.append(photo_idx)
+
+        result = {
+            'recognized_students': [],
+            'photos': [{'photo_index': i, 'faces': len(face_objs or [])} for i, face_objs in enumerate(extracted)],
+            'unique_faces': 0,
+            'duplicates_merged': 0
+        }
+        if not faces:
+            print("No faces extracted from any session photo.")
+            return result
+
+        # One set of batched forward passes for every face of every photo
+        face_embeddings = BatchEmbedder.embed_faces(faces)
+        RecognitionService.record_avoided_crop_files(faces)
+        groups = MatchingService.merge_duplicate_faces(
+            face_embeddings, photo_indices, SESSION_DUPLICATE_THRESHOLD, DISTANCE_METRIC
+        )
+        result['unique_faces'] = len(groups)
+        result['duplicates_merged'] = len(faces) - len(groups)
+        print(f"Session: {len(faces)} faces in {len(group_photos)} photos, {len(groups)} unique people")
+
+        student_ids, student_distances, known_students = RecognitionService.candidate_distances(
+            face_embeddings, division
+        )
+        if not student_ids:
+            return result
+
+        # A merged face is as close to a student as its best view
+        group_distances = np.vstack([student_distances[members].min(axis=0) for members in groups])
+        assignments = MatchingService.assign_faces(group_distances, RECOGNITION_THRESHOLD * 1.2)
+
+        matched_ids = [student_ids[a['student_index']] for a in assignments if a['student_index'] is not None]
+        students = RecognitionService.resolve_students(matched_ids, known_students)
+
+        recognized_students = []
+        for members, assignment in zip(groups, assignments):
+            if assignment['student_index'] is None:
+                continue
+            student = students.get(student_ids[assignment['student_index']])
+            if not student:
+                continue
+            distance = assignment['distance']
+            student_info = {
+                'name': student['name'],
+                'roll_no': student['roll_no'],
+                'class': student['division'],
+                'confidence': round((1.0 - distance) * 100, 1),
+                'distance': round(distance, 4),
+                'margin': round(assignment['margin'], 4) if np.isfinite(assignment['margin']) else None,
+                'photos': sorted({photo_indices[i] for i in members})
+            }
+            if distance >= RECOGNITION_THRESHOLD:
+                student_info['tentative'] = True
+            recognized_students.append(student_info)
+
+        recognized_students.sort(key=lambda x: x['confidence'], reverse=True)
+        result['recognized_students'] = recognized_students
+        return result
@@ -0,0 +1,170 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from services.model_registry import ModelRegistry
+from config import (DETECTION_MAX_SIDE, DETECTION_TILE_SIZE, DETECTION_TILE_OVERLAP, DETECTION_WORKERS,
+                    DETECTION_NMS_IOU)
+
+
+class TiledFaceDetector:
+    """
+    Haar face detection for large group photos
+
+    The photo is first shrunk to a bounded working resolution (which bounds CPU time
+    however many megapixels the phone produced), then searched at two levels:
+    overlapping tiles at working resolution find small back-row faces, and one pass
+    over the whole photo shrunk to a single tile finds faces too large to fit in a
+    tile's overlap. Tiles are searched in parallel threads, each with its own cascade,
+    and the boxes from every tile and level are merged with non-maximum suppression.
+    Boxes are returned in the original full-resolution photo's coordinates.
+    """
+
+    _pool = None
+    _pool_lock = threading.Lock()
+
+    # Same cascade settings as DeepFace's opencv backend
+    SCALE_FACTOR = 1.1
+    MIN_NEIGHBORS = 10
+
+    @staticmethod
+    def get_pool(workers=DETECTION_WORKERS):
+        """
+        Long-lived tile workers, so each parses its cascade once
+        """
+        with TiledFaceDetector._pool_lock:
+            if TiledFaceDetector._pool is None:
+                TiledFaceDetector._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="face-tile")
+            return TiledFaceDetector._pool
+
+    @staticmethod
+    def working_copy(image, max_side=DETECTION_MAX_SIDE):
+        """
+        Grayscale copy of the image no larger than max_side on its longer side
+
+        Returns:
+            (gray image, scale from original to working coordinates)
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        scale = min(1.0, max_side / max(gray.shape[:2]))
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return gray, scale
+
+    @staticmethod
+    def tiles(height, width, tile_size=DETECTION_TILE_SIZE, overlap=DETECTION_TILE_OVERLAP):
+        """
+        Overlapping (x0, y0, x1, y1) tiles covering a height x width image
+        """
+        def starts(length):
+            if length <= tile_size:
+                return [0]
+            stride = tile_size - overlap
+            positions = list(range(0, length - tile_size, stride))
+            return positions + [length - tile_size]
+
+        return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+                for y in starts(height) for x in starts(width)]
+
+    @staticmethod
+    def _detect_tile(gray, tile, image_size, max_face):
+        """
+        Detections in one tile, in working-image coordinates
+
+        Only faces up to max_face (the tile overlap) are searched for; larger ones are
+        left to the coarse pass. A detection touching a tile edge that is not also an
+        image edge may be a face cut in half; the neighbouring tile sees that face
+        whole, so it is dropped.
+        """
+        x0, y0, x1, y1 = tile
+        width, height = image_size
+        cascade = ModelRegistry.get_thread_face_cascade()
+        rects, _, weights = cascade.detectMultiScale3(
+            gray[y0:y1, x0:x1], TiledFaceDetector.SCALE_FACTOR, TiledFaceDetector.MIN_NEIGHBORS,
+            maxSize=(max_face, max_face), outputRejectLevels=True
+        )
+
+        boxes, scores = [], []
+        for (x, y, w, h), weight in zip(rects, np.ravel(weights)):
+            cut = ((x <= 0 and x0 > 0) or (y <= 0 and y0 > 0) or
+                   (x0 + x + w >= x1 and x1 < width) or (y0 + y + h >= y1 and y1 < height))
+            if not cut:
+                boxes.append((x0 + x, y0 + y, w, h))
+                scores.append(float(weight))
+        return boxes, scores
+
+    @staticmethod
+    def _detect_coarse(gray, tile_size):
+        """
+        Detections over the whole working image shrunk to one tile, for faces larger
+        than the tile overlap
+        """
+        scale = min(1.0, tile_size / max(gray.shape[:2]))
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+        cascade = ModelRegistry.get_thread_face_cascade()
+        rects, _, weights = cascade.detectMultiScale3(
+            small, TiledFaceDetector.SCALE_FACTOR, TiledFaceDetector.MIN_NEIGHBORS, outputRejectLevels=True
+        )
+        boxes = [tuple(v / scale for v in rect) for rect in rects]
+        return boxes, [float(w) for w in np.ravel(weights)]
+
+    @staticmethod
+    def non_max_suppression(boxes, scores, iou_threshold=DETECTION_NMS_IOU):
+        """
+        Indices of the boxes to keep: highest score first, dropping any box that
+        overlaps a kept one by more than iou_threshold
+        """
+        if not boxes:
+            return []
+        boxes = np.asarray(boxes, dtype=np.float32)
+        x1, y1 = boxes[:, 0], boxes[:, 1]
+        x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+        areas = boxes[:, 2] * boxes[:, 3]
+
+        order = np.argsort(scores)[::-1]
+        keep = []
+        while order.size:
+            i = order[0]
+            keep.append(int(i))
+            rest = order[1:]
+            inter = (np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None) *
+                     np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None))
+            iou = inter / (areas[i] + areas[rest] - inter)
+            order = rest[iou <= iou_threshold]
+        return keep
+
+    @staticmethod
+    def detect(image, tile_size=DETECTION_TILE_SIZE, max_side=DETECTION_MAX_SIDE, overlap=DETECTION_TILE_OVERLAP):
+        """
+        Detect faces in a (possibly very large) photo
+
+        Args:
+            image: BGR image array
+            tile_size: Side of the square tiles searched at working resolution
+            max_side: Longest side of the working copy
+            overlap: Pixels shared by neighbouring tiles; faces up to this size are
+                     always whole in some tile
+
+        Returns:
+            List of ((x, y, w, h), score) in original image coordinates, best first
+        """
+        gray, scale = TiledFaceDetector.working_copy(image, max_side)
+        height, width = gray.shape[:2]
+        pool = TiledFaceDetector.get_pool()
+
+        tiles = TiledFaceDetector.tiles(height, width, tile_size, overlap)
+        if len(tiles) == 1:
+            # Small photo: one tile searched for faces of every size
+            overlap = max(height, width)
+        jobs = [pool.submit(TiledFaceDetector._detect_tile, gray, tile, (width, height), overlap) for tile in tiles]
+        if len(tiles) > 1:
+            jobs.append(pool.submit(TiledFaceDetector._detect_coarse, gray, tile_size))
+
+        boxes, scores = [], []
+        for job in jobs:
+            tile_boxes, tile_scores = job.result()
+            boxes.extend(tile_boxes)
+            scores.extend(tile_scores)
+
+        keep = TiledFaceDetector.non_max_suppression(boxes, scores)
+        return [(tuple(int(round(v / scale)) for v in boxes[i]), scores[i]) for i in keep]
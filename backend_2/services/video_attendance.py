@@ -0,0 +1,328 @@
+import time
+from urllib.parse import urlsplit
+import cv2
+import numpy as np
+from services.batch_embedder import BatchEmbedder
+from services.face_detectors import FaceDetectors
+from services.matching_service import MatchingService
+from services.model_registry import ModelRegistry
+from services.recognition_service import RecognitionService
+from config import (RECOGNITION_THRESHOLD, VIDEO_SAMPLE_FPS, TRACK_IOU_THRESHOLD,
+                    TRACK_MAX_MISSED, TRACK_QUALITY_GAIN, TRACK_MIN_HITS, STREAM_ALLOWED_HOSTS)
+
+
+class VideoFrameSource:
+    """
+    Sampled frames from a video file or a network stream (rtsp://, http://, ...)
+
+    Frames between samples are only grabbed, not decoded, so sampling 2 frames per
+    second from a 25 fps camera costs about two decodes per second.
+    Iterating yields (timestamp_seconds, BGR frame).
+    """
+
+    def __init__(self, source, sample_fps=VIDEO_SAMPLE_FPS, max_seconds=None):
+        self.source = source
+        self.sample_fps = sample_fps
+        self.max_seconds = max_seconds
+
+    @staticmethod
+    def url_allowed(stream_url, allowed_hosts=STREAM_ALLOWED_HOSTS):
+        """
+        Whether a stream URL is an rtsp(s) or http(s) URL on one of the allowed hosts;
+        the server opens it, so arbitrary URLs would let callers reach internal services
+        """
+        try:
+            parts = urlsplit(stream_url)
+        except ValueError:
+            return False
+        hosts = {host.lower() for host in allowed_hosts}
+        return parts.scheme in ("rtsp", "rtsps", "http", "https") and (parts.hostname or "").lower() in hosts
+
+    def __iter__(self):
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            raise ValueError(f"Could not open video source {self.source}")
+        try:
+            # Live streams often report 0 fps; assume a typical camera rate
+            fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+            step = max(1, int(round(fps / self.sample_fps)))
+            frame_index = 0
+            while True:
+                timestamp = frame_index / fps
+                if self.max_seconds is not None and timestamp > self.max_seconds:
+                    break
+                if frame_index % step:
+                    if not capture.grab():
+                        break
+                else:
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    yield timestamp, frame
+                frame_index += 1
+        finally:
+            capture.release()
+
+
+class SyntheticFrameSource:
+    """
+    Stands in for a camera: pans slowly across a still photo with a little jitter
+    and sensor noise, so the faces move between frames the way they do on a fixed
+    classroom camera. Iterating yields (timestamp_seconds, BGR frame).
+    """
+
+    def __init__(self, image, frames=60, sample_fps=VIDEO_SAMPLE_FPS, drift=40, jitter=3, noise=4.0, seed=0):
+        self.image = image
+        self.frames = frames
+        self.sample_fps = sample_fps
+        self.drift = drift
+        self.jitter = jitter
+        self.noise = noise
+        self.seed = seed
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed)
+        height, width = self.image.shape[:2]
+        crop_h, crop_w = height - self.drift - 2 * self.jitter, width - self.drift - 2 * self.jitter
+        for i in range(self.frames):
+            # Drift across and back once over the clip, plus per-frame shake
+            phase = 1 - abs(2 * i / max(1, self.frames - 1) - 1)
+            dx = int(phase * self.drift + self.jitter + rng.integers(-self.jitter, self.jitter + 1))
+            dy = int(phase * self.drift / 2 + self.jitter + rng.integers(-self.jitter, self.jitter + 1))
+            frame = self.image[dy:dy + crop_h, dx:dx + crop_w].astype(np.float32)
+            frame += rng.normal(0, self.noise, frame.shape)
+            yield i / self.sample_fps, np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def box_iou(boxes_a, boxes_b):
+    """
+    Pairwise intersection-over-union of (x, y, w, h) boxes
+
+    Returns:
+        len(boxes_a) x len(boxes_b) matrix
+    """
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+
+    inter_w = np.clip(np.minimum(ax2[:, None], bx2[None]) - np.maximum(a[:, 0, None], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(ay2[:, None], by2[None]) - np.maximum(a[:, 1, None], b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+class FaceTrack:
+    """One face followed across frames, with the identity votes cast for it"""
+
+    def __init__(self, track_id, box, timestamp):
+        self.track_id = track_id
+        self.box = box
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.hits = 1
+        self.missed = 0
+        self.best_quality = 0.0
+        self.embeddings = 0
+        self.votes = {}  # student ID -> {'weight', 'distance'}
+
+    def vote(self, student_id, distance):
+        vote = self.votes.setdefault(student_id, {'weight': 0.0, 'distance': float('inf')})
+        vote['weight'] += max(0.0, 1.0 - distance)
+        vote['distance'] = min(vote['distance'], distance)
+
+    def identity(self):
+        """(student ID, vote) with the most weight, or (None, None)"""
+        if not self.votes:
+            return None, None
+        return max(self.votes.items(), key=lambda item: item[1]['weight'])
+
+
+class IoUTracker:
+    """
+    Greedy IoU tracker: each detection continues the live track it overlaps most,
+    otherwise it starts a new track. At a few sampled frames per second, seated
+    students move little enough between frames for overlap alone to follow them.
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD, max_missed=TRACK_MAX_MISSED):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks = []  # every track ever started
+        self._live = []
+
+    def update(self, boxes, timestamp):
+        """
+        Assign this frame's detections to tracks
+
+        Returns:
+            List of (track, box) for every detection in the frame
+        """
+        assigned = []
+        unmatched = list(range(len(boxes)))
+        if self._live and boxes:
+            iou = box_iou([track.box for track in self._live], boxes)
+            while iou.size and iou.max() >= self.iou_threshold:
+                t, b = np.unravel_index(np.argmax(iou), iou.shape)
+                track = self._live[t]
+                track.box, track.last_seen = boxes[b], timestamp
+                track.hits += 1
+                track.missed = -1  # reset to 0 below
+                assigned.append((track, boxes[b]))
+                unmatched.remove(b)
+                iou[t, :] = -1
+                iou[:, b] = -1
+
+        for track in self._live:
+            track.missed += 1
+        self._live = [track for track in self._live if track.missed <= self.max_missed]
+
+        for b in unmatched:
+            track = FaceTrack(len(self.tracks), boxes[b], timestamp)
+            self.tracks.append(track)
+            self._live.append(track)
+            assigned.append((track, boxes[b]))
+        return assigned
+
+
+class VideoAttendanceService:
+    @staticmethod
+    def detect_faces(frame):
+        """Haar detections in one frame as (x, y, w, h) tuples"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return [tuple(int(v) for v in box) for box in ModelRegistry.detect_faces(gray, 1.3, 5)]
+
+    @staticmethod
+    def face_quality(frame, box):
+        """
+        How useful a face crop is for recognition: its size, discounted when blurred
+        (variance of the Laplacian; motion blur and defocus both lower it)
+        """
+        x, y, w, h = box
+        crop = cv2.cvtColor(frame[y:y + h, x:x + w], cv2.COLOR_BGR2GRAY)
+        sharpness = cv2.Laplacian(crop, cv2.CV_64F).var()
+        return float(np.sqrt(w * h) * min(1.0, sharpness / 100.0))
+
+    @staticmethod
+    def _match(embeddings, division):
+        """
+        Match a batch of face embeddings (faces from one frame, so no two may be the
+        same student) against the gallery
+
+        Returns:
+            (list of (student_id or None, distance) per embedding, known student fields)
+        """
+        student_ids, distances, known_students = RecognitionService.candidate_distances(embeddings, division)
+
+        if not student_ids:
+            return [(None, float('inf'))] * len(embeddings), known_students
+
+        assignments = MatchingService.assign_faces(distances, RECOGNITION_THRESHOLD * 1.2)
+        matches = [
+            (student_ids[a['student_index']], float(a['distance'])) if a['student_index'] is not None
+            else (None, float('inf'))
+            for a in assignments
+        ]
+        return matches, known_students
+
+    @staticmethod
+    def recognize_stream(frames, division=None, detector=None, quality_gain=TRACK_QUALITY_GAIN,
+                         min_hits=TRACK_MIN_HITS):
+        """
+        Take attendance from a sequence of frames
+
+        Faces are detected in every sampled frame and followed with an IoU tracker.
+        A track is embedded when it first appears and again only when its crop is
+        clearly better (bigger or sharper) than the best one embedded so far; every
+        embedding casts a vote for the student it matches. Each track then reports the
+        student with the most votes.
+
+        Args:
+            frames: Iterable of (timestamp_seconds, BGR frame), e.g. VideoFrameSource
+            division: Optional division to match against
+            detector: Optional detector(frame) -> list of (x, y, w, h); Haar by default
+            quality_gain: Relative quality improvement that triggers a re-embedding
+            min_hits: Frames a track must appear in to count (filters one-off false detections)
+
+        Returns:
+            (recognized_students, stats)
+        """
+        detector = detector or VideoAttendanceService.detect_faces
+        tracker = IoUTracker()
+        known_students = {}
+        stats = {'frames': 0, 'detections': 0, 'embeddings': 0, 'forward_passes': 0}
+        start = time.time()
+
+        for timestamp, frame in frames:
+            stats['frames'] += 1
+            boxes = detector(frame)
+            stats['detections'] += len(boxes)
+
+            # Only tracks that are new or now have a clearly better view get embedded
+            to_embed = []
+            for track, box in tracker.update(boxes, timestamp):
+                quality = VideoAttendanceService.face_quality(frame, box)
+                if track.embeddings == 0 or quality > track.best_quality * (1 + quality_gain):
+                    track.best_quality = max(track.best_quality, quality)
+                    to_embed.append((track, box))
+
+            if not to_embed:
+                continue
+
+            faces = FaceDetectors.align_boxes(frame, [box for _, box in to_embed])
+            embeddings = BatchEmbedder.embed_faces(faces)
+            stats['embeddings'] += len(faces)
+            stats['forward_passes'] += 1
+
+            matches, known = VideoAttendanceService._match(embeddings, division)
+            known_students.update(known)
+            for (track, _), (student_id, distance) in zip(to_embed, matches):
+                track.embeddings += 1
+                if student_id is not None:
+                    track.vote(student_id, distance)
+
+        # Per-student aggregate over every track that settled on them
+        attendance = {}
+        for track in tracker.tracks:
+            if track.hits < min_hits:
+                continue
+            student_id, vote = track.identity()
+            if student_id is None:
+                continue
+            entry = attendance.setdefault(student_id, {
+                'distance': float('inf'), 'votes': 0.0, 'tracks': 0, 'first_seen': track.first_seen
+            })
+            entry['distance'] = min(entry['distance'], vote['distance'])
+            entry['votes'] += vote['weight']
+            entry['tracks'] += 1
+            entry['first_seen'] = min(entry['first_seen'], track.first_seen)
+
+        students = RecognitionService.resolve_students(list(attendance), known_students)
+        recognized_students = []
+        for student_id, entry in attendance.items():
+            student = students.get(student_id)
+            if not student:
+                continue
+            distance = entry['distance']
+            student_info = {
+                'name': student['name'],
+                'roll_no': student['roll_no'],
+                'class': student['division'],
+                'confidence': round((1.0 - distance) * 100, 1),
+                'distance': round(distance, 4),
+                'votes': round(entry['votes'], 2),
+                'tracks': entry['tracks'],
+                'first_seen_seconds': round(entry['first_seen'], 1)
+            }
+            if distance >= RECOGNITION_THRESHOLD:
+                student_info['tentative'] = True
+            recognized_students.append(student_info)
+        recognized_students.sort(key=lambda x: x['confidence'], reverse=True)
+
+        stats['tracks'] = len(tracker.tracks)
+        # What embedding every detection would have cost, relative to what tracking did
+        stats['embedding_reduction'] = round(stats['detections'] / stats['embeddings'], 1) if stats['embeddings'] else None
+        stats['processing_time_seconds'] = round(time.time() - start, 2)
+        print(f"Video attendance: {stats}")
+        return recognized_students, stats
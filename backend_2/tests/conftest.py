@@ -0,0 +1,10 @@
+import os
+import sys
+import mongomock
+import pymongo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.py connects to the Atlas cluster on import; tests run against mongomock instead
+# (which would still resolve the mongodb+srv host, so the URI is dropped)
+pymongo.MongoClient = lambda *args, **kwargs: mongomock.MongoClient()
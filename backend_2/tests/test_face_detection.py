@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from config import QUALITY_MAX_SIDE
+from services.face_detection import FaceDetectionService
+from services.model_registry import ModelRegistry
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    """Replaces the Haar cascade; answers are taken in order and every input shape is recorded"""
+    calls = []
+    answers = []
+
+    def detect_faces(gray, scale_factor=1.3, min_neighbors=5):
+        calls.append(gray.shape)
+        return np.array(answers.pop(0)).reshape(-1, 4)
+
+    monkeypatch.setattr(ModelRegistry, "detect_faces", staticmethod(detect_faces))
+    return calls, answers
+
+
+def upload(width, height):
+    return np.full((height, width, 3), 128, dtype=np.uint8)
+
+
+def test_single_face_is_accepted_from_working_copy(cascade):
+    calls, answers = cascade
+    answers.append([(100, 50, 200, 200)])
+    image = upload(QUALITY_MAX_SIDE * 3, QUALITY_MAX_SIDE * 2)
+
+    found, _, box = FaceDetectionService.locate_face(image)
+
+    assert found
+    # Detection cost is bounded by the working copy, not the upload
+    assert calls == [(QUALITY_MAX_SIDE * 2 // 3, QUALITY_MAX_SIDE)]
+    assert box == (300, 150, 600, 600)
+
+
+@pytest.mark.parametrize("working_copy_faces", [[], [(0, 0, 50, 50), (100, 0, 50, 50)]])
+def test_other_counts_are_decided_at_full_resolution(cascade, working_copy_faces):
+    calls, answers = cascade
+    answers.extend([working_copy_faces, [(900, 600, 120, 120)]])
+    image = upload(QUALITY_MAX_SIDE * 3, QUALITY_MAX_SIDE * 2)
+
+    found, _, box = FaceDetectionService.locate_face(image)
+
+    assert found
+    assert calls == [(QUALITY_MAX_SIDE * 2 // 3, QUALITY_MAX_SIDE), (QUALITY_MAX_SIDE * 2, QUALITY_MAX_SIDE * 3)]
+    assert box == (900, 600, 120, 120)
+
+
+def test_small_upload_is_detected_once(cascade):
+    calls, answers = cascade
+    answers.append([])
+
+    found, message, _ = FaceDetectionService.locate_face(upload(640, 480))
+
+    assert not found and message == "No face detected"
+    assert calls == [(480, 640)]
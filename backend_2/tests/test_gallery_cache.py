@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+import mongomock
+from services.gallery_cache import GalleryCache
+
+
+class CountingCollection:
+    """Wraps a mongomock collection and counts the queries made through it"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.queries = 0
+
+    def find(self, *args, **kwargs):
+        self.queries += 1
+        return self.collection.find(*args, **kwargs)
+
+    def count_documents(self, *args, **kwargs):
+        self.queries += 1
+        return self.collection.count_documents(*args, **kwargs)
+
+
+def embedding_doc(student_id, division, created_at):
+    return {
+        "student_id": student_id,
+        "student_name": f"Student {student_id}",
+        "roll_no": student_id,
+        "division": division,
+        "embeddings": [[1.0, 0.0, 0.0, 0.0]],
+        "created_at": created_at,
+        "updated_at": created_at
+    }
+
+
+def make_cache(*docs):
+    collection = mongomock.MongoClient().db.embeddings
+    if docs:
+        collection.insert_many(list(docs))
+    counting = CountingCollection(collection)
+    cache = GalleryCache(counting)
+    cache._remember_latest()
+    counting.queries = 0
+    return cache, collection, counting
+
+
+def test_miss_then_hit_makes_no_queries():
+    start = datetime(2024, 1, 1)
+    cache, _, counting = make_cache(embedding_doc("s1", "A", start), embedding_doc("s2", "B", start))
+
+    gallery = cache.get("A")
+    assert gallery.student_ids == ["s1"]
+    assert counting.queries == 1
+
+    assert cache.get("A") is gallery
+    assert counting.queries == 1
+
+
+def test_poll_invalidates_division_with_newer_document():
+    start = datetime(2024, 1, 1)
+    cache, collection, _ = make_cache(embedding_doc("s1", "A", start), embedding_doc("s2", "B", start))
+    gallery_a, gallery_b = cache.get("A"), cache.get("B")
+
+    collection.insert_one(embedding_doc("s3", "A", start + timedelta(seconds=1)))
+    cache.poll_once()
+
+    assert cache.get("B") is gallery_b
+    refreshed = cache.get("A")
+    assert refreshed is not gallery_a
+    assert sorted(refreshed.student_ids) == ["s1", "s3"]
+
+    # Nothing newer since: the refreshed gallery stays cached
+    cache.poll_once()
+    assert cache.get("A") is refreshed
+
+
+def test_poll_invalidates_division_with_updated_document():
+    start = datetime(2024, 1, 1)
+    cache, collection, _ = make_cache(embedding_doc("s1", "A", start), embedding_doc("s2", "B", start),
+                                      embedding_doc("s3", "C", start))
+    gallery_a, gallery_c = cache.get("A"), cache.get("C")
+
+    # Re-enrolled in place, then moved to another division: no new document either time
+    collection.update_one({"student_id": "s1"}, {"$set": {"embeddings": [[0.0, 1.0, 0.0, 0.0]],
+                                                          "updated_at": start + timedelta(seconds=1)}})
+    cache.poll_once()
+    refreshed = cache.get("A")
+    assert refreshed is not gallery_a
+    assert refreshed.vectors[0].tolist() == [0.0, 1.0, 0.0, 0.0]
+
+    collection.update_one({"student_id": "s1"}, {"$set": {"division": "B",
+                                                          "updated_at": start + timedelta(seconds=2)}})
+    cache.poll_once()
+    assert cache.get("A").student_ids == []
+    assert sorted(cache.get("B").student_ids) == ["s1", "s2"]
+    assert cache.get("C") is gallery_c
+
+
+def test_poll_invalidates_everything_on_delete():
+    start = datetime(2024, 1, 1)
+    cache, collection, _ = make_cache(embedding_doc("s1", "A", start), embedding_doc("s2", "B", start))
+    gallery_a, gallery_b = cache.get("A"), cache.get("B")
+
+    collection.delete_one({"student_id": "s2"})
+    cache.poll_once()
+
+    assert cache.get("A") is not gallery_a
+    assert cache.get("B") is not gallery_b
+    assert len(cache.get("B")) == 0
+
+
+def test_update_moving_division_invalidates_old_division():
+    start = datetime(2024, 1, 1)
+    cache, collection, _ = make_cache(embedding_doc("s1", "A", start), embedding_doc("s2", "B", start),
+                                      embedding_doc("s3", "C", start))
+    gallery_a, gallery_c = cache.get("A"), cache.get("C")
+
+    collection.update_one({"student_id": "s1"}, {"$set": {"division": "B"}})
+    cache.apply_change({
+        "operationType": "update",
+        "fullDocument": collection.find_one({"student_id": "s1"})
+    })
+
+    assert cache.get("A") is not gallery_a
+    assert cache.get("A").student_ids == []
+    assert sorted(cache.get("B").student_ids) == ["s1", "s2"]
+    assert cache.get("C") is gallery_c
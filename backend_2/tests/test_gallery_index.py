@@ -0,0 +1,67 @@
+import threading
+import numpy as np
+import pytest
+import config
+from services.gallery_index import GalleryIndexService, IVFIndex
+
+
+@pytest.fixture
+def index_file(tmp_path, monkeypatch):
+    """Points the service at an empty index file of its own"""
+    monkeypatch.setattr(config, "GALLERY_INDEX_TYPE", "ivf")
+    monkeypatch.setattr(config, "GALLERY_INDEX_PATH", str(tmp_path / "gallery_index.npz"))
+    monkeypatch.setattr(config, "IVF_NLIST", None)
+    monkeypatch.setattr(GalleryIndexService, "_index", None)
+    monkeypatch.setattr(GalleryIndexService, "_version", None)
+    monkeypatch.setattr(GalleryIndexService, "_retrainer", None)
+    return config.GALLERY_INDEX_PATH
+
+
+@pytest.fixture
+def gated_training(monkeypatch):
+    """Training off the main thread waits for the returned event; records which threads trained"""
+    release = threading.Event()
+    threads = []
+    train = IVFIndex.train
+
+    def gated(self, seed=0):
+        threads.append(threading.current_thread().name)
+        if threading.current_thread() is not threading.main_thread():
+            assert release.wait(10)
+        return train(self, seed)
+
+    monkeypatch.setattr(IVFIndex, "train", gated)
+    return release, threads
+
+
+def vectors(rng, count, dim=128):
+    return rng.normal(size=(count, dim)).astype(np.float32)
+
+
+def test_retrain_runs_in_background_and_keeps_later_enrolments(index_file, gated_training):
+    release, threads = gated_training
+    rng = np.random.default_rng(0)
+    seed = IVFIndex()
+    seed.add(vectors(rng, 64), [f"s{i}" for i in range(64)])
+    assert len(seed.centroids) == 32
+    GalleryIndexService.replace_index(seed)
+
+    # Outgrows the 32 buckets: add_student returns with the retrain still waiting
+    GalleryIndexService.add_student("big", list(vectors(rng, 200)))
+    retrainer = GalleryIndexService._retrainer
+    assert retrainer is not None and retrainer.is_alive()
+    assert threads[-1] == "gallery-index-retrain"
+    assert len(GalleryIndexService.get_index().centroids) == 32
+
+    late = vectors(rng, 5)
+    GalleryIndexService.add_student("late", list(late))
+    assert GalleryIndexService._retrainer is retrainer
+
+    release.set()
+    retrainer.join(10)
+    index = GalleryIndexService.get_index()
+    assert len(index.centroids) == int(4 * np.sqrt(264))
+    assert len(index) == 269 and len(index.assignments) == 269
+    _, rows = index.search(late[:1], k=1)
+    assert index.student_ids[rows[0, 0]] == "late"
+    assert GalleryIndexService._retrainer is None
@@ -0,0 +1,45 @@
+import glob
+import os
+import cv2
+import numpy as np
+import pytest
+from config import RECOGNITION_THRESHOLD
+from services.batch_embedder import BatchEmbedder
+from services.embedding_service import EmbeddingService
+from services.face_detection import FaceDetectionService
+from services.face_detectors import FaceDetectors
+from services.matching_service import MatchingService
+from services.video_attendance import box_iou
+
+PHOTOS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "..", "backend", "uploads", "*", "image_0.jpg")))[:3]
+FACENET_WEIGHTS = os.path.join(os.path.expanduser("~"), ".deepface", "weights", "facenet_weights.h5")
+
+pytestmark = pytest.mark.skipif(not PHOTOS or not os.path.exists(FACENET_WEIGHTS),
+                                reason="needs the committed student photos and the FaceNet weights")
+
+
+def in_group_photo(img):
+    """Pastes an enrolment photo into a larger grey frame, as one face of a group photo"""
+    h, w = img.shape[:2]
+    canvas = np.full((h * 2, w * 3, 3), 127, dtype=np.uint8)
+    canvas[h // 2:h // 2 + h, w:2 * w] = img
+    return canvas, (w, h // 2)
+
+
+@pytest.mark.parametrize("detector", ["tiled", "deepface"])
+@pytest.mark.parametrize("path", PHOTOS, ids=lambda path: os.path.basename(os.path.dirname(path)))
+def test_enrolment_and_probe_embeddings_of_one_photo_match(path, detector):
+    img = cv2.imread(path)
+    enrolled, message = EmbeddingService.embed_enrolment_images([img])
+    assert enrolled is not None, message
+    _, _, (x, y, w, h) = FaceDetectionService.locate_face(img)
+
+    group, (dx, dy) = in_group_photo(img)
+    face_objs = FaceDetectors.extract_faces(group, detector)
+    if not face_objs:
+        pytest.skip(f"{detector} found no face in {path}")
+    boxes = [tuple(face_obj['facial_area'][k] for k in ('x', 'y', 'w', 'h')) for face_obj in face_objs]
+    probe = face_objs[int(np.argmax(box_iou([(x + dx, y + dy, w, h)], boxes)[0]))]
+
+    vectors = MatchingService.normalize_rows(np.vstack([enrolled, BatchEmbedder.embed_faces([probe['face']])]))
+    assert 1 - float(vectors[0] @ vectors[1]) < RECOGNITION_THRESHOLD
@@ -0,0 +1,54 @@
+import numpy as np
+import config
+from models.student import Student
+from services.batch_embedder import BatchEmbedder
+from services.gallery_index import ExactIndex, GalleryIndexService
+from services.recognition_service import RecognitionService
+
+
+def test_streaming_reuses_batch_distances(monkeypatch):
+    rng = np.random.default_rng(0)
+    student_ids = [f"{i:024x}" for i in range(40)]
+    enrolled = rng.normal(size=(40, 128)).astype(np.float32)
+    index = ExactIndex()
+    index.add(enrolled, student_ids)
+
+    # Faces are the students in reverse order, slightly perturbed
+    probes = enrolled[::-1] + rng.normal(scale=0.05, size=enrolled.shape).astype(np.float32)
+    faces = [{'face': np.zeros((8, 8, 3), dtype=np.float32), 'facial_area': {'x': 0, 'y': 0, 'w': 8, 'h': 8}}
+             for _ in probes]
+
+    searches, lookups = [], []
+    original_search = index.search
+
+    def search(queries, k=10):
+        searches.append(len(queries))
+        return original_search(queries, k)
+
+    def get_many(ids, projection=None):
+        lookups.append(list(ids))
+        return {sid: {'name': f"Student {sid[-2:]}", 'roll_no': sid[-2:], 'division': 'A'} for sid in ids}
+
+    def iter_batches(batch_faces, *args, **kwargs):
+        for start in range(0, len(batch_faces), 16):
+            yield start, probes[start:start + 16]
+
+    monkeypatch.setattr(index, "search", search)
+    monkeypatch.setattr(config, "GALLERY_INDEX_NEIGHBOURS", 1)
+    monkeypatch.setattr(GalleryIndexService, "get_index", staticmethod(lambda: index))
+    monkeypatch.setattr(RecognitionService, "extract_faces_from_group", staticmethod(lambda photo: faces))
+    monkeypatch.setattr(BatchEmbedder, "iter_batches", staticmethod(iter_batches))
+    monkeypatch.setattr(Student, "get_many", staticmethod(get_many))
+
+    events = list(RecognitionService.iter_recognition_events(None))
+
+    progress = [e for e in events if e['event'] == 'progress']
+    assert [e['embedded'] for e in progress] == [16, 32, 40]
+    # One index search per batch and none for the final assignment, one student lookup in all
+    assert searches == [16, 16, 8]
+    assert len(lookups) == 1
+
+    matches = {e['face_index']: e['student']['roll_no'] for e in events if e['event'] == 'match'}
+    assert matches == {i: student_ids[39 - i][-2:] for i in range(40)}
+    nearest = [n for e in progress for n in e['nearest']]
+    assert [n['student_id'] for n in nearest] == student_ids[::-1]
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+from services.batch_embedder import BatchEmbedder
+from services.recognition_service import RecognitionService
+from services.video_attendance import IoUTracker, SyntheticFrameSource, VideoAttendanceService, VideoFrameSource
+
+# Two "faces": flat squares of pure red and pure blue (BGR) on a grey photo
+FACE_COLOURS = {"red": (0, 0, 255), "blue": (255, 0, 0)}
+STUDENTS = {"red": [1.0, 0.0, 0.0], "blue": [0.0, 0.0, 1.0]}  # RGB mean of each face crop
+
+
+def classroom_photo():
+    image = np.full((400, 600, 3), 110, dtype=np.uint8)
+    image[100:180, 120:200] = FACE_COLOURS["red"]
+    image[150:230, 380:460] = FACE_COLOURS["blue"]
+    return image
+
+
+class ColourDetector:
+    """Finds the coloured squares; hide maps a colour to the frame indices it is not found in"""
+
+    def __init__(self, hide=None):
+        self.hide = hide or {}
+        self.frame_index = -1
+
+    def __call__(self, frame):
+        self.frame_index += 1
+        boxes = []
+        for colour, bgr in FACE_COLOURS.items():
+            if self.frame_index in self.hide.get(colour, ()):
+                continue
+            channel = int(np.argmax(bgr))
+            others = [c for c in range(3) if c != channel]
+            mask = (frame[:, :, channel] > 200) & np.all(frame[:, :, others] < 60, axis=2)
+            ys, xs = np.nonzero(mask)
+            if len(xs):
+                boxes.append((int(xs.min()), int(ys.min()), int(xs.max() - xs.min() + 1), int(ys.max() - ys.min() + 1)))
+        return boxes
+
+
+@pytest.fixture
+def colour_matching(monkeypatch):
+    """Embeds a face as its mean colour and matches it to the student of that colour"""
+    student_ids = list(STUDENTS)
+    prototypes = np.asarray([STUDENTS[sid] for sid in student_ids], dtype=np.float32)
+    known = {sid: {"name": sid.title(), "roll_no": sid, "division": "A"} for sid in student_ids}
+
+    def embed_faces(faces, *args, **kwargs):
+        return np.asarray([face.reshape(-1, 3).mean(axis=0) for face in faces], dtype=np.float32)
+
+    def candidate_distances(embeddings, division=None):
+        normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return student_ids, np.clip(1.0 - normalized @ prototypes.T, 0.0, 1.0), known
+
+    monkeypatch.setattr(BatchEmbedder, "embed_faces", staticmethod(embed_faces))
+    monkeypatch.setattr(RecognitionService, "candidate_distances", staticmethod(candidate_distances))
+
+
+def test_tracker_keeps_track_while_face_moves():
+    tracker = IoUTracker(iou_threshold=0.3, max_missed=2)
+    first = tracker.update([(100, 100, 50, 50), (300, 100, 50, 50)], 0.0)
+    track_ids = [track.track_id for track, _ in first]
+
+    for step in range(1, 6):
+        assigned = tracker.update([(300 + 3 * step, 100, 50, 50), (100 + 3 * step, 100 + step, 50, 50)], step)
+        by_x = sorted(assigned, key=lambda pair: pair[1][0])
+        assert [track.track_id for track, _ in by_x] == track_ids
+
+    assert len(tracker.tracks) == 2
+    assert all(track.hits == 6 for track in tracker.tracks)
+
+
+def test_tracker_starts_new_track_after_face_is_lost():
+    tracker = IoUTracker(iou_threshold=0.3, max_missed=2)
+    tracker.update([(100, 100, 50, 50)], 0.0)
+    # Missed for fewer frames than max_missed: the same track continues
+    tracker.update([], 1.0)
+    tracker.update([(102, 100, 50, 50)], 2.0)
+    assert len(tracker.tracks) == 1
+
+    # Missed for longer: the track ends and the face starts a new one
+    for t in (3.0, 4.0, 5.0):
+        tracker.update([], t)
+    (track, _), = tracker.update([(104, 100, 50, 50)], 6.0)
+    assert len(tracker.tracks) == 2
+    assert track.track_id == 1
+    assert tracker.tracks[0].last_seen == 2.0
+
+
+def test_recognize_stream_follows_faces_across_synthetic_frames(colour_matching):
+    frames = SyntheticFrameSource(classroom_photo(), frames=20, drift=40, jitter=3)
+    students, stats = VideoAttendanceService.recognize_stream(frames, detector=ColourDetector())
+
+    assert stats["frames"] == 20
+    assert stats["detections"] == 40
+    # One track per face for the whole clip, so faces are embedded far less than detected
+    assert stats["tracks"] == 2
+    assert stats["embeddings"] < stats["detections"]
+    assert sorted(s["roll_no"] for s in students) == ["blue", "red"]
+    assert all(s["tracks"] == 1 for s in students)
+
+
+def test_recognize_stream_recreates_lost_track(colour_matching):
+    frames = SyntheticFrameSource(classroom_photo(), frames=20, drift=40, jitter=3)
+    # Blue goes undetected for longer than TRACK_MAX_MISSED frames, then returns
+    detector = ColourDetector(hide={"blue": range(6, 14)})
+    students, stats = VideoAttendanceService.recognize_stream(frames, detector=detector)
+
+    assert stats["tracks"] == 3
+    tracks = {s["roll_no"]: s["tracks"] for s in students}
+    assert tracks == {"red": 1, "blue": 2}
+
+
+def test_stream_urls_limited_to_allowed_hosts():
+    allowed = ["camera-1.school.example"]
+    assert VideoFrameSource.url_allowed("rtsp://camera-1.school.example:554/live", allowed)
+    assert VideoFrameSource.url_allowed("https://CAMERA-1.school.example/feed", allowed)
+    assert not VideoFrameSource.url_allowed("http://169.254.169.254/latest/meta-data", allowed)
+    assert not VideoFrameSource.url_allowed("http://localhost:27017/", allowed)
+    assert not VideoFrameSource.url_allowed("file://camera-1.school.example/etc/passwd", allowed)
+    # No hosts configured: stream URLs are disabled
+    assert not VideoFrameSource.url_allowed("rtsp://camera-1.school.example/live", [])
@@ -0,0 +1,82 @@
+import struct
+import numpy as np
+
+# Binary embedding format, identical to backend/embedding_store.py and stored here as
+# one BSON binary blob per student: a fixed 64-byte little-endian header followed by
+# count x dim float32 values, row-major. The header holds:
+#   magic (4s) b"FEMB", version (H), flags (H), dim (I), count (I), model name (32s)
+# and is zero-padded to 64 bytes so the vectors start on an aligned offset.
+MAGIC = b"FEMB"
+VERSION = 1
+HEADER_FORMAT = "<4sHHII32s"
+HEADER_SIZE = 64
+FLAG_NORMALIZED = 0x1
+
+
+def pack_header(model_name, dim, count, normalized=False):
+    """
+    Builds the fixed-size header for count vectors of the given dimension
+    """
+    flags = FLAG_NORMALIZED if normalized else 0
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, flags, dim, count,
+                         model_name.encode("ascii")[:32])
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def unpack_header(buffer):
+    """
+    Parses and validates a header
+    Returns: dict with model, dim, count and normalized
+    """
+    magic, version, flags, dim, count, model = struct.unpack_from(HEADER_FORMAT, buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not an embedding file (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported embedding format version {version}")
+    return {
+        "model": model.rstrip(b"\0").decode("ascii"),
+        "dim": dim,
+        "count": count,
+        "normalized": bool(flags & FLAG_NORMALIZED)
+    }
+
+
+def pack_embeddings(vectors, model_name="Facenet", normalized=False):
+    """
+    Serialises an N x D matrix into header + float32 bytes
+    """
+    vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype="<f4")
+    return pack_header(model_name, vectors.shape[1], vectors.shape[0], normalized) + vectors.tobytes()
+
+
+def unpack_embeddings(buffer):
+    """
+    Zero-copy view of the vectors in a packed buffer (bytes, bson Binary, mmap, ...)
+    Returns: (header, read-only count x dim float32 array)
+    """
+    header = unpack_header(buffer)
+    vectors = np.frombuffer(buffer, dtype="<f4", count=header["count"] * header["dim"], offset=HEADER_SIZE)
+    return header, vectors.reshape(header["count"], header["dim"])
+
+
+def to_vector_matrix(embedding_data):
+    """
+    Turns DeepFace represent output (or plain vectors) into an N x D float32 matrix
+
+    Args:
+        embedding_data: List of embeddings; each may be a vector, a dict with an
+                        'embedding' key, or a list of such dicts (first face used)
+    """
+    vectors = []
+    for emb in embedding_data:
+        if isinstance(emb, dict):
+            emb = emb.get('embedding')
+        elif isinstance(emb, list) and len(emb) > 0 and isinstance(emb[0], dict):
+            emb = emb[0].get('embedding')
+
+        if emb is not None and len(emb) > 0:
+            vectors.append(np.asarray(emb, dtype=np.float32).ravel())
+
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack(vectors)
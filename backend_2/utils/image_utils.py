@@ -1,13 +1,134 @@
 import cv2
 import numpy as np
 import os
+from config import QUALITY_MAX_SIDE
 
-def ensure_image_quality(image_path, min_size=(64, 64), min_brightness=50):
+# decode_image, load_image, laplacian_variance and prepare_image (with the band
+# constants) are deliberately identical in code to the copy in
+# backend_3/utils/image_utils.py; only the docstrings and the quality checks built on
+# them differ. Each backend is deployed on its own, so keep both in sync.
+def decode_image(data):
+    """
+    Decode an encoded image (JPEG, PNG, ...) straight from memory
+    
+    Args:
+        data: Encoded image bytes, e.g. the body of an uploaded file
+        
+    Returns:
+        BGR uint8 image array, or None if the bytes are not a readable image
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+def load_image(image):
+    """
+    Accept either an already-decoded BGR array or a path on disk
+    
+    Returns:
+        BGR image array, or None if the file could not be read
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    return cv2.imread(image)
+
+# Sampled metrics decide only when clearly away from the threshold; inside these
+# bands the exact full-resolution value is computed, so no decision changes
+BRIGHTNESS_BAND = 1.0  # grey levels; area resizing moves the mean by well under one
+SHARPNESS_BAND = 0.25  # relative; sampled estimates of the upload photos at 1x-4x
+                       # resolution fell within -11% / +3% of the exact value
+
+def laplacian_variance(image, grid=16, patch=48):
+    """
+    Variance of the Laplacian (higher is sharper) of a grayscale or BGR image
+
+    Images larger than the grid of patches are estimated from grid x grid patches
+    spread evenly over the image at full resolution. Blur has to be measured at the
+    camera's own resolution (a downscaled copy always looks sharper), and sampling
+    keeps the cost the same for a 0.3 MP and a 24 MP photo.
+    """
+    def to_gray(region):
+        return cv2.cvtColor(region, cv2.COLOR_BGR2GRAY) if region.ndim == 3 else region
+
+    height, width = image.shape[:2]
+    if height * width <= (grid * patch) ** 2 or min(height, width) < patch + 2:
+        return float(cv2.Laplacian(to_gray(image), cv2.CV_64F).var())
+
+    # 1-pixel margin so every patch's Laplacian sees its real neighbours; only the
+    # patches are converted to grayscale, not the whole photo
+    ys = np.linspace(1, height - patch - 1, grid).astype(int)
+    xs = np.linspace(1, width - patch - 1, grid).astype(int)
+    responses = [
+        cv2.Laplacian(to_gray(image[y - 1:y + patch + 1, x - 1:x + patch + 1]), cv2.CV_64F)[1:-1, 1:-1]
+        for y in ys for x in xs
+    ]
+    return float(np.var(responses))
+
+def prepare_image(img, max_side=QUALITY_MAX_SIDE, brightness_limits=(), sharpness_limits=None):
+    """
+    Decoded image plus everything the upload checks need, computed in one pass
+
+    Detection and brightness use a working copy no larger than max_side, so their
+    cost does not grow with the camera's resolution; sharpness, when asked for, is
+    sampled from the full-resolution image (see laplacian_variance). When an estimate
+    lands within the band of a threshold the caller will apply, the exact
+    full-resolution value is used instead.
+
+    Args:
+        img: Decoded BGR image array
+        max_side: Longest side of the working copy
+        brightness_limits: Brightness thresholds the caller will apply
+        sharpness_limits: Sharpness thresholds the caller will apply; None skips sharpness
+
+    Returns:
+        Dict with image (original), gray (working copy), scale (working / original),
+        width and height (original), brightness and sharpness (None when not asked for)
+    """
+    height, width = img.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    small = img
+    if scale < 1.0:
+        # Area averaging by a whole factor takes OpenCV's fast path; a small exact
+        # resize of that finishes the job at a fraction of a direct resize's cost
+        factor = int(1 / scale)
+        if factor >= 2:
+            small = cv2.resize(img[:height - height % factor, :width - width % factor],
+                               (width // factor, height // factor), interpolation=cv2.INTER_AREA)
+        small = cv2.resize(small, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    brightness = float(np.mean(gray))
+
+    full_gray = gray if scale == 1.0 else None
+    if full_gray is None and any(abs(brightness - limit) < BRIGHTNESS_BAND for limit in brightness_limits):
+        full_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        brightness = float(np.mean(full_gray))
+
+    sharpness = None
+    if sharpness_limits is not None:
+        sharpness = laplacian_variance(full_gray if full_gray is not None else img)
+        if any(abs(sharpness - limit) < SHARPNESS_BAND * limit for limit in sharpness_limits):
+            if full_gray is None:
+                full_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            sharpness = float(cv2.Laplacian(full_gray, cv2.CV_64F).var())
+
+    return {
+        'image': img,
+        'gray': gray,
+        'scale': scale,
+        'width': width,
+        'height': height,
+        'brightness': brightness,
+        'sharpness': sharpness
+    }
+
+def ensure_image_quality(image, min_size=(64, 64), min_brightness=50):
     """
     Check if image meets minimum quality requirements
     
     Args:
-        image_path: Path to the image file
+        image: Decoded BGR image array or path to the image file
         min_size: Minimum dimensions (width, height)
         min_brightness: Minimum average brightness (0-255)
         
@@ -15,7 +136,7 @@ def ensure_image_quality(image_path, min_size=(64, 64), min_brightness=50):
         (meets_requirements, message)
     """
     try:
-        img = cv2.imread(image_path)
+        img = load_image(image)
         if img is None:
             return False, "Failed to read image"
         
@@ -24,9 +145,8 @@ def ensure_image_quality(image_path, min_size=(64, 64), min_brightness=50):
         if width < min_size[0] or height < min_size[1]:
             return False, f"Image too small. Minimum size: {min_size[0]}x{min_size[1]}"
         
-        # Check brightness
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        brightness = np.mean(gray)
+        # Check brightness on the bounded working copy
+        brightness = prepare_image(img, brightness_limits=(min_brightness,))['brightness']
         if brightness < min_brightness:
             return False, f"Image too dark. Brightness: {brightness:.1f}, Minimum: {min_brightness}"
             
@@ -0,0 +1,47 @@
+import threading
+
+# DiskIOMetrics is deliberately identical in code to the copy in
+# backend_3/utils/io_metrics.py; only the docstrings differ. Each backend is deployed on
+# its own, so keep both in sync.
+class DiskIOMetrics:
+    """
+    Counts the disk I/O the in-memory image pipeline no longer does
+
+    Uploads are decoded from the request bytes and face crops are embedded in memory
+    by BatchEmbedder, so neither goes through a temp file any more. Each avoided file is recorded
+    with the bytes it would have written and read back.
+    """
+
+    _lock = threading.Lock()
+    _avoided = {}
+
+    @staticmethod
+    def record(source, written=0, read=0):
+        """
+        Record one temp file that was not written and/or read back
+
+        Args:
+            source: What the file would have held ("group_upload", "face_crop", ...)
+            written: Bytes that would have been written
+            read: Bytes that would have been read back
+        """
+        with DiskIOMetrics._lock:
+            counters = DiskIOMetrics._avoided.setdefault(
+                source, {"files": 0, "bytes_written": 0, "bytes_read": 0}
+            )
+            counters["files"] += 1
+            counters["bytes_written"] += int(written)
+            counters["bytes_read"] += int(read)
+
+    @staticmethod
+    def snapshot():
+        """
+        Disk I/O avoided since the process started, per source and in total
+        """
+        with DiskIOMetrics._lock:
+            by_source = {source: dict(counters) for source, counters in DiskIOMetrics._avoided.items()}
+        return {
+            "files": sum(c["files"] for c in by_source.values()),
+            "bytes": sum(c["bytes_written"] + c["bytes_read"] for c in by_source.values()),
+            "by_source": by_source
+        }
@@ -1,7 +1,11 @@
+from datetime import datetime
 from flask import Flask
 from flask_cors import CORS
 from controllers.face_controller import face_routes
 from config.settings import init_app_config
+from services.model_registry import ModelRegistry
+from services.reference_cache import ReferenceCache
+from utils.io_metrics import DiskIOMetrics
 
 def create_app():
     app = Flask(__name__)
@@ -12,9 +16,24 @@ def create_app():
     # Enable CORS
     CORS(app)
     
+    # Load and warm up the face models once; /health reports when they are ready
+    ModelRegistry.initialize(background=True)
+    
     # Register routes
     app.register_blueprint(face_routes)
     
+    @app.route('/health', methods=['GET'])
+    def health_check():
+        ready = ModelRegistry.is_ready()
+        return {
+            "status": "healthy" if ready else "starting",
+            "ready": ready,
+            "models": ModelRegistry.status(),
+            "disk_io_avoided": DiskIOMetrics.snapshot(),
+            "reference_cache": ReferenceCache.shared().stats(),
+            "timestamp": datetime.now().isoformat()
+        }, 200 if ready else 503
+    
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,111 @@
+"""
+Sequential vs concurrent loading of students' reference images
+
+Serves a folder of student images from a local Cloudinary stub with a random
+per-request latency (50-200 ms by default, roughly a CDN round trip) and loads the
+reference embeddings of every student into an empty cache twice: one student after
+another, as recognition used to, and through ReferenceGallery's pooled fetch and
+embed stages.
+
+With --fetch-only the images are downloaded and decoded but not embedded, which
+isolates network concurrency and needs no face model.
+
+Usage (from backend_3/):
+    python benchmarks/benchmark_reference_fetch.py ../backend/uploads [--students 100] [--fetch-only]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.reference_cache import ReferenceCache
+from services.reference_gallery import ReferenceGallery
+from utils.image_utils import decode_image
+from scripts.cloudinary_stub import CloudinaryStub
+
+
+class FetchOnlyCache(ReferenceCache):
+    """Reference cache that decodes images instead of embedding them"""
+
+    def embed_image(self, url, image_bytes):
+        img = decode_image(image_bytes) if image_bytes else None
+        return None if img is None else [[float(img.shape[0]), float(img.shape[1])]]
+
+
+def make_students(stub, directory, count):
+    """
+    Student documents whose image_urls point at the stub; every student gets its own
+    asset version, so no two students share a cache entry
+    """
+    folders = sorted(d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d)))
+    students = []
+    for i in range(count):
+        folder = folders[i % len(folders)]
+        files = sorted(os.listdir(os.path.join(directory, folder)))
+        students.append({
+            "_id": f"student-{i}",
+            "image_urls": [stub.url_for(os.path.join(folder, name), version=i + 1) for name in files]
+        })
+    return students
+
+
+def run(label, stub, students, cache_class, load):
+    cache_dir = tempfile.mkdtemp(prefix="reference-cache-")
+    try:
+        cache = cache_class(cache_dir, 1 << 34)
+        requests_before = stub.requests
+        start = time.perf_counter()
+        loaded = load(cache, students)
+        seconds = time.perf_counter() - start
+        print(f"{label:<12}{loaded:>10}{stub.requests - requests_before:>10}{seconds:>10.2f}")
+        return seconds
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def load_sequential(cache, students):
+    loaded = 0
+    for student in students:
+        for url in student["image_urls"]:
+            embeddings = cache.embed_image(url, cache.get_image_bytes(url))
+            if embeddings:
+                loaded += 1
+                break
+    return loaded
+
+
+def load_concurrent(cache, students):
+    gallery, _ = ReferenceGallery.build(students, cache=cache)
+    return len(gallery)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="folder with one sub-folder of images per student")
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--latency", type=float, nargs=2, default=[0.05, 0.2], metavar=("MIN", "MAX"))
+    parser.add_argument("--fetch-only", action="store_true", help="decode instead of embedding")
+    args = parser.parse_args()
+
+    stub = CloudinaryStub(args.directory, latency=tuple(args.latency)).start()
+    students = make_students(stub, args.directory, args.students)
+    cache_class = FetchOnlyCache if args.fetch_only else ReferenceCache
+
+    if not args.fetch_only:
+        from services.model_registry import ModelRegistry
+        ModelRegistry.initialize()
+
+    print(f"{len(students)} students, {args.latency[0] * 1000:.0f}-{args.latency[1] * 1000:.0f} ms latency")
+    print(f"{'mode':<12}{'students':>10}{'requests':>10}{'seconds':>10}")
+    sequential = run("sequential", stub, students, cache_class, load_sequential)
+    concurrent = run("concurrent", stub, students, cache_class, load_concurrent)
+    print(f"Speed-up: {sequential / concurrent:.1f}x")
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
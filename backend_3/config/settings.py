@@ -17,6 +17,15 @@ FACE_MODEL = 'Facenet'
 FACE_DETECTOR = 'opencv'
 FACE_DISTANCE_METRIC = 'cosine'
 FACE_DISTANCE_THRESHOLD = 0.5  # Threshold for considering a match
+QUALITY_MAX_SIDE = 1280  # Longest side of the working copy used by upload checks and detection
+
+# Local cache of Cloudinary reference images and their embeddings
+REFERENCE_CACHE_DIR = 'reference_cache'
+REFERENCE_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Least recently used files are evicted above this
+REFERENCE_DOWNLOAD_TIMEOUT = 10  # Seconds per reference image download, in total
+REFERENCE_FETCH_WORKERS = 16  # Reference images downloaded at once (pooled connections)
+REFERENCE_EMBED_WORKERS = 2  # Reference images embedded at once
+REFERENCE_GALLERY_TIMEOUT = 30  # Seconds recognition waits for reference embeddings; stragglers are skipped
 
 def init_app_config(app):
     """Initialize app configuration"""
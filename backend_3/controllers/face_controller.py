@@ -1,9 +1,7 @@
-import os
-import uuid
 from flask import Blueprint, request, jsonify
-from werkzeug.utils import secure_filename
 from services.face_service import FaceService
-from config.settings import UPLOAD_FOLDER
+from utils.image_utils import decode_image
+from utils.io_metrics import DiskIOMetrics
 
 face_routes = Blueprint('face_routes', __name__)
 
@@ -12,13 +10,6 @@ def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def save_temp_file(file):
-    """Save uploaded file to temporary location"""
-    filename = secure_filename(f"{uuid.uuid4()}_{file.filename}")
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(filepath)
-    return filepath
-
 @face_routes.route('/api/upload-face', methods=['POST'])
 def upload_face():
     """Handle face image upload for student registration"""
@@ -45,19 +36,15 @@ def upload_face():
     if not allowed_file(image.filename):
         return jsonify({"success": False, "message": "Invalid file type"}), 400
     
-    # Save file temporarily
-    image_path = save_temp_file(image)
+    # Read the upload once; it is decoded in memory, never saved to a temp file
+    image_bytes = image.read()
     
     try:
         # Process the image
         success, message, student_id = FaceService.process_student_image(
-            image_path, name, roll_no, student_class, image_index
+            image_bytes, name, roll_no, student_class, image_index
         )
         
-        # Clean up temporary file
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        
         if not success:
             return jsonify({"success": False, "message": message}), 400
             
@@ -74,9 +61,6 @@ def upload_face():
         return jsonify(response_data)
         
     except Exception as e:
-        # Clean up on error
-        if os.path.exists(image_path):
-            os.remove(image_path)
         return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
 
 @face_routes.route('/api/recognize-group', methods=['POST'])
@@ -90,16 +74,16 @@ def recognize_group():
     if not allowed_file(image.filename):
         return jsonify({"success": False, "message": "Invalid file type"}), 400
     
-    # Save file temporarily
-    image_path = save_temp_file(image)
+    # Decode the upload once; quality check, detection and verification share the array
+    image_bytes = image.read()
+    group_image = decode_image(image_bytes)
+    if group_image is None:
+        return jsonify({"success": False, "message": "Failed to read image"}), 400
+    DiskIOMetrics.record("group_upload", written=len(image_bytes), read=2 * len(image_bytes))
     
     try:
         # Process the group image
-        success, message, recognized_students = FaceService.recognize_faces_in_group(image_path)
-        
-        # Clean up temporary file
-        if os.path.exists(image_path):
-            os.remove(image_path)
+        success, message, recognized_students = FaceService.recognize_faces_in_group(group_image)
         
         if not success:
             return jsonify({"success": False, "message": message}), 400
@@ -111,7 +95,4 @@ def recognize_group():
         })
         
     except Exception as e:
-        # Clean up on error
-        if os.path.exists(image_path):
-            os.remove(image_path)
         return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
\ No newline at end of file
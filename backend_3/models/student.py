@@ -13,13 +13,14 @@ class Student:
     """Student model for MongoDB"""
     
     @staticmethod
-    def create(name, roll_no, student_class, image_urls=None):
+    def create(name, roll_no, student_class, image_urls=None, embeddings=None):
         """Create a new student record"""
         student_data = {
             "name": name,
             "roll_no": roll_no,
             "class": student_class,
             "image_urls": image_urls or [],
+            "embeddings": embeddings or [],
             "created_at": ObjectId().generation_time
         }
         
@@ -49,6 +50,26 @@ class Student:
             {"$set": {"image_urls": image_urls}}
         )
     
+    @staticmethod
+    def update_images(student_id, image_urls, embeddings):
+        """Update student's face image URLs together with their embeddings"""
+        return students.update_one(
+            {"_id": ObjectId(student_id)},
+            {"$set": {"image_urls": image_urls, "embeddings": embeddings}}
+        )
+    
+    @staticmethod
+    def update_embeddings(student_id, image_urls, embeddings):
+        """
+        Store embeddings computed for the given image URLs; skipped (returns False)
+        if the student's images changed in the meantime
+        """
+        result = students.update_one(
+            {"_id": ObjectId(student_id), "image_urls": image_urls},
+            {"$set": {"embeddings": embeddings}}
+        )
+        return result.matched_count == 1
+    
     @staticmethod
     def exists(name, roll_no):
         """Check if student exists"""
@@ -0,0 +1,110 @@
+"""
+Compute and store reference embeddings for students enrolled before embeddings
+were saved at upload time (or under a different FACE_MODEL / FACE_DETECTOR)
+
+Safe to run in the background while the server is up, e.g.
+    nohup python scripts/backfill_embeddings.py > backfill.log 2>&1 &
+Only images without a current embedding are processed, so an interrupted run can
+simply be started again. A student whose images change while the backfill is
+working on them is left for the next run.
+
+Usage (from backend_3/):
+    python scripts/backfill_embeddings.py [--force] [--limit N] [--workers 16]
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import REFERENCE_FETCH_WORKERS
+from models.student import Student
+from services.embedding_store import EmbeddingStore
+from services.model_registry import ModelRegistry
+from services.reference_cache import ReferenceCache
+from utils.image_utils import decode_image
+
+
+def fetch_images(cache, student, indices):
+    """Encoded reference images of one student, by image index (None if unavailable)"""
+    images = {}
+    for i in indices:
+        try:
+            images[i] = cache.get_image_bytes(student["image_urls"][i])
+        except Exception as e:
+            print(f"Download error for {student['roll_no']} image {i}: {str(e)}")
+            images[i] = None
+    return images
+
+
+def backfill_student(student, images):
+    """
+    Embed the fetched images and store them on the student
+
+    Returns:
+        (embeddings stored, images that failed)
+    """
+    entries = list(student.get("embeddings") or [])
+    stored = failed = 0
+    for i, image_bytes in images.items():
+        img = decode_image(image_bytes) if image_bytes else None
+        if img is None:
+            failed += 1
+            continue
+        try:
+            entry = EmbeddingStore.encode(student["image_urls"][i], EmbeddingStore.compute(img))
+        except Exception as e:
+            print(f"Embedding error for {student['roll_no']} image {i}: {str(e)}")
+            failed += 1
+            continue
+        entries = EmbeddingStore.with_entry({"embeddings": entries}, i, entry)
+        stored += 1
+
+    if stored and not Student.update_embeddings(str(student["_id"]), student["image_urls"], entries):
+        print(f"Images of {student['roll_no']} changed during the backfill; skipped")
+        return 0, failed
+    return stored, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--force", action="store_true", help="recompute every embedding")
+    parser.add_argument("--limit", type=int, default=None, help="process at most N students")
+    parser.add_argument("--workers", type=int, default=REFERENCE_FETCH_WORKERS, help="concurrent downloads")
+    args = parser.parse_args()
+
+    work = []
+    for student in Student.get_all():
+        if args.force:
+            indices = [i for i, url in enumerate(student.get("image_urls", [])) if url]
+        else:
+            indices = EmbeddingStore.stale_indices(student)
+        if indices:
+            work.append((student, indices))
+    if args.limit is not None:
+        work = work[:args.limit]
+    print(f"{len(work)} students need embeddings")
+    if not work:
+        return
+
+    ModelRegistry.initialize()
+    cache = ReferenceCache.shared()
+    start = time.time()
+    stored = failed = 0
+
+    # Downloads run ahead in a thread pool; embedding stays on this thread
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        fetches = [pool.submit(fetch_images, cache, student, indices) for student, indices in work]
+        for done, ((student, _), fetch) in enumerate(zip(work, fetches), 1):
+            student_stored, student_failed = backfill_student(student, fetch.result())
+            stored += student_stored
+            failed += student_failed
+            print(f"[{done}/{len(work)}] {student['name']} ({student['roll_no']}): {student_stored} stored")
+
+    print(f"Stored {stored} embeddings, {failed} images failed, in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
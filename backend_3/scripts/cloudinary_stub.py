@@ -0,0 +1,116 @@
+"""
+Local HTTP server that stands in for Cloudinary's image delivery
+
+Serves the files of a directory at Cloudinary-style URLs
+(<base>/<cloud>/image/upload/v<version>/<path>) and counts the requests it
+receives, so recognition can be exercised without network access and its
+outbound traffic measured. The version segment is accepted and ignored, as a
+new version of an image is served from the same file.
+
+Usage (from backend_3/):
+    python scripts/cloudinary_stub.py IMAGE_DIR [--port 8765] [--latency 0.0 [MAX]]
+"""
+import os
+import time
+import random
+import argparse
+import threading
+from urllib.parse import quote, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CLOUD_NAME = "stub"
+
+
+class CloudinaryStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, directory, port=0, latency=0.0):
+        """
+        Args:
+            directory: Folder whose files are served
+            port: Port to listen on (0 picks a free one)
+            latency: Seconds to wait before answering each request, or a
+                     (min, max) range to draw each wait from
+        """
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.directory = directory
+        self.latency = latency
+        self.requests = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/{CLOUD_NAME}/image/upload"
+
+    def url_for(self, relative_path, version=1):
+        """secure_url-style URL of a file in the served directory"""
+        return f"{self.base_url}/v{version}/{quote(relative_path.replace(os.sep, '/'))}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="cloudinary-stub", daemon=True).start()
+        return self
+
+    def delay(self):
+        """Seconds to wait before answering the next request"""
+        if isinstance(self.latency, (tuple, list)):
+            return random.uniform(*self.latency)
+        return self.latency
+
+    def count_request(self):
+        with self._count_lock:
+            self.requests += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        delay = server.delay()
+        if delay:
+            time.sleep(delay)
+
+        prefix = f"/{CLOUD_NAME}/image/upload/"
+        parts = self.path[len(prefix):].split("/", 1) if self.path.startswith(prefix) else []
+        if len(parts) != 2 or not parts[0].startswith("v"):
+            self.send_error(404)
+            return
+
+        path = os.path.realpath(os.path.join(server.directory, unquote(parts[1].split("?", 1)[0])))
+        if not path.startswith(os.path.realpath(server.directory) + os.sep) or not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        with open(path, "rb") as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg" if path.lower().endswith((".jpg", ".jpeg")) else "image/png")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.0],
+                        help="seconds added to every response, or MIN MAX for a random delay")
+    args = parser.parse_args()
+
+    latency = tuple(args.latency[:2]) if len(args.latency) > 1 else args.latency[0]
+    stub = CloudinaryStub(args.directory, args.port, latency)
+    for folder, _, files in os.walk(args.directory):
+        for file_name in sorted(files):
+            print(stub.url_for(os.path.relpath(os.path.join(folder, file_name), args.directory)))
+    print(f"Serving {args.directory} at {stub.base_url}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
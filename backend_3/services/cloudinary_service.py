@@ -19,7 +19,7 @@ class CloudinaryService:
         Upload an image to Cloudinary
         
         Args:
-            image_path: Local path to image
+            image_path: Local path to image, or a file-like object holding the encoded bytes
             folder: Cloudinary folder to store image
             public_id: Custom public ID for the image
             
@@ -0,0 +1,113 @@
+from datetime import datetime
+import numpy as np
+from bson.binary import Binary
+import deepface
+from deepface import DeepFace
+from config.settings import FACE_MODEL, FACE_DETECTOR
+
+
+class EmbeddingStore:
+    """
+    Reference embeddings stored on the student document
+
+    Each enrolled image gets an entry in the student's `embeddings` list, at the same
+    index as its URL in `image_urls`:
+
+        {"url": ..., "vector": <float32 bytes>, "dim": 128, "model": "Facenet",
+         "detector": "opencv", "deepface_version": "0.0.102", "created_at": ...}
+
+    A 128-d FaceNet vector takes 512 bytes as float32 binary, a third of a BSON array
+    of doubles. An entry is only used while its URL, model and detector match the
+    current image and settings, so changing FACE_MODEL or re-uploading an image makes
+    it stale rather than wrong.
+    """
+
+    @staticmethod
+    def compute(image):
+        """
+        Embedding of the enrolled face in a reference image
+
+        Computed the way DeepFace.verify embeds an image. Enrolment has already
+        checked for exactly one face; if the detector still finds several, the largest
+        is the student.
+
+        Args:
+            image: Decoded BGR image array
+
+        Returns:
+            numpy.ndarray: float32 vector
+        """
+        representations = DeepFace.represent(
+            img_path=image,
+            model_name=FACE_MODEL,
+            detector_backend=FACE_DETECTOR,
+            enforce_detection=False
+        )
+        largest = max(representations, key=lambda rep: rep["facial_area"]["w"] * rep["facial_area"]["h"])
+        return np.asarray(largest["embedding"], dtype=np.float32)
+
+    @staticmethod
+    def encode(url, vector):
+        """
+        Document entry for the embedding of the image at url
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        return {
+            "url": url,
+            "vector": Binary(vector.tobytes()),
+            "dim": int(vector.size),
+            "model": FACE_MODEL,
+            "detector": FACE_DETECTOR,
+            "deepface_version": deepface.__version__,
+            "created_at": datetime.utcnow()
+        }
+
+    @staticmethod
+    def decode(entry):
+        return np.frombuffer(entry["vector"], dtype=np.float32)
+
+    @staticmethod
+    def is_current(entry, url):
+        """
+        Whether a stored entry is the embedding of url under the current settings
+        """
+        return (bool(entry) and entry.get("url") == url and
+                entry.get("model") == FACE_MODEL and entry.get("detector") == FACE_DETECTOR)
+
+    @staticmethod
+    def stale_indices(student):
+        """
+        Indices of the student's images that have no current stored embedding
+        """
+        image_urls = student.get("image_urls", [])
+        entries = student.get("embeddings") or []
+        return [i for i, url in enumerate(image_urls)
+                if url and not EmbeddingStore.is_current(entries[i] if i < len(entries) else None, url)]
+
+    @staticmethod
+    def reference_vectors(student):
+        """
+        Stored embedding of the student's first reference image, the one image
+        recognition compares against (ReferenceGallery also starts from it for
+        students without stored embeddings)
+
+        Returns:
+            List with that one float32 vector, or empty if the first image has no
+            current stored embedding
+        """
+        image_urls = student.get("image_urls", [])
+        entries = student.get("embeddings") or []
+        if not image_urls or not entries or not EmbeddingStore.is_current(entries[0], image_urls[0]):
+            return []
+        return [EmbeddingStore.decode(entries[0])]
+
+    @staticmethod
+    def with_entry(student, image_index, entry):
+        """
+        The student's embeddings list with entry placed at image_index (padded with None)
+        """
+        entries = list(student.get("embeddings") or []) if student else []
+        while len(entries) <= image_index:
+            entries.append(None)
+        entries[image_index] = entry
+        return entries
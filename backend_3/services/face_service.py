@@ -1,12 +1,16 @@
-import os
+import io
 import cv2
 import numpy as np
-import requests
-import uuid
 from deepface import DeepFace
 from models.student import Student
 from services.cloudinary_service import CloudinaryService
-from utils.image_utils import check_image_quality
+from services.embedding_store import EmbeddingStore
+from services.model_registry import ModelRegistry
+from services.reference_cache import ReferenceCache
+from services.reference_gallery import ReferenceGallery
+from utils.image_utils import (check_image_quality, check_prepared_quality, decode_image, load_image,
+                               prepare_quality_metrics)
+from utils.io_metrics import DiskIOMetrics
 from config.settings import (
     FACE_MODEL, 
     FACE_DETECTOR, 
@@ -17,32 +21,35 @@ from config.settings import (
 class FaceService:
     """Service for face detection and recognition operations"""
     
+    _verification_threshold = None
+    
     @staticmethod
-    def detect_face(image_path):
+    def detect_face(image):
         """
         Detects if there's exactly one face in the image with good conditions
         
         Args:
-            image_path: Path to image file
+            image: Decoded BGR image array (or path to image file)
             
         Returns:
             tuple: (success, message)
         """
         try:
+            # Read once; the quality check and the detector share the same array
+            img = load_image(image)
+            if img is None:
+                return False, "Failed to read image"
+            
+            # One pass: bounded working copy plus brightness, blur and size metrics
+            prepared = prepare_quality_metrics(img)
+            
             # Check image quality first (brightness, blur, etc.)
-            quality_check, quality_message = check_image_quality(image_path)
+            quality_check, quality_message = check_prepared_quality(prepared)
             if not quality_check:
                 return False, quality_message
             
-            # Use haar cascade for quick face detection
-            img = cv2.imread(image_path)
-            if img is None:
-                return False, "Failed to read image"
-                
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+            # Use the shared, pre-loaded haar cascade for quick face detection
+            faces = ModelRegistry.detect_faces_prepared(prepared, 1.3, 5)
             
             if len(faces) == 0:
                 return False, "No face detected"
@@ -54,12 +61,12 @@ class FaceService:
             return False, f"Error: {str(e)}"
     
     @staticmethod
-    def process_student_image(image_path, name, roll_no, student_class, image_index):
+    def process_student_image(image_bytes, name, roll_no, student_class, image_index):
         """
         Process and store student face image
         
         Args:
-            image_path: Path to uploaded image
+            image_bytes: Encoded bytes of the uploaded image
             name: Student name
             roll_no: Student roll number
             student_class: Student class
@@ -68,8 +75,15 @@ class FaceService:
         Returns:
             tuple: (success, message, student_id)
         """
+        # Decode once; the checks run on the array and Cloudinary gets the original bytes
+        img = decode_image(image_bytes)
+        if img is None:
+            return False, "Failed to read image", None
+        # The temp file used to be read back by the quality check, the detector and the upload
+        DiskIOMetrics.record("student_upload", written=len(image_bytes), read=3 * len(image_bytes))
+        
         # Check if face is valid
-        is_valid, message = FaceService.detect_face(image_path)
+        is_valid, message = FaceService.detect_face(img)
         if not is_valid:
             return False, message, None
         
@@ -78,7 +92,7 @@ class FaceService:
         public_id = f"{student_folder}/image_{image_index}"
         
         upload_result = CloudinaryService.upload_image(
-            image_path=image_path,
+            image_path=io.BytesIO(image_bytes),
             folder=student_folder,
             public_id=f"image_{image_index}"
         )
@@ -86,6 +100,21 @@ class FaceService:
         if not upload_result:
             return False, "Failed to upload image", None
         
+        # Seed the reference cache so the backfill never has to download this image
+        try:
+            ReferenceCache.shared().put_image(upload_result["secure_url"], image_bytes)
+        except OSError as e:
+            print(f"Reference cache error: {str(e)}")
+        
+        # Compute the reference embedding now, so recognition only has to look it up
+        secure_url = upload_result["secure_url"]
+        try:
+            entry = EmbeddingStore.encode(secure_url, EmbeddingStore.compute(img))
+        except Exception as e:
+            # Enrolment still succeeds; the backfill script fills the gap later
+            print(f"Embedding error: {str(e)}")
+            entry = None
+        
         # Get or create student record
         student = Student.get_by_roll_no(roll_no)
         
@@ -98,121 +127,149 @@ class FaceService:
             while len(image_urls) <= image_index:
                 image_urls.append(None)
                 
-            image_urls[image_index] = upload_result["secure_url"]
-            Student.update_image_urls(student_id, image_urls)
+            image_urls[image_index] = secure_url
+            Student.update_images(student_id, image_urls, EmbeddingStore.with_entry(student, image_index, entry))
         else:
             # Create new student with first image
             image_urls = [None] * 5  # Create array with 5 None elements
-            image_urls[image_index] = upload_result["secure_url"]
-            student_id = Student.create(name, roll_no, student_class, image_urls)
+            image_urls[image_index] = secure_url
+            embeddings = [None] * 5
+            embeddings[image_index] = entry
+            student_id = Student.create(name, roll_no, student_class, image_urls, embeddings)
         
         return True, f"Image {image_index+1} processed successfully", student_id
     
     @staticmethod
-    def recognize_faces_in_group(group_image_path):
+    def verification_threshold(sample_embedding):
+        """
+        Distance threshold DeepFace.verify applies for the configured model and metric
+        (DeepFace's pre-tuned value), looked up once through verify itself
+        
+        Args:
+            sample_embedding: Any embedding from the configured model
+            
+        Returns:
+            float: Threshold
+        """
+        if FaceService._verification_threshold is None:
+            embedding = [float(v) for v in sample_embedding]
+            result = DeepFace.verify(
+                img1_path=embedding,
+                img2_path=embedding,
+                model_name=FACE_MODEL,
+                distance_metric=FACE_DISTANCE_METRIC
+            )
+            FaceService._verification_threshold = float(result["threshold"])
+        return FaceService._verification_threshold
+    
+    @staticmethod
+    def embedding_distances(face_embeddings, reference_embeddings, metric=FACE_DISTANCE_METRIC):
+        """
+        Distances between every face and every reference embedding, computed as
+        DeepFace.verify computes them
+        
+        Args:
+            face_embeddings: F x D array
+            reference_embeddings: R x D array
+            metric: cosine, euclidean or euclidean_l2
+            
+        Returns:
+            numpy.ndarray: F x R distances
+        """
+        faces = np.asarray(face_embeddings, dtype=np.float64)
+        references = np.asarray(reference_embeddings, dtype=np.float64)
+        if metric == "cosine":
+            norms = np.linalg.norm(faces, axis=1)[:, None] * np.linalg.norm(references, axis=1)[None, :]
+            return 1.0 - (faces @ references.T) / norms
+        if metric == "euclidean_l2":
+            faces = faces / np.linalg.norm(faces, axis=1, keepdims=True)
+            references = references / np.linalg.norm(references, axis=1, keepdims=True)
+        elif metric != "euclidean":
+            raise ValueError(f"Unsupported distance metric: {metric}")
+        return np.linalg.norm(faces[:, None, :] - references[None, :, :], axis=2)
+    
+    @staticmethod
+    def recognize_faces_in_group(group_image):
         """
         Recognize students in a group photo
         
         Args:
-            group_image_path: Path to group image
+            group_image: Decoded BGR image array (or path to group image)
             
         Returns:
             tuple: (success, message, recognized_students)
         """
         try:
+            group_image = load_image(group_image)
+            if group_image is None:
+                return False, "Failed to read image", []
+            
             # Check image quality first
-            quality_check, quality_message = check_image_quality(group_image_path)
+            quality_check, quality_message = check_image_quality(group_image)
             if not quality_check:
                 return False, quality_message, []
             
-            # Extract faces from the group photo
-            detected_faces = DeepFace.extract_faces(
-                img_path=group_image_path,
-                enforce_detection=True,
-                detector_backend=FACE_DETECTOR
+            # Detect and embed every face in the group photo once, instead of once
+            # per student inside DeepFace.verify
+            representations = DeepFace.represent(
+                img_path=group_image,
+                model_name=FACE_MODEL,
+                detector_backend=FACE_DETECTOR,
+                enforce_detection=True
             )
             
-            if not detected_faces or len(detected_faces) == 0:
+            if not representations or len(representations) == 0:
                 return False, "No faces detected in the group photo", []
-                
+            
+            detected_faces = representations
             print(f"Detected {len(detected_faces)} faces in the group photo")
+            face_embeddings = np.array([rep["embedding"] for rep in representations], dtype=np.float64)
             
             # Get all students from database
             all_students = Student.get_all()
             recognized_students = []
             
-            # For each student in the database
+            # Each student is compared against their first reference image only: its
+            # embedding stored at enrolment, or for students enrolled before that
+            # (until the backfill reaches them) the reference image cache
+            references = {}
+            missing = []
             for student in all_students:
                 # Skip students with incomplete image data
                 image_urls = student.get("image_urls", [])
-                if not image_urls or len(image_urls) == 0 or None in image_urls:
-                    continue
-                    
-                student_id = str(student["_id"])
-                student_name = student["name"]
-                
-                # Create a temp folder for this verification
-                temp_student_folder = os.path.join("temp_uploads", f"temp_{student_id}")
-                os.makedirs(temp_student_folder, exist_ok=True)
-                
-                # Download and save at least one reference image
-                reference_img_path = None
-                
-
-                # Inside your loop over image_urls
-                for i, url in enumerate(image_urls):
-                    if url:
-                        try:
-                            response = requests.get(url, stream=True)
-                            if response.status_code == 200:
-                                temp_img_path = os.path.join(temp_student_folder, f"ref_{i}.jpg")
-                                with open(temp_img_path, 'wb') as out_file:
-                                    out_file.write(response.content)
-                                reference_img_path = temp_img_path
-                                break  # Stop after first valid image
-                        except Exception as e:
-                            print(f"Error downloading reference image: {str(e)}")
-
-                
-                # If we couldn't get a reference image, skip this student
-                if not reference_img_path:
+                if not image_urls or None in image_urls:
                     continue
-                
-                # Try to verify student against any of the detected faces
-                student_found = False
-                try:
-                    # For efficiency, we first check if any of the detected faces matches this student
-                    # Instead of creating multiple temp files, we could convert the faces to a format
-                    # that DeepFace.verify can accept directly in memory
-                    verification = DeepFace.verify(
-                        img1_path=group_image_path,
-                        img2_path=reference_img_path,
-                        model_name=FACE_MODEL,
-                        distance_metric=FACE_DISTANCE_METRIC,
-                        enforce_detection=False  # Already detected
-                    )
-                    
-                    if verification.get('verified', False):
-                        student_found = True
-                except Exception as e:
-                    print(f"Verification error for {student_name}: {str(e)}")
-                
-                # If student found, add to recognized list if not already there
-                if student_found:
+                vectors = EmbeddingStore.reference_vectors(student)
+                if vectors:
+                    references[str(student["_id"])] = vectors
+                else:
+                    missing.append(student)
+            if missing:
+                gallery, gallery_stats = ReferenceGallery.build(missing)
+                print(f"{len(missing)} students without stored embeddings, reference gallery: {gallery_stats}")
+                references.update(gallery)
+            if not references:
+                return True, "Successfully recognized 0 students", []
+            
+            # One distance matrix between every face and every reference embedding
+            owners = [student_id for student_id, vectors in references.items() for _ in vectors]
+            reference_matrix = np.array([v for vectors in references.values() for v in vectors], dtype=np.float64)
+            distances = FaceService.embedding_distances(face_embeddings, reference_matrix)
+            threshold = FaceService.verification_threshold(face_embeddings[0])
+            
+            # Same decision as DeepFace.verify(group photo, reference image): the
+            # closest face/reference pair is within verify's threshold
+            closest = distances.min(axis=0)
+            matched_ids = {owner for owner, distance in zip(owners, closest) if distance <= threshold}
+            
+            for student in all_students:
+                if str(student["_id"]) in matched_ids:
                     if not any(s.get('roll_no') == student['roll_no'] for s in recognized_students):
                         recognized_students.append({
                             'name': student['name'],
                             'roll_no': student['roll_no'],
                             'class': student['class']
                         })
-                
-                # Clean up temp files
-                try:
-                    if os.path.exists(temp_student_folder):
-                        import shutil
-                        shutil.rmtree(temp_student_folder)
-                except Exception as e:
-                    print(f"Error cleaning up temp files: {str(e)}")
             
             # Check if number of recognized students exceeds number of detected faces
             if len(recognized_students) > len(detected_faces):
@@ -0,0 +1,148 @@
+import threading
+import time
+import cv2
+import numpy as np
+from deepface import DeepFace
+from config.settings import FACE_MODEL, FACE_DETECTOR
+
+
+class ModelRegistry:
+    """
+    Loads the face models once per process and hands the shared instances to services
+
+    DeepFace keeps models it has built in its own cache, so building FaceNet here and
+    running one warm-up inference means no request pays the model-load cost. The Haar
+    cascade is parsed from XML once instead of on every detect_face call.
+    """
+
+    _lock = threading.Lock()
+    _cascade_lock = threading.Lock()
+    _face_cascade = None
+    _facenet = None
+    _state = "not_started"  # not_started -> loading -> ready | failed
+    _error = None
+    _timings = {}
+
+    @staticmethod
+    def initialize(background=False):
+        """
+        Load and warm up every model
+
+        Args:
+            background: Run in a daemon thread so the app can start serving /health at once
+        """
+        with ModelRegistry._lock:
+            if ModelRegistry._state in ("loading", "ready"):
+                return
+            ModelRegistry._state = "loading"
+
+        if background:
+            threading.Thread(target=ModelRegistry._load, name="model-warmup", daemon=True).start()
+        else:
+            ModelRegistry._load()
+
+    @staticmethod
+    def _load():
+        try:
+            start = time.time()
+            ModelRegistry._face_cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+            )
+            ModelRegistry._timings['face_cascade'] = round(time.time() - start, 3)
+
+            start = time.time()
+            ModelRegistry._facenet = DeepFace.build_model(FACE_MODEL)
+            ModelRegistry._timings['facenet_load'] = round(time.time() - start, 3)
+
+            # One inference through each path so graph building and detector setup happen now
+            start = time.time()
+            blank = np.zeros((160, 160, 3), dtype=np.uint8)
+            DeepFace.represent(img_path=blank, model_name=FACE_MODEL,
+                               detector_backend="skip", enforce_detection=False)
+            DeepFace.extract_faces(img_path=blank, detector_backend=FACE_DETECTOR, enforce_detection=False)
+            ModelRegistry._timings['warm_up'] = round(time.time() - start, 3)
+
+            ModelRegistry._state = "ready"
+            print(f"Models ready: {ModelRegistry._timings}")
+        except Exception as e:
+            ModelRegistry._state = "failed"
+            ModelRegistry._error = str(e)
+            print(f"Model warm-up failed: {str(e)}")
+
+    @staticmethod
+    def is_ready():
+        return ModelRegistry._state == "ready"
+
+    @staticmethod
+    def status():
+        """
+        Readiness details for the /health endpoint
+        """
+        status = {
+            "state": ModelRegistry._state,
+            "face_model": FACE_MODEL,
+            "face_detector": FACE_DETECTOR,
+            "load_seconds": dict(ModelRegistry._timings)
+        }
+        if ModelRegistry._error:
+            status["error"] = ModelRegistry._error
+        return status
+
+    @staticmethod
+    def get_facenet():
+        """
+        The shared FaceNet model (loaded on first use if initialize() was not called)
+        """
+        if ModelRegistry._facenet is None:
+            ModelRegistry._facenet = DeepFace.build_model(FACE_MODEL)
+        return ModelRegistry._facenet
+
+    @staticmethod
+    def get_face_cascade():
+        """
+        The shared Haar cascade (loaded on first use if initialize() was not called)
+        """
+        if ModelRegistry._face_cascade is None:
+            with ModelRegistry._lock:
+                if ModelRegistry._face_cascade is None:
+                    ModelRegistry._face_cascade = cv2.CascadeClassifier(
+                        cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+                    )
+        return ModelRegistry._face_cascade
+
+    @staticmethod
+    def detect_faces(gray, scale_factor=1.3, min_neighbors=5):
+        """
+        Run the shared cascade on a grayscale image
+
+        A CascadeClassifier instance is not safe to use from several threads at once,
+        so calls are serialised; single-face upload checks take a few milliseconds.
+        """
+        cascade = ModelRegistry.get_face_cascade()
+        with ModelRegistry._cascade_lock:
+            return cascade.detectMultiScale(gray, scale_factor, min_neighbors)
+
+    @staticmethod
+    def detect_faces_prepared(prepared, scale_factor=1.3, min_neighbors=5):
+        """
+        Run the shared cascade on an image from prepare_image
+
+        Detection runs on the bounded working copy, so its cost does not grow with
+        the upload's resolution. Haar counts shift with scale, so only a single face
+        found there is accepted; no face or several are decided again on the full
+        resolution image.
+
+        Returns:
+            (x, y, w, h) boxes in the original image's coordinates
+        """
+        faces = ModelRegistry.detect_faces(prepared['gray'], scale_factor, min_neighbors)
+        if prepared['scale'] == 1.0:
+            return faces
+        if len(faces) != 1:
+            full_gray = cv2.cvtColor(prepared['image'], cv2.COLOR_BGR2GRAY)
+            return ModelRegistry.detect_faces(full_gray, scale_factor, min_neighbors)
+
+        x, y, w, h = np.asarray(faces[0], dtype=np.float64) / prepared['scale']
+        x, y = min(int(round(x)), prepared['width'] - 1), min(int(round(y)), prepared['height'] - 1)
+        w, h = min(int(round(w)), prepared['width'] - x), min(int(round(h)), prepared['height'] - y)
+        return np.array([[x, y, w, h]])
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from deepface import DeepFace
+from utils.image_utils import decode_image
+from utils.io_metrics import DiskIOMetrics
+from config.settings import (
+    FACE_MODEL,
+    FACE_DETECTOR,
+    REFERENCE_CACHE_DIR,
+    REFERENCE_CACHE_MAX_BYTES,
+    REFERENCE_DOWNLOAD_TIMEOUT,
+    REFERENCE_FETCH_WORKERS
+)
+
+
+class ReferenceCache:
+    """
+    Persistent, size-bounded LRU cache of students' reference images and embeddings
+
+    Entries are keyed by the Cloudinary secure_url, which carries the asset version
+    (.../upload/v1712345678/students/...), so re-uploading an image produces a new key
+    and the stale entry simply ages out. Embeddings are additionally keyed by the face
+    model and detector that produced them. Once a student's embedding is cached,
+    recognition needs neither a download nor a FaceNet pass for that student.
+
+    Files live in one directory (<key>.img for image bytes, <key>.<model>.json for
+    embeddings) and survive restarts; the least recently used files are deleted when
+    the directory grows past max_bytes. Embeddings are also kept in memory.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, cache_dir, max_bytes, timeout=REFERENCE_DOWNLOAD_TIMEOUT, connections=REFERENCE_FETCH_WORKERS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+
+        # One pooled session: downloads reuse kept-alive connections to Cloudinary
+        # instead of opening a TLS connection per image
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=connections)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # file name -> size, least recently used first
+        self._embeddings = {}  # embedding file name -> list of embeddings
+        self._size = 0
+        self._stats = {"embedding_hits": 0, "image_hits": 0, "downloads": 0, "evictions": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        # Rebuild the LRU order from file modification times (touched on every hit)
+        entries = []
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._size += size
+
+    @classmethod
+    def shared(cls):
+        """
+        The process-wide cache, configured from settings
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(REFERENCE_CACHE_DIR, REFERENCE_CACHE_MAX_BYTES)
+            return cls._shared
+
+    @staticmethod
+    def url_key(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _embedding_name(url):
+        return f"{ReferenceCache.url_key(url)}.{FACE_MODEL}-{FACE_DETECTOR}.json"
+
+    def _touch(self, name):
+        """Mark a file as most recently used"""
+        with self._lock:
+            if name not in self._files:
+                return False
+            self._files.move_to_end(name)
+        try:
+            os.utime(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+        return True
+
+    def _store(self, name, data):
+        """Write a file into the cache, evicting least recently used files to make room"""
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self._lock:
+            self._size += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+            while self._size > self.max_bytes and len(self._files) > 1:
+                old_name, old_size = self._files.popitem(last=False)
+                self._size -= old_size
+                self._embeddings.pop(old_name, None)
+                self._stats["evictions"] += 1
+                evicted.append(old_name)
+
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.cache_dir, old_name))
+            except OSError:
+                pass
+
+    def put_image(self, url, image_bytes):
+        """
+        Cache the encoded bytes of a reference image, e.g. right after uploading it
+        """
+        self._store(f"{self.url_key(url)}.img", image_bytes)
+
+    def get_image_bytes(self, url):
+        """
+        Encoded reference image, from the cache or downloaded (and then cached)
+
+        Returns:
+            bytes, or None if the image could not be downloaded
+        """
+        name = f"{self.url_key(url)}.img"
+        if self._touch(name):
+            try:
+                with open(os.path.join(self.cache_dir, name), "rb") as f:
+                    data = f.read()
+                with self._lock:
+                    self._stats["image_hits"] += 1
+                return data
+            except OSError:
+                pass  # evicted by another thread in between; download again
+
+        data = self.download(url)
+        if data is not None:
+            self.put_image(url, data)
+        return data
+
+    def download(self, url):
+        """
+        Download an image within self.timeout seconds in total, so a server that
+        trickles bytes cannot hold a request longer than one that does not answer
+
+        Returns:
+            bytes, or None on an error status
+
+        Raises:
+            requests.RequestException, TimeoutError
+        """
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            self._stats["downloads"] += 1
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            if response.status_code != 200:
+                print(f"Reference image download failed ({response.status_code}): {url}")
+                return None
+            chunks = []
+            for chunk in response.iter_content(64 * 1024):
+                chunks.append(chunk)
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Download took longer than {self.timeout}s: {url}")
+        data = b"".join(chunks)
+
+        # Downloads are decoded in memory; this temp file is no longer written
+        DiskIOMetrics.record("reference_image", written=len(data), read=len(data))
+        return data
+
+    def cached_embeddings(self, url):
+        """
+        Embeddings of a reference image if they are cached, else None (never downloads)
+        """
+        name = self._embedding_name(url)
+        with self._lock:
+            embeddings = self._embeddings.get(name)
+        if embeddings is not None:
+            self._touch(name)
+        elif self._touch(name):
+            try:
+                with open(os.path.join(self.cache_dir, name), "r") as f:
+                    embeddings = json.load(f)
+            except (OSError, ValueError):
+                embeddings = None
+
+        if embeddings is not None:
+            with self._lock:
+                self._embeddings[name] = embeddings
+                self._stats["embedding_hits"] += 1
+        return embeddings
+
+    def embed_image(self, url, image_bytes):
+        """
+        Compute and cache the embeddings of a reference image
+
+        Computed the way DeepFace.verify embeds an image, so they can be compared
+        with verify's threshold or passed to it in place of the image.
+
+        Returns:
+            List of embeddings (lists of floats), or None if the bytes are not an image
+        """
+        img = decode_image(image_bytes) if image_bytes else None
+        if img is None:
+            return None
+
+        representations = DeepFace.represent(
+            img_path=img,
+            model_name=FACE_MODEL,
+            detector_backend=FACE_DETECTOR,
+            enforce_detection=False
+        )
+        embeddings = [[float(v) for v in rep["embedding"]] for rep in representations]
+
+        name = self._embedding_name(url)
+        self._store(name, json.dumps(embeddings).encode("utf-8"))
+        with self._lock:
+            if name in self._files:
+                self._embeddings[name] = embeddings
+        return embeddings
+
+    def get_embeddings(self, url):
+        """
+        Embeddings of the faces in a reference image (normally exactly one), from the
+        cache, or downloaded and computed on a miss
+
+        Returns:
+            List of embeddings (lists of floats), or None if the image is unavailable
+        """
+        embeddings = self.cached_embeddings(url)
+        if embeddings is not None:
+            return embeddings
+        return self.embed_image(url, self.get_image_bytes(url))
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                **self._stats,
+                "files": len(self._files),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes
+            }
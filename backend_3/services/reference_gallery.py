@@ -0,0 +1,103 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from services.reference_cache import ReferenceCache
+from config.settings import REFERENCE_FETCH_WORKERS, REFERENCE_EMBED_WORKERS, REFERENCE_GALLERY_TIMEOUT
+
+
+class ReferenceGallery:
+    """
+    Collects the reference embeddings of many students concurrently
+
+    Cached embeddings are read directly. Misses go through a two-stage pipeline:
+    a pool of fetch workers downloads images over the cache's pooled connections,
+    and hands each image to a smaller pool of embedding workers. A fetch worker waits
+    for its image to be embedded before taking the next student, so at most
+    REFERENCE_FETCH_WORKERS images are in memory and downloads cannot run ahead of
+    embedding (backpressure). Every download has its own time limit, and the whole
+    build has a deadline after which unfinished students are skipped; they keep
+    running in the background and are cached for the next request.
+    """
+
+    _fetch_pool = None
+    _embed_pool = None
+    _pool_lock = threading.Lock()
+
+    @staticmethod
+    def get_pools():
+        with ReferenceGallery._pool_lock:
+            if ReferenceGallery._fetch_pool is None:
+                ReferenceGallery._fetch_pool = ThreadPoolExecutor(
+                    max_workers=REFERENCE_FETCH_WORKERS, thread_name_prefix="reference-fetch"
+                )
+                ReferenceGallery._embed_pool = ThreadPoolExecutor(
+                    max_workers=REFERENCE_EMBED_WORKERS, thread_name_prefix="reference-embed"
+                )
+            return ReferenceGallery._fetch_pool, ReferenceGallery._embed_pool
+
+    @staticmethod
+    def _load_student(cache, url, embed_pool):
+        """
+        Fetch stage for one student: the reference image is downloaded, then embedded
+        on the embedding pool
+        """
+        try:
+            image_bytes = cache.get_image_bytes(url)
+            if image_bytes is None:
+                return None
+            return embed_pool.submit(cache.embed_image, url, image_bytes).result() or None
+        except Exception as e:
+            print(f"Error loading reference image: {str(e)}")
+            return None
+
+    @staticmethod
+    def build(students, timeout=REFERENCE_GALLERY_TIMEOUT, cache=None):
+        """
+        Reference embeddings for every student with a complete set of images
+
+        Args:
+            students: Student documents (with image_urls)
+            timeout: Seconds to wait for students whose embeddings are not cached
+            cache: ReferenceCache to use (the shared one by default)
+
+        Returns:
+            (dict of student ID -> list of embeddings, stats dict)
+        """
+        cache = cache or ReferenceCache.shared()
+        fetch_pool, embed_pool = ReferenceGallery.get_pools()
+        start = time.monotonic()
+
+        gallery = {}
+        pending = {}
+        for student in students:
+            # Skip students with incomplete image data
+            image_urls = student.get("image_urls", [])
+            if not image_urls or None in image_urls:
+                continue
+            student_id = str(student["_id"])
+
+            # Students are matched against their first reference image only, as with
+            # the embeddings stored on the student (EmbeddingStore.reference_vectors)
+            cached = cache.cached_embeddings(image_urls[0])
+            if cached:
+                gallery[student_id] = cached
+            else:
+                pending[fetch_pool.submit(ReferenceGallery._load_student, cache, image_urls[0], embed_pool)] = student_id
+
+        done, not_done = wait(pending, timeout=timeout) if pending else (set(), set())
+        for future in done:
+            embeddings = future.result()
+            if embeddings:
+                gallery[pending[future]] = embeddings
+
+        if not_done:
+            print(f"Skipped {len(not_done)} students whose reference images took longer than {timeout}s")
+
+        stats = {
+            "cached": len(gallery) - sum(1 for f in done if f.result()),
+            "loaded": sum(1 for f in done if f.result()),
+            "failed": sum(1 for f in done if not f.result()),
+            "timed_out": len(not_done),
+            "seconds": round(time.monotonic() - start, 3)
+        }
+        return gallery, stats
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cloudinary")
+
+from config.settings import QUALITY_MAX_SIDE
+from services.face_service import FaceService
+from services.model_registry import ModelRegistry
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    """Replaces the Haar cascade; answers are taken in order and every input shape is recorded"""
+    calls = []
+    answers = []
+
+    def detect_faces(gray, scale_factor=1.3, min_neighbors=5):
+        calls.append(gray.shape)
+        return np.array(answers.pop(0)).reshape(-1, 4)
+
+    monkeypatch.setattr(ModelRegistry, "detect_faces", staticmethod(detect_faces))
+    return calls, answers
+
+
+def upload(width, height):
+    # Noise passes the brightness and blur checks
+    return np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def test_single_face_is_accepted_from_working_copy(cascade):
+    calls, answers = cascade
+    answers.append([(100, 50, 200, 200)])
+
+    assert FaceService.detect_face(upload(QUALITY_MAX_SIDE * 3, QUALITY_MAX_SIDE * 2)) == (
+        True, "Face detected successfully"
+    )
+    assert calls == [(QUALITY_MAX_SIDE * 2 // 3, QUALITY_MAX_SIDE)]
+
+
+def test_other_counts_are_decided_at_full_resolution(cascade):
+    calls, answers = cascade
+    answers.extend([[(0, 0, 50, 50), (100, 0, 50, 50)], [(900, 600, 120, 120)]])
+
+    assert FaceService.detect_face(upload(QUALITY_MAX_SIDE * 3, QUALITY_MAX_SIDE * 2))[0]
+    assert calls == [(QUALITY_MAX_SIDE * 2 // 3, QUALITY_MAX_SIDE), (QUALITY_MAX_SIDE * 2, QUALITY_MAX_SIDE * 3)]
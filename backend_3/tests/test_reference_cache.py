@@ -0,0 +1,98 @@
+import os
+import cv2
+import numpy as np
+import pytest
+from cloudinary_stub import CloudinaryStub
+from services import reference_cache
+from services.reference_cache import ReferenceCache
+from services.reference_gallery import ReferenceGallery
+
+
+@pytest.fixture
+def stub(tmp_path):
+    """Cloudinary stand-in serving three small reference images"""
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    for i in range(3):
+        image = np.full((32, 32, 3), 60 * (i + 1), dtype=np.uint8)
+        cv2.imwrite(str(image_dir / f"student{i}.png"), image)
+    server = CloudinaryStub(str(image_dir)).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_facenet(monkeypatch):
+    """One 'face' per image, embedded as its mean colour (no model weights needed)"""
+    calls = []
+
+    def represent(img_path, **kwargs):
+        calls.append(img_path.shape)
+        return [{"embedding": [float(v) for v in img_path.reshape(-1, 3).mean(axis=0)]}]
+
+    monkeypatch.setattr(reference_cache.DeepFace, "represent", represent)
+    return calls
+
+
+def students_of(stub):
+    return [{"_id": f"s{i}", "image_urls": [stub.url_for(f"student{i}.png")]} for i in range(3)]
+
+
+def test_second_recognition_makes_no_requests(tmp_path, stub, fake_facenet):
+    cache = ReferenceCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    students = students_of(stub)
+
+    gallery, stats = ReferenceGallery.build(students, cache=cache)
+    assert sorted(gallery) == ["s0", "s1", "s2"]
+    assert stats["loaded"] == 3
+    assert stub.requests == 3
+    assert len(fake_facenet) == 3
+
+    gallery_again, stats = ReferenceGallery.build(students, cache=cache)
+    assert gallery_again == gallery
+    assert stats["cached"] == 3
+    assert stub.requests == 3
+    assert len(fake_facenet) == 3
+
+    # The cache directory survives a restart
+    restarted = ReferenceCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    gallery_after_restart, _ = ReferenceGallery.build(students, cache=restarted)
+    assert gallery_after_restart == gallery
+    assert stub.requests == 3
+
+
+def test_least_recently_used_file_is_evicted(tmp_path, stub):
+    urls = [stub.url_for(f"student{i}.png") for i in range(3)]
+    sizes = [os.path.getsize(os.path.join(stub.directory, f"student{i}.png")) for i in range(3)]
+    # Room for two of the images, not three
+    cache = ReferenceCache(str(tmp_path / "cache"), max_bytes=sum(sizes) - 1)
+
+    cache.get_image_bytes(urls[0])
+    cache.get_image_bytes(urls[1])
+    # Reading the first image again makes the second the least recently used
+    cache.get_image_bytes(urls[0])
+    assert stub.requests == 2
+
+    cache.get_image_bytes(urls[2])
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["files"] == 2
+    assert stats["bytes"] <= cache.max_bytes
+    assert not os.path.exists(os.path.join(cache.cache_dir, f"{cache.url_key(urls[1])}.img"))
+
+    cache.get_image_bytes(urls[0])
+    assert stub.requests == 3
+    cache.get_image_bytes(urls[1])
+    assert stub.requests == 4
+
+
+def test_student_is_matched_against_first_reference_image(tmp_path, stub, fake_facenet):
+    cache = ReferenceCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    first, second = stub.url_for("student0.png"), stub.url_for("student1.png")
+    # Only the second image is cached; it must not stand in for the first
+    cache.embed_image(second, cache.get_image_bytes(second))
+
+    gallery, _ = ReferenceGallery.build([{"_id": "s0", "image_urls": [first, second]}], cache=cache)
+    assert gallery["s0"] == cache.cached_embeddings(first)
+    assert gallery["s0"] != cache.cached_embeddings(second)
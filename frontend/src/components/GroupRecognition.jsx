@@ -2,11 +2,37 @@
 import { useState, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 
+const API_URL = 'http://localhost:5000';
+
+// Splits a Server-Sent Events buffer into complete { event, data } frames and
+// returns the trailing partial frame so it can be completed by the next chunk
+const parseSseFrames = (buffer) => {
+  const frames = buffer.split('\n\n');
+  const rest = frames.pop();
+  const events = frames
+    .map((frame) => {
+      let event = 'message';
+      const data = [];
+      frame.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+      });
+      return data.length ? { event, data: JSON.parse(data.join('\n')) } : null;
+    })
+    .filter(Boolean);
+  return { events, rest };
+};
+
 const GroupRecognition = ({ onRecognitionComplete, navigateTo }) => {
   const navigate = useNavigate();
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [selectedImage, setSelectedImage] = useState(null);
+  const [facesDetected, setFacesDetected] = useState(null);
+  const [facesEmbedded, setFacesEmbedded] = useState(0);
+  const [facesResolved, setFacesResolved] = useState(0);
+  const [nearestMatches, setNearestMatches] = useState([]);
+  const [liveMatches, setLiveMatches] = useState([]);
   const fileInputRef = useRef(null);
 
   const handleImageSelect = (e) => {
@@ -24,24 +50,75 @@ const GroupRecognition = ({ onRecognitionComplete, navigateTo }) => {
     }
     
     setLoading(true);
+    setError('');
+    setFacesDetected(null);
+    setFacesEmbedded(0);
+    setFacesResolved(0);
+    setNearestMatches([]);
+    setLiveMatches([]);
     
     const formData = new FormData();
     formData.append('image', selectedImage);
     
     try {
-      const response = await fetch('http://localhost:5000/api/recognize-group', {
+      // Stream results as they are resolved; backends without the streaming
+      // endpoint answer 404 and we fall back to the single JSON response
+      const response = await fetch(`${API_URL}/api/recognize-group/stream`, {
         method: 'POST',
         body: formData,
       });
       
-      const data = await response.json();
+      if (response.status === 404) {
+        await recognizeWithoutStreaming(formData);
+        return;
+      }
       
-      if (data.success) {
-        onRecognitionComplete(data.recognized_students || []);
-        navigate(navigateTo);
-      } else {
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
         setError(data.message || 'Recognition failed');
+        return;
+      }
+      
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        const { events, rest } = parseSseFrames(buffer + decoder.decode(value, { stream: true }));
+        buffer = rest;
+        
+        for (const { event, data } of events) {
+          if (event === 'faces') {
+            setFacesDetected(data.faces.length);
+          } else if (event === 'progress') {
+            // Each face's nearest student before faces compete for students;
+            // replaced by the match events once every face is embedded. Students
+            // whose names are not known yet arrive without display fields
+            setFacesEmbedded(data.embedded);
+            setNearestMatches((matches) => [
+              ...matches,
+              ...data.nearest.filter(({ student }) => student).map(({ student }) => student),
+            ]);
+          } else if (event === 'match') {
+            setFacesResolved((count) => count + 1);
+            setLiveMatches((matches) => [...matches, data.student]);
+          } else if (event === 'no_match') {
+            setFacesResolved((count) => count + 1);
+          } else if (event === 'done') {
+            onRecognitionComplete(data.recognized_students || []);
+            navigate(navigateTo);
+            return;
+          } else if (event === 'error') {
+            setError(data.message || 'Recognition failed');
+            return;
+          }
+        }
       }
+      
+      setError('Recognition ended unexpectedly. Please try again.');
     } catch (err) {
       setError('Server error. Please try again.');
       console.error(err);
@@ -50,6 +127,22 @@ const GroupRecognition = ({ onRecognitionComplete, navigateTo }) => {
     }
   };
 
+  const recognizeWithoutStreaming = async (formData) => {
+    const response = await fetch(`${API_URL}/api/recognize-group`, {
+      method: 'POST',
+      body: formData,
+    });
+    
+    const data = await response.json();
+    
+    if (data.success) {
+      onRecognitionComplete(data.recognized_students || []);
+      navigate(navigateTo);
+    } else {
+      setError(data.message || 'Recognition failed');
+    }
+  };
+
   const triggerFileInput = () => {
     fileInputRef.current.click();
   };
@@ -92,6 +185,40 @@ const GroupRecognition = ({ onRecognitionComplete, navigateTo }) => {
         {loading ? 'Processing...' : 'Recognize Faces'}
       </button>
       
+      {loading && facesDetected !== null && (
+        <div className="mb-4 p-4 bg-blue-50 rounded">
+          <div className="font-medium mb-2">
+            {facesDetected} {facesDetected === 1 ? 'face' : 'faces'} detected, {facesEmbedded} embedded, {facesResolved} checked
+          </div>
+          {liveMatches.length === 0 && nearestMatches.length > 0 && (
+            <ul className="space-y-1 text-gray-600">
+              {nearestMatches.map((student, i) => (
+                <li key={`${student.roll_no}-${i}`} className="flex justify-between">
+                  <span>
+                    {student.name} ({student.roll_no})
+                    <span className="ml-2 text-yellow-600">likely</span>
+                  </span>
+                  <span>{student.confidence}%</span>
+                </li>
+              ))}
+            </ul>
+          )}
+          {liveMatches.length > 0 && (
+            <ul className="space-y-1">
+              {liveMatches.map((student) => (
+                <li key={student.roll_no} className="flex justify-between">
+                  <span>
+                    {student.name} ({student.roll_no})
+                    {student.tentative && <span className="ml-2 text-yellow-600">tentative</span>}
+                  </span>
+                  <span className="text-gray-600">{student.confidence}%</span>
+                </li>
+              ))}
+            </ul>
+          )}
+        </div>
+      )}
+      
       {error && (
         <div className="p-3 bg-red-100 text-red-700 rounded">
           {error}